@@ -0,0 +1,128 @@
+import argparse
+from itertools import islice
+import os
+import tempfile
+import time
+
+import igraph
+import numpy as np
+import pandas as pd
+
+from server.aligners.alignet import Alignet
+from server.aligners.hubalign import Hubalign
+from server.aligners.lgraal import LGraal
+from server.aligners.pinalog import Pinalog
+from server.aligners.spinal import Spinal
+from server.sources.network import IgraphNetwork
+from server.util import iter_csv
+
+
+# the csv-based importers as they were before output formats were declared
+
+def legacy_hubalign(net1, net2, file_path):
+    alignment = [(a,b) for a, b in iter_csv(file_path, delimiter=' ', skipinitialspace=False)
+                       if a != '' and b != '']
+    if net1.igraph.vcount() > net2.igraph.vcount():
+        alignment = [(b,a) for a,b in alignment]
+    return alignment
+
+def legacy_pinalog(net1, net2, file_path):
+    return [(a, b) for a, b, some_score in iter_csv(file_path, delimiter='\t')]
+
+def legacy_spinal(net1, net2, file_path):
+    net1_vs = net1.igraph.vs
+    net2_vs = net2.igraph.vs
+    rows = islice(iter_csv(file_path, delimiter=' '), 2, None)
+    return [(net1_vs[int(p1id)]['name'], net2_vs[int(p2id)]['name']) for p1id, p2id in rows]
+
+def legacy_alignet(net1, net2, file_path):
+    return [(a.strip(), b.strip()) for a, b in iter_csv(file_path, delimiter='\t')]
+
+def legacy_lgraal(net1, net2, file_path):
+    return [(a.strip(), b.strip()) for a, b in iter_csv(file_path, delimiter='\t')
+                                   if a.strip() != '' and b.strip() != '']
+
+def legacy_dataframe(net1, net2, alignment):
+    columns = [f'net1_{net1.name}', f'net2_{net2.name}']
+    alignment_df = pd.DataFrame(alignment, columns=columns)
+    alignment_df.set_index(columns[0], inplace=True)
+    return alignment_df
+
+
+def random_network(name, n_vertices):
+    graph = igraph.Graph(n=n_vertices)
+    graph.vs['name'] = [f'{name}.P{i:07d}' for i in range(n_vertices)]
+    return IgraphNetwork(name, graph, simplify=False)
+
+
+def write_outputs(tmp_dir, net1, net2, rng):
+    n = min(net1.igraph.vcount(), net2.igraph.vcount())
+    p1 = rng.permutation(net1.igraph.vcount())[:n]
+    p2 = rng.permutation(net2.igraph.vcount())[:n]
+
+    names1 = np.array(net1.igraph.vs['name'], dtype=object)[p1]
+    names2 = np.array(net2.igraph.vs['name'], dtype=object)[p2]
+    scores = rng.random_sample(n)
+
+    def write(file_name, lines):
+        with open(os.path.join(tmp_dir, file_name), 'w') as f:
+            f.writelines(lines)
+
+    small1, small2 = (names1, names2) if len(net1.igraph.vs) <= len(net2.igraph.vs) else (names2, names1)
+
+    write(Hubalign.output_format.file_name, (f'{a} {b}\n' for a, b in zip(small1, small2)))
+    write(Pinalog.output_format.file_name, (f'{a}\t{b}\t{s:.4f}\n' for a, b, s in zip(names1, names2, scores)))
+    write(Spinal.output_format.file_name,
+          ['! comment\n', '! comment\n'] + [f'{a}  {b}\n' for a, b in zip(p1, p2)])
+    write(Alignet.output_format.file_name, (f' {a} \t{b}  \n' for a, b in zip(names1, names2)))
+    write(LGraal.output_format.file_name, (f'{a}\t{b}\n' if i % 100 else f'{a}\t \n'
+                                           for i, (a, b) in enumerate(zip(names1, names2))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the csv-based and the vectorized alignment importers')
+    parser.add_argument('--vertices1', type=int, default=200000)
+    parser.add_argument('--vertices2', type=int, default=150000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    net1 = random_network('net1', args.vertices1)
+    net2 = random_network('net2', args.vertices2)
+
+    aligners = [
+        (Hubalign(), legacy_hubalign),
+        (Pinalog(), legacy_pinalog),
+        (Spinal(), legacy_spinal),
+        (Alignet(), legacy_alignet),
+        (LGraal(), legacy_lgraal),
+    ]
+
+    all_same = True
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_outputs(tmp_dir, net1, net2, rng)
+
+        for aligner, legacy in aligners:
+            file_path = os.path.join(tmp_dir, aligner.output_format.file_name)
+
+            start_time = time.perf_counter()
+            expected = legacy_dataframe(net1, net2, legacy(net1, net2, file_path))
+            legacy_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            actual = aligner._import_alignment_dataframe(net1, net2, tmp_dir)
+            vectorized_time = time.perf_counter() - start_time
+
+            same = expected.equals(actual) and expected.index.name == actual.index.name
+            all_same = all_same and same
+
+            print(f'{aligner.name:>9}: {len(actual)} pairs, csv {legacy_time:.2f}s, '
+                  f'vectorized {vectorized_time:.2f}s ({legacy_time / vectorized_time:.1f}x), identical: {same}')
+
+    if not all_same:
+        raise SystemExit('some importers differ from the csv-based ones')
+
+
+if __name__ == '__main__':
+    main()
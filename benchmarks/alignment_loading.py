@@ -0,0 +1,78 @@
+import argparse
+from io import StringIO
+import time
+
+import numpy as np
+import pandas as pd
+
+from server.alignment_columns import AlignmentColumns, decode_names, encode_names, join_alignments
+from server.util import write_tsv_to_string
+
+
+def random_alignment(rng, names1, names2, n_pairs):
+    p1 = rng.permutation(len(names1))[:n_pairs]
+    p2 = rng.permutation(len(names2))[:n_pairs]
+
+    columns = AlignmentColumns(['net1_9606', 'net2_10090'],
+                               names1, p1.astype(np.int32), names2, p2.astype(np.int32))
+    return columns, columns.to_dataframe()
+
+
+def load_tsv(files, labels):
+    # the comparer before the binary format
+    alignments = [pd.read_csv(StringIO(data.decode('utf-8')), sep='\t', index_col=0) for data in files]
+
+    for label, alignment in zip(labels, alignments):
+        alignment.rename(inplace=True, columns=lambda col: f'{col}_{label}')
+
+    return alignments[0].join(alignments[1:], how='outer').rename_axis(index=alignments[0].index.name)
+
+
+def load_npz(files, names_files, labels):
+    # as the comparer does, the network names are decoded once
+    net1_names, net2_names = map(decode_names, names_files)
+    return join_alignments([AlignmentColumns.from_npz(data, net1_names, net2_names) for data in files], labels).table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare loading and joining alignments from TSV and from the binary format')
+    parser.add_argument('--alignments', type=int, default=8)
+    parser.add_argument('--proteins', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    n_pairs = int(args.proteins * 0.8)
+
+    names1 = np.array([f'9606.ENSP{i:011d}' for i in range(args.proteins)], dtype=object)
+    names2 = np.array([f'10090.ENSMUSP{i:011d}' for i in range(args.proteins)], dtype=object)
+
+    alignments = [random_alignment(rng, names1, names2, n_pairs) for _ in range(args.alignments)]
+    labels = [f'aligner_{i}' for i in range(args.alignments)]
+
+    tsv_files = [write_tsv_to_string(alignment.reset_index()).encode('utf-8') for _, alignment in alignments]
+    npz_files = [columns.to_npz() for columns, _ in alignments]
+    names_files = [encode_names(names1), encode_names(names2)]
+
+    print(f'{args.alignments} alignments of {n_pairs} pairs: '
+          f'tsv {sum(map(len, tsv_files)) / 1e6:.1f} MB, '
+          f'npz {sum(map(len, npz_files)) / 1e6:.1f} MB + {sum(map(len, names_files)) / 1e6:.1f} MB of names')
+
+    start_time = time.perf_counter()
+    expected = load_tsv(tsv_files, labels)
+    tsv_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    actual = load_npz(npz_files, names_files, labels)
+    npz_time = time.perf_counter() - start_time
+
+    same = expected.sort_index().equals(actual) and expected.index.name == actual.index.name
+
+    print(f'tsv {tsv_time:.2f}s, npz {npz_time:.2f}s ({tsv_time / npz_time:.1f}x), identical: {same}')
+
+    if not same:
+        raise SystemExit('the binary alignments are joined differently')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import time
+
+import igraph
+import numpy as np
+import pandas as pd
+
+from server.alignment_columns import JoinedAlignments
+from server.comparison import alignment_similarity
+from server.sources.network import IgraphNetwork
+
+
+def random_network(rng, name, n_vertices, n_edges):
+    graph = igraph.Graph(n=n_vertices, edges=rng.randint(0, n_vertices, (n_edges, 2)).tolist())
+    graph.vs['name'] = [f'{name}.P{i:07d}' for i in range(n_vertices)]
+    return IgraphNetwork(name, graph)
+
+
+def random_joined(rng, net1, net2, n_alignments, agreement, unaligned):
+    names1 = np.array(net1.igraph.vs['name'], dtype=object)
+    names2 = np.array(net2.igraph.vs['name'], dtype=object)
+    common = rng.randint(0, len(names2), len(names1))
+
+    columns = dict()
+    for i in range(n_alignments):
+        images = np.where(rng.random_sample(len(names1)) < agreement, common, rng.randint(0, len(names2), len(names1)))
+        column = names2[images]
+        column[rng.random_sample(len(names1)) < unaligned] = np.nan
+        columns[f'net2_{net2.name}_aligner_{i}'] = column
+
+    return pd.DataFrame(columns, index=pd.Index(names1, name=f'net1_{net1.name}'))
+
+
+def reference_similarity(joined, net1, net2):
+    # the same statistics with sets of pairs and edges, one alignment at a time
+    net1_names = net1.igraph.vs['name']
+    net2_edges = {frozenset((net2.igraph.vs[u]['name'], net2.igraph.vs[v]['name'])) for u, v in net2.igraph.get_edgelist()}
+
+    pairs = []
+    conserved = []
+
+    for column in joined.columns:
+        mapping = joined[column].dropna().to_dict()
+        pairs.append(set(mapping.items()))
+        conserved.append({(u, v) for u, v in net1.igraph.get_edgelist()
+                          if net1_names[u] in mapping and net1_names[v] in mapping
+                          and frozenset((mapping[net1_names[u]], mapping[net1_names[v]])) in net2_edges})
+
+    n = len(joined.columns)
+    common_pairs = np.array([[len(pairs[i] & pairs[j]) for j in range(n)] for i in range(n)])
+    common_conserved = np.array([[len(conserved[i] & conserved[j]) for j in range(n)] for i in range(n)])
+
+    return common_pairs, common_conserved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the pairwise alignment similarity matrix')
+    parser.add_argument('--alignments', type=int, default=32)
+    parser.add_argument('--vertices', type=int, default=20000)
+    parser.add_argument('--edges', type=int, default=500000)
+    parser.add_argument('--agreement', type=float, default=0.9)
+    parser.add_argument('--unaligned', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+
+    # correctness on small networks
+    net1 = random_network(rng, 'net1', 300, 1500)
+    net2 = random_network(rng, 'net2', 250, 1200)
+    joined = random_joined(rng, net1, net2, 4, 0.7, 0.1)
+
+    matrices = alignment_similarity(JoinedAlignments.from_table(joined), list(range(4)), net1, net2)
+    common_pairs, common_conserved = reference_similarity(joined, net1, net2)
+
+    same = np.array_equal(matrices['common_pairs'].to_numpy(), common_pairs) \
+        and np.array_equal(matrices['common_conserved_edges'].to_numpy(), common_conserved)
+
+    # time on large ones
+    net1 = random_network(rng, 'net1', args.vertices, args.edges)
+    net2 = random_network(rng, 'net2', args.vertices, args.edges)
+    joined = random_joined(rng, net1, net2, args.alignments, args.agreement, args.unaligned)
+
+    joined = JoinedAlignments.from_table(joined)
+
+    start_time = time.perf_counter()
+    alignment_similarity(joined, list(range(args.alignments)), net1, net2)
+    elapsed = time.perf_counter() - start_time
+
+    print(f'{args.alignments} alignments of {args.vertices} proteins, {net1.igraph.ecount()} net1 edges: '
+          f'{elapsed:.2f}s, same as the set-based reference: {same}')
+
+    if not same:
+        raise SystemExit('the similarity matrices differ from the set-based reference')
+
+
+if __name__ == '__main__':
+    main()
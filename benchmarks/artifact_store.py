@@ -0,0 +1,106 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import igraph
+import numpy as np
+
+from server.aligners.hubalign import Hubalign
+from server.artifacts import ArtifactStore
+from server.sources.bitscore import TricolBitscoreMatrix, structured_tricol
+from server.sources.network import IgraphNetwork
+
+
+def random_network(rng, name, n_vertices, n_edges):
+    graph = igraph.Graph(n=n_vertices, edges=rng.randint(0, n_vertices, size=(n_edges, 2)).tolist())
+    graph.simplify()
+    graph.vs['name'] = [f'{name}.{i:08d}' for i in range(n_vertices)]
+    graph.vs['string_id'] = list(range(n_vertices))
+    return IgraphNetwork(name, graph, simplify=False)
+
+
+def make_inputs(seed, n_vertices, n_edges, n_bitscores):
+    rng = np.random.RandomState(seed)
+    net1 = random_network(rng, 'net1', n_vertices, n_edges)
+    net2 = random_network(rng, 'net2', n_vertices, n_edges)
+
+    tricol = structured_tricol((
+        rng.randint(0, n_vertices, size=n_bitscores).astype(np.int32),
+        rng.randint(0, n_vertices, size=n_bitscores).astype(np.int32),
+        (rng.random_sample(n_bitscores) * 1000).astype(np.float32)))
+
+    bitscores = TricolBitscoreMatrix(tricol, net1=net1, net2=net2, by='string_id').to_sparse()
+    return net1, net2, bitscores
+
+
+def prepare(run_base_path, store, inputs):
+    aligner = Hubalign()
+    aligner.artifacts = store
+
+    run_dir_path = tempfile.mkdtemp(dir=run_base_path)
+    start_time = time.perf_counter()
+    aligner.write_files(run_dir_path, *inputs)
+    return time.perf_counter() - start_time, run_dir_path
+
+
+def read_dir(run_dir_path):
+    contents = {}
+    for file_name in sorted(os.listdir(run_dir_path)):
+        with open(os.path.join(run_dir_path, file_name), 'rb') as f:
+            contents[file_name] = f.read()
+    return contents
+
+
+def concurrent_worker(args):
+    run_base_path, store_path, seed, sizes = args
+    store = ArtifactStore(store_path, max_bytes=2**40)
+    _, run_dir_path = prepare(run_base_path, store, make_inputs(seed, *sizes))
+    return read_dir(run_dir_path), store.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prepare HubAlign inputs with and without the artifact store')
+    parser.add_argument('--vertices', type=int, default=20000)
+    parser.add_argument('--edges', type=int, default=200000)
+    parser.add_argument('--bitscores', type=int, default=1000000)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    sizes = (args.vertices, args.edges, args.bitscores)
+    inputs = make_inputs(0, *sizes)
+
+    with tempfile.TemporaryDirectory() as base_path:
+        store = ArtifactStore(os.path.join(base_path, 'artifacts'), max_bytes=2**40)
+
+        reference = None
+        for repeat in range(args.repeats):
+            elapsed, run_dir_path = prepare(base_path, None, inputs)
+            reference = read_dir(run_dir_path)
+            print(f'without store, run {repeat}: {elapsed:.2f}s')
+
+        for repeat in range(args.repeats):
+            elapsed, run_dir_path = prepare(base_path, store, inputs)
+            same = read_dir(run_dir_path) == reference
+            print(f'   with store, run {repeat}: {elapsed:.2f}s, identical files: {same}, {store.stats()}')
+
+        # every worker builds the same inputs and races to populate an empty store
+        store_path = os.path.join(base_path, 'concurrent-artifacts')
+        with multiprocessing.Pool(args.workers) as pool:
+            results = pool.map(concurrent_worker, [(base_path, store_path, 0, sizes)] * args.workers)
+
+        misses = sum(stats.get('misses', 0) for _, stats in results)
+        same = all(contents == reference for contents, _ in results)
+        print(f'{args.workers} concurrent workers: {misses} files written, identical files: {same}')
+
+        # eviction down to a budget smaller than one run
+        small = ArtifactStore(os.path.join(base_path, 'artifacts'), max_bytes=len(reference['net1.tab']))
+        small.evict()
+        remaining = sum(1 for _ in small._iter_objects())
+        print(f'after evicting to {small.max_bytes} bytes: {remaining} artifact(s) left, {small.stats()}')
+
+
+if __name__ == '__main__':
+    main()
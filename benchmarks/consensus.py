@@ -0,0 +1,68 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from server.alignment_columns import JoinedAlignments
+from server.comparison import compute_consensus
+from server.util import all_equal
+
+
+def random_joined(rng, n_alignments, n_proteins, agreement, unaligned):
+    # alignments that agree with a common one on a fraction of the proteins
+    names1 = np.array([f'9606.ENSP{i:011d}' for i in range(n_proteins)], dtype=object)
+    names2 = np.array([f'10090.ENSMUSP{i:011d}' for i in range(n_proteins)], dtype=object)
+    common = rng.permutation(n_proteins)
+
+    columns = dict()
+    for i in range(n_alignments):
+        images = np.where(rng.random_sample(n_proteins) < agreement, common, rng.randint(0, n_proteins, n_proteins))
+        column = names2[images]
+        column[rng.random_sample(n_proteins) < unaligned] = np.nan
+        columns[f'net2_10090_aligner_{i}'] = column
+
+    return pd.DataFrame(columns, index=pd.Index(names1, name='net1_9606'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the row-wise and the vectorized unanimous consensus')
+    parser.add_argument('--alignments', type=int, default=32)
+    parser.add_argument('--proteins', type=int, default=20000)
+    parser.add_argument('--agreement', type=float, default=0.98)
+    parser.add_argument('--unaligned', type=float, default=0.001)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    table = random_joined(rng, args.alignments, args.proteins, args.agreement, args.unaligned)
+    header = ['net1_9606', 'net2_10090']
+
+    start_time = time.perf_counter()
+    expected = table.loc[table.agg(all_equal, axis=1)].iloc[:,:1]
+    expected.columns = [header[1]]
+    row_wise_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    joined = JoinedAlignments.from_table(table)
+    actual = compute_consensus(joined, *header)
+    vectorized_time = time.perf_counter() - start_time
+
+    same = expected.equals(actual[[header[1]]])
+
+    print(f'{args.alignments} alignments of {args.proteins} proteins, {len(actual)} consensus pairs: '
+          f'row-wise {row_wise_time:.2f}s, vectorized {vectorized_time:.2f}s '
+          f'({row_wise_time / vectorized_time:.1f}x), identical: {same}')
+
+    for method in ['majority', 2]:
+        for unaligned in ['disagree', 'abstain']:
+            start_time = time.perf_counter()
+            consensus = compute_consensus(joined, *header, method=method, unaligned=unaligned)
+            print(f'{method} ({unaligned}): {len(consensus)} pairs in {time.perf_counter() - start_time:.2f}s')
+
+    if not same:
+        raise SystemExit('the vectorized unanimous consensus differs from the row-wise one')
+
+
+if __name__ == '__main__':
+    main()
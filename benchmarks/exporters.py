@@ -0,0 +1,146 @@
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+import igraph
+import numpy as np
+
+from server.sources.bitscore import TricolBitscoreMatrix, structured_tricol
+from server.sources.network import EdgeListNetwork, IgraphNetwork, InternedEdgeList
+
+
+# the exporters as they were written before the bulk writers, used as a reference
+
+def legacy_write_rows(file_path, rows, delimiter='\t', header=None):
+    with open(file_path, 'w+') as f:
+        writer = csv.writer(f, delimiter=delimiter)
+        if header is not None:
+            writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+
+def legacy_iter_edges(net):
+    vs = net.igraph.vs
+    for e in net.igraph.es:
+        yield vs[e.source]['name'], vs[e.target]['name']
+
+def legacy_write_gml(net, file_path):
+    for v in net.igraph.vs:
+        v['id'] = v.index
+    net.igraph.write_gml(file_path)
+    del net.igraph.vs['id']
+
+def legacy_write_ncount4_leda(net, file_path):
+    net.igraph.write_leda(file_path + '.tmp', names='name', weights=None)
+    with open(file_path + '.tmp', 'r') as in_f:
+        with open(file_path, 'w') as out_f:
+            out_f.writelines(line for line in in_f if not line.startswith('#'))
+    os.remove(file_path + '.tmp')
+
+
+def random_names(rng, n, prefix):
+    names = np.array([f'{prefix}.{i:08d}' for i in range(n)], dtype=object)
+    # a few names csv has to quote
+    names[rng.choice(n, size=min(n, 5), replace=False)] = [f'{prefix} "quoted" {i}\tx' for i in range(min(n, 5))]
+    return names
+
+def random_network(rng, name, n_vertices, n_edges):
+    edges = rng.randint(0, n_vertices, size=(n_edges, 2), dtype=np.int32)
+    graph = igraph.Graph(n=n_vertices, edges=edges.tolist())
+    graph.simplify()
+    graph.vs['name'] = random_names(rng, n_vertices, name).tolist()
+    graph.vs['string_id'] = rng.permutation(n_vertices).tolist()
+    return IgraphNetwork(name, graph, simplify=False)
+
+
+def strip_gml_creator(file_path):
+    with open(file_path, 'rb') as f:
+        return b''.join(line for line in f if not line.startswith(b'Creator'))
+
+def read_bytes(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+def compare(label, tmp_dir, legacy, fast, read=read_bytes):
+    legacy_path = os.path.join(tmp_dir, f'{label}.legacy')
+    fast_path = os.path.join(tmp_dir, f'{label}.fast')
+
+    start_time = time.perf_counter()
+    legacy(legacy_path)
+    legacy_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    fast(fast_path)
+    fast_time = time.perf_counter() - start_time
+
+    same = read(legacy_path) == read(fast_path)
+    size = os.path.getsize(fast_path) / 2**20
+
+    print(f'{label:>24}: {size:7.1f} MiB, legacy {legacy_time:6.2f}s ({size / legacy_time:6.1f} MiB/s), '
+          f'bulk {fast_time:6.2f}s ({size / fast_time:6.1f} MiB/s), identical: {same}')
+
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the bulk exporters against the csv/igraph writers and compare throughput')
+    parser.add_argument('--vertices', type=int, default=20000)
+    parser.add_argument('--edges', type=int, default=200000)
+    parser.add_argument('--bitscores', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+
+    net1 = random_network(rng, 'net1', args.vertices, args.edges)
+    net2 = random_network(rng, 'net2', args.vertices, args.edges)
+
+    names = np.array(net1.igraph.vs['name'], dtype=object)
+    interned = EdgeListNetwork('interned', InternedEdgeList(names,
+        rng.randint(0, args.vertices, size=(args.edges, 2), dtype=np.int32)))
+
+    scores = (rng.random_sample(args.bitscores) * 1000).astype(np.float32)
+    p1_ids = rng.randint(0, args.vertices, size=args.bitscores)
+    p2_ids = rng.randint(0, args.vertices, size=args.bitscores)
+
+    by_string_id = TricolBitscoreMatrix(
+        structured_tricol((p1_ids.astype(np.int32), p2_ids.astype(np.int32), scores)),
+        net1=net1, net2=net2, by='string_id')
+    sparse = by_string_id.to_sparse()
+
+    checks = [
+        ('edgelist', lambda p: legacy_write_rows(p, legacy_iter_edges(net1)),
+                     lambda p: net1.write_tsv_edgelist(p)),
+        ('edgelist header', lambda p: legacy_write_rows(p, legacy_iter_edges(net1), header=['INTERACTOR_A', 'INTERACTOR_B']),
+                            lambda p: net1.write_tsv_edgelist(p, header=['INTERACTOR_A', 'INTERACTOR_B'])),
+        ('interned edgelist', lambda p: legacy_write_rows(p, iter(interned.edgelist)),
+                              lambda p: interned.write_tsv_edgelist(p)),
+        ('tricol string_id', lambda p: legacy_write_rows(p, by_string_id.iter_tricol(by='string_id')),
+                             lambda p: by_string_id.write_tricol(p, by='string_id')),
+        ('tricol name', lambda p: legacy_write_rows(p, by_string_id.iter_tricol(by='name')),
+                        lambda p: by_string_id.write_tricol(p, by='name')),
+        ('sparse name', lambda p: legacy_write_rows(p, sparse.iter_tricol(by='name')),
+                        lambda p: sparse.write_tricol(p, by='name')),
+        ('sparse index', lambda p: legacy_write_rows(p, sparse.iter_tricol(by='index'), delimiter=' '),
+                         lambda p: sparse.write_tricol(p, by='index', delimiter=' ')),
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = [compare(label, tmp_dir, legacy, fast) for label, legacy, fast in checks]
+
+        results.append(compare('gml', tmp_dir,
+            lambda p: legacy_write_gml(net1, p), lambda p: net1.write_gml(p), read=strip_gml_creator))
+
+        # LEDA labels cannot hold newlines but tabs and quotes are fine
+        results.append(compare('ncount4 leda', tmp_dir,
+            lambda p: legacy_write_ncount4_leda(net2, p), lambda p: net2.write_ncount4_leda(p)))
+
+    if not all(results):
+        raise SystemExit('some exporters differ from the reference output')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from server.scheduler import ResourceScheduler
+
+
+# (name, cpus, memory units, seconds): a mix of small and large jobs
+JOB_KINDS = [
+    ('hubalign', 1, 6, 0.4),
+    ('pinalog', 1, 2, 0.2),
+    ('lgraal', 1, 4, 0.6),
+    ('alignet', 4, 3, 0.5),
+]
+
+
+def worker(state_dir_path, cpu_budget, memory_budget, jobs, events):
+    scheduler = ResourceScheduler(state_dir_path, cpu_budget, memory_budget, poll_interval=0.01)
+
+    async def run_jobs():
+        for name, cpus, memory, seconds, priority in jobs:
+            reservation = await scheduler.reserve(cpus, memory, priority=priority)
+            try:
+                events.put(('start', time.time(), os.getpid(), name, reservation.cpus, reservation.memory_bytes))
+                await asyncio.sleep(seconds)
+            finally:
+                events.put(('end', time.time(), os.getpid(), name, reservation.cpus, reservation.memory_bytes))
+                reservation.release()
+
+    asyncio.new_event_loop().run_until_complete(run_jobs())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a mixed synthetic load through the aligner scheduler and check its budget')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--jobs-per-worker', type=int, default=6)
+    parser.add_argument('--cpus', type=int, default=4)
+    parser.add_argument('--memory', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as state_dir_path:
+        events = multiprocessing.Queue()
+
+        processes = []
+        for _ in range(args.workers):
+            jobs = [kind + (rng.choice([0, 0, 0, 5]),) for kind in rng.choices(JOB_KINDS, k=args.jobs_per_worker)]
+            processes.append(multiprocessing.Process(
+                target=worker, args=(state_dir_path, args.cpus, args.memory, jobs, events)))
+
+        start_time = time.time()
+        for process in processes:
+            process.start()
+
+        n_events = 2 * args.workers * args.jobs_per_worker
+        log = sorted((events.get() for _ in range(n_events)), key=lambda event: (event[1], event[0] == 'start'))
+
+        for process in processes:
+            process.join()
+
+        makespan = time.time() - start_time
+
+    cpus = memory = peak_cpus = peak_memory = 0
+    busy = 0.0
+    last_time = start_time
+
+    for kind, timestamp, _, _, job_cpus, job_memory in log:
+        busy += min(cpus, args.cpus) * (timestamp - last_time)
+        last_time = timestamp
+
+        sign = 1 if kind == 'start' else -1
+        cpus += sign * job_cpus
+        memory += sign * job_memory
+
+        peak_cpus = max(peak_cpus, cpus)
+        peak_memory = max(peak_memory, memory)
+
+    print(f'{n_events // 2} jobs in {makespan:.2f}s, cpu utilization {busy / (args.cpus * makespan):.0%}')
+    print(f'peak usage: {peak_cpus}/{args.cpus} cpus, {peak_memory}/{args.memory} memory units')
+
+    if peak_cpus > args.cpus or peak_memory > args.memory:
+        raise SystemExit('budget exceeded')
+
+
+if __name__ == '__main__':
+    main()
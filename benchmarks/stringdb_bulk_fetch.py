@@ -0,0 +1,105 @@
+import argparse
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+import psycopg2
+
+from server.sources.pgcopy import copy_to_numpy
+
+
+BITSCORES_DTYPE = [('protein_id_a', 'i4'), ('protein_id_b', 'i4'), ('bitscore', 'f4')]
+
+QUERY = """
+    select protein_id_a, protein_id_b, bitscore
+    from bench_blast_data
+    where protein_id_a >= %(min_id)s;
+    """
+
+
+def create_table(dsn, n_rows):
+    with psycopg2.connect(**dsn) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                drop table if exists bench_blast_data;
+                create table bench_blast_data as
+                  select
+                    (random() * 20000) :: integer protein_id_a,
+                    (random() * 20000) :: integer protein_id_b,
+                    (random() * 1000) :: real bitscore
+                  from
+                    generate_series(1, %(n_rows)s);
+                """,
+                {'n_rows': n_rows})
+    conn.close()
+
+
+def drop_table(dsn):
+    with psycopg2.connect(**dsn) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('drop table if exists bench_blast_data;')
+    conn.close()
+
+
+def fetch_fetchall(dsn):
+    with psycopg2.connect(**dsn) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(QUERY, {'min_id': 0})
+            values = cursor.fetchall()
+    conn.close()
+
+    return np.array(values, dtype=BITSCORES_DTYPE)
+
+
+def fetch_copy(dsn):
+    return copy_to_numpy(dsn, QUERY, {'min_id': 0}, BITSCORES_DTYPE)
+
+
+def measure(method, dsn, results):
+    fetch = {'fetchall': fetch_fetchall, 'copy': fetch_copy}[method]
+
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start_time = time.perf_counter()
+    array = fetch(dsn)
+    elapsed = time.perf_counter() - start_time
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    results.put((method, len(array), elapsed, (peak_rss - base_rss) * 1024, array.nbytes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare fetchall() and binary COPY for BLAST-like result sets')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5432)
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--password', default='postgres')
+    parser.add_argument('--dbname', default='postgres')
+    parser.add_argument('--rows', type=int, default=5000000)
+    args = parser.parse_args()
+
+    dsn = {'host': args.host, 'port': args.port, 'user': args.user, 'password': args.password, 'dbname': args.dbname}
+
+    create_table(dsn, args.rows)
+
+    try:
+        results = multiprocessing.Queue()
+
+        # one process per method, so that peak RSS is measured independently
+        for method in ['fetchall', 'copy']:
+            process = multiprocessing.Process(target=measure, args=(method, dsn, results))
+            process.start()
+            process.join()
+
+            method, n_rows, elapsed, peak_rss_delta, nbytes = results.get()
+            print(f'{method:>8}: {n_rows} rows in {elapsed:.2f}s ({n_rows / elapsed:,.0f} rows/s), '
+                  f'peak RSS +{peak_rss_delta / 2**20:.0f} MiB for a {nbytes / 2**20:.0f} MiB array')
+
+    finally:
+        drop_table(dsn)
+
+
+if __name__ == '__main__':
+    main()
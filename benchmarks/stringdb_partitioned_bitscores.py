@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import time
+
+import numpy as np
+import psycopg2
+
+from server.sources.stringdb import StringDB
+
+
+class SyntheticNetwork(object):
+    # the parts of StringDBNetwork used by StringDB._fetch_bitscore_matrix
+    def __init__(self, species_id, string_ids):
+        self.species_id = species_id
+        self.string_ids = set(string_ids)
+
+    async def get_species(self, db):
+        return [self.species_id]
+
+
+def create_table(dsn, n_proteins, n_rows):
+    with psycopg2.connect(**dsn) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("select to_regclass('homology.blast_data');")
+            if cursor.fetchone()[0] is not None:
+                raise RuntimeError('homology.blast_data already exists, refusing to overwrite it')
+
+            cursor.execute("""
+                create schema if not exists homology;
+                create table homology.blast_data as
+                  select
+                    1 species_id_a,
+                    2 species_id_b,
+                    (random() * %(n_proteins)s) :: integer protein_id_a,
+                    (%(n_proteins)s + random() * %(n_proteins)s) :: integer protein_id_b,
+                    (random() * 1000) :: real bitscore
+                  from
+                    generate_series(1, %(n_rows)s);
+                create index on homology.blast_data (protein_id_a);
+                analyze homology.blast_data;
+                """,
+                {'n_proteins': n_proteins, 'n_rows': n_rows})
+    conn.close()
+
+
+def drop_table(dsn):
+    with psycopg2.connect(**dsn) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('drop table if exists homology.blast_data;')
+    conn.close()
+
+
+def sorted_rows(values):
+    return np.sort(values, order=['protein_id_a', 'protein_id_b', 'bitscore'])
+
+
+async def fetch(dsn, net1, net2, partitions, pool_maxsize):
+    pool = None
+
+    if pool_maxsize > 0:
+        pool = await StringDB.init_pool(minsize=0, maxsize=pool_maxsize, **dsn)
+
+    db = StringDB(pool=pool, bulk_fetch=pool is None, bitscore_partitions=partitions, **dsn)
+
+    try:
+        start_time = time.perf_counter()
+        matrix = await db._fetch_bitscore_matrix(net1, net2)
+        return time.perf_counter() - start_time, matrix.tricol
+    finally:
+        if pool is not None:
+            pool.close()
+            await pool.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare single and partitioned bitscore queries on a synthetic homology.blast_data')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5432)
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--password', default='postgres')
+    parser.add_argument('--dbname', default='postgres')
+    parser.add_argument('--proteins', type=int, default=20000)
+    parser.add_argument('--rows', type=int, default=5000000)
+    parser.add_argument('--partitions', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--pool', type=int, default=0, metavar='MAXSIZE',
+                        help='use an aiopg pool of this size instead of binary COPY connections')
+    args = parser.parse_args()
+
+    dsn = {'host': args.host, 'port': args.port, 'user': args.user, 'password': args.password, 'dbname': args.dbname}
+
+    net1 = SyntheticNetwork(1, range(args.proteins))
+    net2 = SyntheticNetwork(2, range(args.proteins, 2 * args.proteins + 1))
+
+    create_table(dsn, args.proteins, args.rows)
+
+    try:
+        loop = asyncio.get_event_loop()
+
+        base_time, base_values = loop.run_until_complete(fetch(dsn, net1, net2, 1, args.pool))
+        base_values = sorted_rows(base_values)
+        print(f' 1 partition:  {len(base_values)} rows in {base_time:.2f}s')
+
+        for partitions in args.partitions:
+            elapsed, values = loop.run_until_complete(fetch(dsn, net1, net2, partitions, args.pool))
+            same = np.array_equal(sorted_rows(values), base_values)
+            print(f'{partitions:>2} partitions: {len(values)} rows in {elapsed:.2f}s, same rows: {same}')
+
+    finally:
+        drop_table(dsn)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import time
+
+import igraph
+import numpy as np
+
+from server.sources.stringdb import StringDBNetwork
+
+
+def tuplelist_to_igraph(net):
+    # previous implementation of StringDBNetwork.to_igraph, kept for comparison
+    ext_ids = net.external_ids
+
+    graph = igraph.Graph.TupleList(net.edges)
+
+    for v in graph.vs:
+        string_id = int(v['name'])
+        ext_id = ext_ids[string_id]
+
+        v['name'] = ext_id
+        v['string_id'] = string_id
+        v['external_id'] = ext_id
+
+    if not graph.is_simple():
+        graph.simplify()
+
+    return graph
+
+
+def random_stringdb_network(n_vertices, n_edges, seed=0):
+    rng = np.random.RandomState(seed)
+
+    string_ids = rng.choice(np.arange(1, 50 * n_vertices, dtype=np.int32), size=n_vertices, replace=False)
+    external_ids = {int(string_id): f'9606.ENSP{string_id:011d}' for string_id in string_ids}
+
+    edges = string_ids[rng.randint(0, n_vertices, size=(n_edges, 2))]
+    edges = edges[edges[:, 0] != edges[:, 1]]
+
+    return StringDBNetwork(9606, external_ids, edges)
+
+
+def timed(f, *args, repeat=3):
+    best = float('inf')
+
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = f(*args)
+        best = min(best, time.perf_counter() - start_time)
+
+    return best, result
+
+
+def same_graph(g1, g2):
+    if g1.vcount() != g2.vcount() or g1.ecount() != g2.ecount():
+        return False
+
+    edges1 = {frozenset((g1.vs[s]['name'], g1.vs[t]['name'])) for s, t in g1.get_edgelist()}
+    edges2 = {frozenset((g2.vs[s]['name'], g2.vs[t]['name'])) for s, t in g2.get_edgelist()}
+
+    return edges1 == edges2
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark StringDBNetwork.to_igraph against the TupleList-based build')
+    parser.add_argument('--vertices', type=int, default=19000)
+    parser.add_argument('--edges', type=int, default=2000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    net = random_stringdb_network(args.vertices, args.edges)
+
+    old_time, old_graph = timed(tuplelist_to_igraph, net, repeat=args.repeat)
+    new_time, new_graph = timed(net.to_igraph, repeat=args.repeat)
+
+    print(f'vertices: {new_graph.vcount()}, edges: {new_graph.ecount()}')
+    print(f'TupleList:  {old_time:.3f}s')
+    print(f'vectorized: {new_time:.3f}s')
+    print(f'speedup:    {old_time / new_time:.1f}x')
+    print(f'same graph: {same_graph(old_graph, new_graph)}')
+
+
+if __name__ == '__main__':
+    main()
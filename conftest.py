@@ -0,0 +1,2 @@
+# puts the repository root on sys.path, so that tests import the server
+# modules as the benchmarks do (run pytest from the repository root)
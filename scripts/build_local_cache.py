@@ -0,0 +1,58 @@
+"""Convert the local datasets to their binary cache ahead of time.
+
+Run from the repository root, e.g.:
+
+    python -m scripts.build_local_cache --isobase /opt/local-db/isobase --stringdb-virus /opt/local-db/stringdb-virus
+"""
+
+import argparse
+from os import path
+import os
+
+from server.sources.localcache import LocalDatasetCache
+
+
+def iter_files(base_path, suffix):
+    for dir_path, dir_names, file_names in os.walk(base_path):
+        dir_names[:] = [d for d in dir_names if not d.startswith('.')]
+
+        for file_name in sorted(file_names):
+            if file_name.endswith(suffix):
+                yield path.join(dir_path, file_name)
+
+
+def build_isobase(base_path):
+    cache = LocalDatasetCache(base_path)
+
+    for file_path in iter_files(base_path, '.tab'):
+        print(f'caching {file_path}')
+
+        if file_path.endswith('-blast.tab'):
+            cache.load_bitscores(file_path)
+        else:
+            cache.load_edgelist(file_path)
+
+
+def build_stringdb_virus(base_path):
+    cache = LocalDatasetCache(base_path)
+
+    for file_path in iter_files(path.join(base_path, 'networks'), '.tsv'):
+        print(f'caching {file_path}')
+        cache.load_edgelist(file_path, header=True)
+
+    for file_path in iter_files(path.join(base_path, 'blast'), '.bitscore.tsv'):
+        print(f'caching {file_path}')
+        cache.load_bitscores(file_path, header=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the binary cache of the local datasets')
+    parser.add_argument('--isobase', metavar='PATH')
+    parser.add_argument('--stringdb-virus', metavar='PATH')
+    args = parser.parse_args()
+
+    if args.isobase:
+        build_isobase(args.isobase)
+
+    if args.stringdb_virus:
+        build_stringdb_virus(args.stringdb_virus)
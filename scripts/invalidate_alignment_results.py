@@ -0,0 +1,37 @@
+"""Mark the source data of databases as updated, so that alignment jobs on
+them are computed again instead of reusing previous results.
+
+Run after updating a database (e.g. loading a new STRING release), from the
+repository root inside the server container:
+
+    python -m scripts.invalidate_alignment_results stringdb
+"""
+
+import argparse
+import asyncio
+
+from server import mongo
+
+
+async def invalidate(db_names):
+    for db_name in db_names:
+        version = await mongo.bump_data_version(db_name)
+        print(f'{db_name}: data version is now {version}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Invalidate the memoized alignment results of databases')
+    parser.add_argument('db_names', nargs='+', type=str.lower, choices=['isobase', 'stringdb', 'stringdbvirus'])
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    mongo.connect(io_loop=loop)
+
+    try:
+        loop.run_until_complete(invalidate(args.db_names))
+    finally:
+        mongo.disconnect()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Precompute the L-GRAAL inputs (LEDA network and ncount4 graphlet signatures)
+of StringDB species into the aligner artifact store, so that later alignments
+of these species skip ncount4 entirely.
+
+Run from the repository root inside the server container, e.g.:
+
+    python -m scripts.warm_ncount4_signatures 9606 10090 --score-thresholds '{"combined_score": 700}'
+"""
+
+import argparse
+import asyncio
+import json
+
+from server.aligners.lgraal import LGraal
+from server.artifacts import ArtifactStore
+from server.sources.stringdb import StringDB
+
+
+async def warm_up(args, artifacts):
+    aligner = LGraal()
+
+    async with StringDB(host=args.host, port=args.port, bulk_fetch=True) as db:
+        for species_id in args.species_ids:
+            print(f'fetching network of species {species_id}')
+            net = await db.get_network(species_id, score_thresholds=args.score_thresholds)
+
+            print(f'computing signatures of {net.name} ({net.igraph.vcount()} vertices, {net.igraph.ecount()} edges)')
+            aligner.precompute_signatures(net, args.run_dir, args.template_dir, artifacts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute ncount4 signatures of StringDB species for L-GRAAL')
+    parser.add_argument('species_ids', type=int, nargs='+')
+    parser.add_argument('--score-thresholds', type=json.loads, default={},
+                        help='JSON object of evidence score thresholds, as in alignment requests')
+    parser.add_argument('--artifacts-path', default='/opt/running-alignments/.artifacts',
+                        help='must match ALIGNER_ARTIFACTS_PATH')
+    parser.add_argument('--artifacts-max-bytes', type=int, default=16 * 1024**3,
+                        help='must match ALIGNER_ARTIFACTS_MAX_BYTES')
+    parser.add_argument('--run-dir', default='/opt/running-alignments')
+    parser.add_argument('--template-dir', default='/opt/aligner-templates')
+    parser.add_argument('--host', default='stringdb')
+    parser.add_argument('--port', type=int, default=5432)
+    args = parser.parse_args()
+
+    artifacts = ArtifactStore(args.artifacts_path, args.artifacts_max_bytes)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(warm_up(args, artifacts))
+
+    print(f'artifact store: {artifacts.stats()}')
+
+
+if __name__ == '__main__':
+    main()
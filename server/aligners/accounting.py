@@ -0,0 +1,213 @@
+import json
+import os
+import resource
+import signal
+import subprocess
+import sys
+import time
+
+
+def rusage_summary(ru):
+    # ru_maxrss is in KiB on Linux
+    return {
+        'user_time': ru.ru_utime,
+        'system_time': ru.ru_stime,
+        'max_rss_bytes': ru.ru_maxrss * 1024,
+        'block_input': ru.ru_inblock,
+        'block_output': ru.ru_oublock,
+        'voluntary_context_switches': ru.ru_nvcsw,
+        'involuntary_context_switches': ru.ru_nivcsw,
+    }
+
+
+def exit_code(status):
+    # same convention as subprocess: -N if killed by signal N
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def memory_limit_preexec(memory_limit):
+    if memory_limit is None:
+        return None
+
+    def preexec():
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    return preexec
+
+
+def check_call_with_usage(cmd, usage=None, memory_limit=None, **kwargs):
+    # subprocess.check_call that reaps the process with wait4, appending its
+    # resource usage to the usage list if given
+    start_time = time.time()
+    process = subprocess.Popen(cmd, preexec_fn=memory_limit_preexec(memory_limit), **kwargs)
+
+    try:
+        _, status, ru = os.wait4(process.pid, 0)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+
+    process.returncode = exit_code(status)
+
+    if usage is not None:
+        usage.append(dict(rusage_summary(ru),
+                          command=os.path.basename(cmd[0]),
+                          exit_code=process.returncode,
+                          wall_time=time.time() - start_time))
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+
+def accounted_cmd(cmd, usage_path, memory_limit=None):
+    # wraps cmd so that its resource usage (including the children it reaps)
+    # is written as JSON to usage_path when it exits, see main below
+    wrapper = [sys.executable, os.path.abspath(__file__), usage_path]
+
+    if memory_limit is not None:
+        wrapper += ['--memory-limit', str(memory_limit)]
+
+    return wrapper + ['--'] + list(cmd)
+
+
+def read_usage(usage_path):
+    try:
+        with open(usage_path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        # the wrapper itself was killed
+        return None
+
+
+class ProcessGroupSampler(object):
+    # Periodic samples of the resident and virtual memory of all the
+    # processes of a process group but its leader (the accounting wrapper
+    # below), read from /proc. At most max_samples are kept: when full, every
+    # other sample is dropped and the sampling stride doubles, so long runs
+    # keep an evenly spaced profile.
+
+    def __init__(self, pgid, max_samples=256):
+        self.pgid = pgid
+        self.max_samples = max_samples
+        self.start_time = time.time()
+
+        self.samples = []
+        self.peak_rss_bytes = 0
+        self.peak_vms_bytes = 0
+        self.peak_processes = 0
+
+        self._stride = 1
+        self._n_samples = 0
+        self._page_size = os.sysconf('SC_PAGE_SIZE')
+
+    def _read_group(self):
+        rss = vms = n_processes = 0
+
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit() or int(pid) == self.pgid:
+                continue
+
+            try:
+                with open(f'/proc/{pid}/stat', 'r') as f:
+                    stat = f.read()
+            except OSError:
+                continue
+
+            # fields after the parenthesized command name, which may contain spaces
+            fields = stat[stat.rfind(')') + 2:].split()
+            if int(fields[2]) != self.pgid:
+                continue
+
+            n_processes += 1
+            vms += int(fields[20])
+            rss += int(fields[21]) * self._page_size
+
+        return rss, vms, n_processes
+
+    def sample(self):
+        rss, vms, n_processes = self._read_group()
+
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+        self.peak_vms_bytes = max(self.peak_vms_bytes, vms)
+        self.peak_processes = max(self.peak_processes, n_processes)
+
+        if self._n_samples % self._stride == 0:
+            self.samples.append((round(time.time() - self.start_time, 3), rss))
+
+            if len(self.samples) >= self.max_samples:
+                self.samples = self.samples[::2]
+                self._stride *= 2
+
+        self._n_samples += 1
+
+    def summary(self):
+        return {
+            'peak_rss_bytes': self.peak_rss_bytes,
+            'peak_vms_bytes': self.peak_vms_bytes,
+            'peak_processes': self.peak_processes,
+            'samples': self.samples,
+        }
+
+
+def main():
+    # usage: accounting.py USAGE_PATH [--memory-limit BYTES] -- CMD...
+    #
+    # Runs CMD, waits for it with wait4 and writes its resource usage to
+    # USAGE_PATH. Meant to be the process group leader of an aligner run:
+    # termination signals sent to the group reach CMD directly, this process
+    # only waits for it and then exits the same way.
+    args = sys.argv[1:]
+    usage_path = args.pop(0)
+
+    memory_limit = None
+    if args[0] == '--memory-limit':
+        memory_limit = int(args[1])
+        args = args[2:]
+
+    cmd = args[1:]
+
+    for sig in [signal.SIGTERM, signal.SIGINT, signal.SIGHUP]:
+        signal.signal(sig, signal.SIG_IGN)
+
+    def preexec():
+        for sig in [signal.SIGTERM, signal.SIGINT, signal.SIGHUP]:
+            signal.signal(sig, signal.SIG_DFL)
+
+        if memory_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    start_time = time.time()
+    # the Popen object is kept, its finalizer may reap the child otherwise
+    process = subprocess.Popen(cmd, preexec_fn=preexec)
+
+    while True:
+        try:
+            _, status, ru = os.wait4(process.pid, 0)
+            break
+        except InterruptedError:
+            pass
+
+    process.returncode = exit_code(status)
+
+    usage = dict(rusage_summary(ru), exit_code=exit_code(status), wall_time=time.time() - start_time)
+
+    with open(usage_path + '.tmp', 'w') as f:
+        json.dump(usage, f)
+    os.replace(usage_path + '.tmp', usage_path)
+
+    if os.WIFSIGNALED(status):
+        sig = os.WTERMSIG(status)
+        # SIGKILL (e.g. from the OOM killer) and SIGSTOP cannot be handled
+        if sig not in (signal.SIGKILL, signal.SIGSTOP):
+            signal.signal(sig, signal.SIG_DFL)
+        os.kill(os.getpid(), sig)
+        sys.exit(128 + sig)
+
+    sys.exit(os.WEXITSTATUS(status))
+
+
+if __name__ == '__main__':
+    main()
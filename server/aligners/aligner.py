@@ -1,17 +1,67 @@
+import asyncio
+from collections import deque
 import logging
 from os import path
 import os
 import pandas as pd
-import shutil
+import signal
 import subprocess
 import tempfile
 import time
 
+from server.aligners.accounting import ProcessGroupSampler, accounted_cmd, read_usage
+from server.metrics import child_span
+
+
+# how allocation failures show up in the output of the aligners
+OUT_OF_MEMORY_MESSAGES = ['bad_alloc', 'MemoryError', 'cannot allocate', 'Cannot allocate', 'out of memory']
+
+
+class OutputRingBuffer(object):
+    # keeps the last max_bytes of a process output
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.truncated = False
+        self._chunks = deque()
+        self._size = 0
+
+    def write(self, chunk):
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        self.total_bytes += len(chunk)
+
+        while self._size - len(self._chunks[0]) >= self.max_bytes:
+            self._size -= len(self._chunks.popleft())
+            self.truncated = True
+
+    def getvalue(self):
+        data = b''.join(self._chunks)
+
+        if len(data) > self.max_bytes:
+            data = data[-self.max_bytes:]
+            self.truncated = True
+
+        return data.decode('utf-8', errors='replace')
+
 
 class Aligner(object):
+    # bump when the format of the written input files changes, so that files
+    # written by previous versions are not reused from the artifact store
+    INPUT_FORMAT_VERSION = 1
+
     def __init__(self):
         self.logger = logging.getLogger(self.name)
         self.logger.setLevel(logging.DEBUG)
+        self.artifacts = None
+        # resource usage of helper processes run while writing the input files
+        self.helper_usage = []
+        # span of the current run, and of its input setup for write_files
+        self.span = None
+        self.setup_span = None
+        # memory limit of the current run, also applied to the helper processes
+        self.run_memory_limit = None
 
     @property
     def name(self): return None
@@ -19,12 +69,46 @@ class Aligner(object):
     def env(self): return None
     @property
     def cmd(self): return None
+    @property
+    def timeout(self): return None
+    @property
+    def memory_limit(self): return None
 
     def write_files(self, run_dir_path):
         pass
 
+    # an AlignmentFormat describing the alignment file the aligner writes
+    output_format = None
+
     def import_alignment(self, net1, net2, execution_dir, file_name=None):
-        pass
+        # header and (net1 names, net2 names) arrays of the aligned pairs
+        file_name = file_name or self.output_format.file_name
+        p1, p2 = self.output_format.read(path.join(execution_dir, file_name), net1, net2)
+
+        return (net1.name, net2.name), (p1, p2)
+
+    def estimate_resources(self, net1, net2, *args):
+        # rough (cpus, memory_bytes) needed by the aligner process, used to
+        # schedule it; subclasses adjust it to their own memory profile
+        n_items = net1.igraph.vcount() + net2.igraph.vcount() + net1.igraph.ecount() + net2.igraph.ecount()
+        return 1, 256 * 1024**2 + 1024 * n_items
+
+    def _write_input(self, run_dir_path, file_name, write, *fingerprint):
+        # write(file_path) writes the input file; if its contents are fully
+        # determined by fingerprint, it is linked from the artifact store instead
+        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing {file_name}')
+        file_path = path.join(run_dir_path, file_name)
+
+        with child_span(self.setup_span, 'write_input', file=file_name) as span:
+            if self.artifacts is None or None in fingerprint:
+                write(file_path)
+            else:
+                key = self.artifacts.make_key(self.INPUT_FORMAT_VERSION, *fingerprint)
+                span.attrs['cached'] = not self.artifacts.link(key, write, file_path)
+
+            span.set(bytes=path.getsize(file_path))
+
+        return file_path
 
     def _gen_run_dir(run_dir_base_path, max_trials):
         for trial in range(max_trials):
@@ -38,76 +122,223 @@ class Aligner(object):
 
         return None
 
-    def _setup_run_dir(self, run_dir_path, template_dir_base_path, *args):
+    def _link_template(self, run_dir_path, template_dir_base_path):
         template_dir_path = path.join(template_dir_base_path, 'template-' + self.name)
 
+        # template files (mostly binaries) are symlinked, not copied
         for template_file in os.listdir(template_dir_path):
-            template_file_path = path.join(template_dir_path, template_file)
-
-            if path.isdir(template_file_path):
-                shutil.copytree(template_file_path, run_dir_path)
-            else:
-                shutil.copy(template_file_path, run_dir_path)
+            template_file_path = path.abspath(path.join(template_dir_path, template_file))
+            os.symlink(template_file_path, path.join(run_dir_path, template_file))
 
+    def _setup_run_dir(self, run_dir_path, template_dir_base_path, *args):
+        self._link_template(run_dir_path, template_dir_base_path)
         self.write_files(run_dir_path, *args)
 
-    def run(self, net1, net2, *args, run_dir_base_path='run', template_dir_base_path='template', max_trials=50):
+    def run(self, net1, net2, *args, **kwargs):
+        # blocking run_async, for synchronous callers in the main thread: it
+        # runs on an event loop of its own, made current while it runs since
+        # the child watcher of asyncio subprocesses follows the current loop
+        loop = asyncio.new_event_loop()
+
+        try:
+            asyncio.set_event_loop(loop)
+            return loop.run_until_complete(self.run_async(net1, net2, *args, **kwargs))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    def _resources_summary(self, usage_path, sampler, memory_limit):
+        return {
+            'aligner': read_usage(usage_path),
+            'helpers': self.helper_usage,
+            'memory': sampler.summary() if sampler is not None else None,
+            'memory_limit_bytes': memory_limit,
+        }
+
+    def _check_memory_limit(self, result, run_dir_path):
+        # A process hitting RLIMIT_AS usually dies of a failed allocation
+        # (std::bad_alloc, MemoryError, R's "cannot allocate vector"), so a
+        # failed run whose address space got close to the limit is reported
+        # as having exceeded it.
+        resources = result['resources']
+        memory_limit = resources['memory_limit_bytes']
+
+        if result.get('ok', False) or result.get('timed_out', False) or memory_limit is None:
+            return
+
+        peak_vms = resources['memory']['peak_vms_bytes'] if resources['memory'] is not None else 0
+        output_tail = result.get('output', '')[-4096:]
+        out_of_memory = peak_vms >= 0.9 * memory_limit or \
+            any(message in output_tail for message in OUT_OF_MEMORY_MESSAGES)
+
+        if out_of_memory:
+            self.logger.warning(f'run_{self.name} @ {run_dir_path}: memory limit of {memory_limit} bytes exceeded')
+            result['memory_limit_exceeded'] = True
+            result['error'] = f'{self.name} exceeded its memory limit of {memory_limit} bytes'
+
+    def _import_alignment_dataframe(self, net1, net2, run_dir_path):
+        header, (p1, p2) = self.import_alignment(net1, net2, run_dir_path)
+
+        columns = [f'net1_{header[0]}', f'net2_{header[1]}']
+
+        return pd.DataFrame({columns[1]: p2}, index=pd.Index(p1, name=columns[0]), copy=False)
+
+    async def _pump_output(self, stream, ring_buffer, log_file):
+        while True:
+            chunk = await stream.read(1 << 16)
+            if not chunk:
+                break
+            ring_buffer.write(chunk)
+            log_file.write(chunk)
+
+    async def _sample_memory(self, sampler, interval):
+        while True:
+            sampler.sample()
+            await asyncio.sleep(interval)
+
+    async def _terminate(self, process, run_dir_path, kill_after):
+        # SIGTERM the whole process group (aligners may spawn children, e.g.
+        # Rscript), then SIGKILL it if it is still running after kill_after seconds
+        for sig in [signal.SIGTERM, signal.SIGKILL]:
+            if process.returncode is not None:
+                return
+
+            self.logger.warning(f'run_{self.name} @ {run_dir_path}: sending {sig.name} to process group {process.pid}')
+
+            try:
+                os.killpg(process.pid, sig)
+            except ProcessLookupError:
+                return
+
+            try:
+                await asyncio.wait_for(process.wait(), kill_after)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_async(self, net1, net2, *args, run_dir_base_path='run', template_dir_base_path='template', artifacts=None,
+                        timeout=None, kill_after=10, output_max_bytes=1 << 20, log_dir_path=None, cpu_affinity=None,
+                        memory_limit=None, memory_sample_interval=1.0, span=None):
+        # Same as run, without blocking the event loop: setup and import run in
+        # the default executor and the aligner output is streamed to a log
+        # file, keeping only its last output_max_bytes in memory. The aligner
+        # is terminated when it exceeds timeout seconds (self.timeout by
+        # default) and when the calling task is cancelled. If cpu_affinity is
+        # given, the aligner is pinned to those cores.
+        #
+        # The result has a 'resources' entry with the wait4 usage of the
+        # aligner and of the helper processes, and its memory sampled every
+        # memory_sample_interval seconds. With a memory_limit (self.memory_limit
+        # by default) its address space is capped with RLIMIT_AS. The setup,
+        # process and import stages are timed as children of span, if given.
+        #
+        # This frees the event loop of the calling process while the aligner
+        # runs, so other coroutines of the same task can progress (e.g. the
+        # other runs of a sweep). It does not overlap different jobs: celery
+        # prefork processes run one task at a time, and jobs run in parallel
+        # only as separate worker processes.
+        loop = asyncio.get_event_loop()
+
         os.makedirs(run_dir_base_path, exist_ok=True)
+        self.artifacts = artifacts
+        self.helper_usage = []
+        self.span = span
 
-        # run_dir_path = tempfile.mkdtemp(dir=run_dir_base_path, prefix=self.name + '-')
+        if timeout is None:
+            timeout = self.timeout
+        if memory_limit is None:
+            memory_limit = self.memory_limit
+        self.run_memory_limit = memory_limit
 
         with tempfile.TemporaryDirectory(dir=run_dir_base_path, prefix=self.name + '-') as run_dir_path:
             self.logger.info(f'run_{self.name} @ {run_dir_path}: setting up required files')
 
             try:
-                self._setup_run_dir(run_dir_path, template_dir_base_path, net1, net2, *args)
+                with child_span(span, 'setup') as self.setup_span:
+                    await loop.run_in_executor(None, self._setup_run_dir, run_dir_path, template_dir_base_path, net1, net2, *args)
             except Exception as ex:
                 self.logger.exception(f'run_{self.name} @ {run_dir_path}: an exception was raised while setting up the run directory')
                 return {'ok': False}
 
             self.logger.info(f'run_{self.name} @ {run_dir_path}: running')
 
-            result = {'command': self.cmd}
+            if log_dir_path is not None:
+                os.makedirs(log_dir_path, exist_ok=True)
+                log_path = path.join(log_dir_path, path.basename(run_dir_path) + '.log')
+            else:
+                log_path = path.join(run_dir_path, 'aligner-output.log')
+
+            result = {'command': self.cmd, 'log_file': log_path if log_dir_path is not None else None}
+            ring_buffer = OutputRingBuffer(output_max_bytes)
+            usage_path = path.join(run_dir_path, 'aligner-usage.json')
 
             start_time = time.time()
+            process_span = child_span(span, 'process')
 
-            try:
-                completed_process = subprocess.run(
-                    self.cmd,
+            with process_span, open(log_path, 'wb') as log_file:
+                process = await asyncio.create_subprocess_exec(
+                    *accounted_cmd(self.cmd, usage_path, memory_limit),
                     env=self.env,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
                     cwd=run_dir_path,
-                    check=True)
+                    start_new_session=True,
+                    preexec_fn=(lambda: os.sched_setaffinity(0, cpu_affinity)) if cpu_affinity else None)
+
+                pump = asyncio.ensure_future(self._pump_output(process.stdout, ring_buffer, log_file))
+
+                # the wrapper is the leader of the new session, so its pid is the process group id
+                sampler = ProcessGroupSampler(process.pid)
+                sampling = asyncio.ensure_future(self._sample_memory(sampler, memory_sample_interval))
+
+                try:
+                    await asyncio.wait_for(asyncio.shield(process.wait()), timeout)
+
+                except asyncio.TimeoutError:
+                    self.logger.warning(f'run_{self.name} @ {run_dir_path}: timed out after {timeout}s')
+                    await self._terminate(process, run_dir_path, kill_after)
+                    result['timed_out'] = True
+
+                except asyncio.CancelledError:
+                    self.logger.warning(f'run_{self.name} @ {run_dir_path}: cancelled')
+                    await self._terminate(process, run_dir_path, kill_after)
+                    pump.cancel()
+                    raise
 
-            except subprocess.CalledProcessError as cpe:
-                self.logger.warning(f'run_{self.name} @ {run_dir_path}: process exited with non-zero exit code {cpe.returncode}: {self.cmd}')
+                finally:
+                    sampling.cancel()
 
-                output = cpe.output.decode('utf-8')
-                self.logger.info('process output:')
+                try:
+                    # children left running in the background may keep the pipe open
+                    await asyncio.wait_for(pump, kill_after)
+                except asyncio.TimeoutError:
+                    self.logger.warning(f'run_{self.name} @ {run_dir_path}: output still open after the process exited')
+
+            end_time = time.time()
+            process_span.set(output_bytes=ring_buffer.total_bytes)
+
+            output = ring_buffer.getvalue()
+            result['output'] = output
+            result['output_truncated'] = ring_buffer.truncated
+            result['exit_code'] = process.returncode
+            result['run_time'] = end_time - start_time
+            result['resources'] = self._resources_summary(usage_path, sampler, memory_limit)
+
+            if process.returncode != 0 or result.get('timed_out', False):
+                self.logger.warning(f'run_{self.name} @ {run_dir_path}: process exited with non-zero exit code {process.returncode}: {self.cmd}')
+                self.logger.info('process output (tail):')
                 self.logger.info(output)
 
                 result['ok'] = False
-                result['output'] = output
-                result['exit_code'] = cpe.returncode
+                self._check_memory_limit(result, run_dir_path)
 
             else:
-                end_time = time.time()
-
                 self.logger.info(f'run_{self.name} @ {run_dir_path}: done')
 
                 result['ok'] = True
-                result['output'] = completed_process.stdout.decode('utf-8')
-                result['exit_code'] = completed_process.returncode
-
-                result['run_time'] = end_time - start_time
-                header, alignment = self.import_alignment(net1, net2, run_dir_path)
-
-                columns = [f'net1_{header[0]}', f'net2_{header[1]}']
-
-                alignment_df = pd.DataFrame(alignment, columns=columns)
-                alignment_df.set_index(columns[0], inplace=True)
 
-                result['alignment'] = alignment_df
+                with child_span(span, 'import') as import_span:
+                    result['alignment'] = await loop.run_in_executor(
+                        None, self._import_alignment_dataframe, net1, net2, run_dir_path)
+                    import_span.set(pairs=len(result['alignment']))
 
             return result
@@ -1,7 +1,5 @@
-from os import path
-
 from server.aligners.aligner import Aligner
-from server.util import iter_csv
+from server.aligners.alignment_format import AlignmentFormat
 
 
 class Alignet(Aligner):
@@ -9,6 +7,8 @@ class Alignet(Aligner):
         super().__init__()
         self.threads = threads
 
+    output_format = AlignmentFormat('alignment-net1-net2.tab', delimiter='\t', strip=True)
+
     @property
     def name(self):
         return 'alignet'
@@ -21,30 +21,29 @@ class Alignet(Aligner):
     def cmd(self):
         return ['Rscript', '--vanilla', 'alignet.R']
 
+    def estimate_resources(self, net1, net2, *args):
+        # R needs a lot more memory per item, and every thread holds its own copies
+        cpus, memory_bytes = super().estimate_resources(net1, net2)
+        return self.threads, 1024**3 + 4 * self.threads * memory_bytes
+
     def write_files(self, run_dir_path, net1, net2, blast_net1, blast_net2, blast_net1_net2):
         super().write_files(run_dir_path)
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing net1.tab')
-        net1_path = path.join(run_dir_path, 'net1.tab')
-        net1.write_tsv_edgelist(net1_path, header=['INTERACTOR_A', 'INTERACTOR_B'])
+        header = ['INTERACTOR_A', 'INTERACTOR_B']
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing net2.tab')
-        net2_path = path.join(run_dir_path, 'net2.tab')
-        net2.write_tsv_edgelist(net2_path, header=['INTERACTOR_A', 'INTERACTOR_B'])
+        self._write_input(run_dir_path, 'net1.tab',
+                          lambda file_path: net1.write_tsv_edgelist(file_path, header=header),
+                          'tsv_edgelist_header', net1.content_fingerprint)
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing blast-net1.tab')
-        blast_net1_path = path.join(run_dir_path, 'blast-net1.tab')
-        blast_net1.write_tricol(blast_net1_path)
+        self._write_input(run_dir_path, 'net2.tab',
+                          lambda file_path: net2.write_tsv_edgelist(file_path, header=header),
+                          'tsv_edgelist_header', net2.content_fingerprint)
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing blast-net2.tab')
-        blast_net2_path = path.join(run_dir_path, 'blast-net2.tab')
-        blast_net2.write_tricol(blast_net2_path)
+        self._write_input(run_dir_path, 'blast-net1.tab', blast_net1.write_tricol,
+                          'tricol', blast_net1.content_fingerprint)
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing blast-net1-net2.tab')
-        blast_net1_net2_path = path.join(run_dir_path, 'blast-net1-net2.tab')
-        blast_net1_net2.write_tricol(blast_net1_net2_path)
+        self._write_input(run_dir_path, 'blast-net2.tab', blast_net2.write_tricol,
+                          'tricol', blast_net2.content_fingerprint)
 
-    def import_alignment(self, net1, net2, execution_dir, file_name='alignment-net1-net2.tab'):
-        header = (net1.name, net2.name)
-        align_path = path.join(execution_dir, file_name)
-        return header, [(a.strip(), b.strip()) for a, b in iter_csv(align_path, delimiter='\t')]
+        self._write_input(run_dir_path, 'blast-net1-net2.tab', blast_net1_net2.write_tricol,
+                          'tricol', blast_net1_net2.content_fingerprint)
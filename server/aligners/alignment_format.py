@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+from pandas.errors import EmptyDataError
+
+
+class AlignmentFormat(object):
+    # Declares how an aligner writes its alignment: a delimited file whose
+    # first two columns are the aligned net1 and net2 proteins, either by
+    # name or by vertex index. smaller_net_first is for aligners that always
+    # put the network with fewer vertices in the first column.
+
+    def __init__(self, file_name, delimiter='\t', skip_rows=0, by='name', strip=False, skip_initial_space=False,
+                 drop_empty=False, smaller_net_first=False):
+        self.file_name = file_name
+        self.delimiter = delimiter
+        self.skip_rows = skip_rows
+        self.by = by
+        self.strip = strip
+        self.skip_initial_space = skip_initial_space
+        self.drop_empty = drop_empty
+        self.smaller_net_first = smaller_net_first
+
+    def _split_columns(self, file_path):
+        # Fast path for plain files (no quotes, no blank lines and the same
+        # number of fields in every row): split the whole text at once and
+        # take the first two columns of the resulting fields. Returns None
+        # when the file does not qualify.
+        with open(file_path, 'r', newline='') as f:
+            text = f.read()
+
+        if '"' in text or '\r' in text:
+            return None
+
+        lines = text.split('\n', self.skip_rows)
+        if len(lines) <= self.skip_rows:
+            return None
+        text = lines[-1]
+
+        if text.endswith('\n'):
+            text = text[:-1]
+        if text == '' or '\n\n' in text:
+            return None
+
+        n_rows = text.count('\n') + 1
+        n_columns = text.count(self.delimiter, 0, text.find('\n') if n_rows > 1 else len(text)) + 1
+        if n_columns < 2:
+            return None
+
+        fields = text.replace('\n', self.delimiter).split(self.delimiter)
+        if len(fields) != n_rows * n_columns:
+            return None
+
+        fields = np.array(fields, dtype=object).reshape(n_rows, n_columns)
+        return fields[:, 0], fields[:, 1]
+
+    def _read_columns(self, file_path):
+        if self.by == 'name' and not self.skip_initial_space and len(self.delimiter) == 1:
+            columns = self._split_columns(file_path)
+            if columns is not None:
+                return columns
+
+        try:
+            table = pd.read_csv(file_path, sep=self.delimiter, header=None, skiprows=self.skip_rows, usecols=[0, 1],
+                                dtype=np.int64 if self.by == 'index' else str, skipinitialspace=self.skip_initial_space,
+                                na_filter=False, engine='c')
+        except EmptyDataError:
+            dtype = np.int64 if self.by == 'index' else object
+            return np.array([], dtype=dtype), np.array([], dtype=dtype)
+
+        return table[0].to_numpy(), table[1].to_numpy()
+
+    def read(self, file_path, net1, net2):
+        # (net1 names, net2 names) arrays of the aligned pairs
+        p1, p2 = self._read_columns(file_path)
+
+        if self.by == 'index':
+            p1 = np.array(net1.igraph.vs['name'], dtype=object)[p1]
+            p2 = np.array(net2.igraph.vs['name'], dtype=object)[p2]
+        else:
+            if self.strip:
+                p1 = np.array([p.strip() for p in p1], dtype=object)
+                p2 = np.array([p.strip() for p in p2], dtype=object)
+
+            if self.drop_empty:
+                keep = (p1 != '') & (p2 != '')
+                p1, p2 = p1[keep], p2[keep]
+
+        if self.smaller_net_first and net1.igraph.vcount() > net2.igraph.vcount():
+            p1, p2 = p2, p1
+
+        return p1, p2
@@ -1,7 +1,5 @@
-from os import path
-
 from server.aligners.aligner import Aligner
-from server.util import iter_csv
+from server.aligners.alignment_format import AlignmentFormat
 
 
 class Hubalign(Aligner):
@@ -22,6 +20,9 @@ class Hubalign(Aligner):
         # network in the process of making the skeleton.
         self.d = d
 
+    # HubAlign puts the smaller network first
+    output_format = AlignmentFormat('net1.tab-net2.tab.alignment', delimiter=' ', drop_empty=True, smaller_net_first=True)
+
     @property
     def name(self):
         return 'hubalign'
@@ -40,31 +41,22 @@ class Hubalign(Aligner):
 
         return ret
 
+    def estimate_resources(self, net1, net2, *args):
+        # HubAlign keeps a few dense n1 x n2 matrices of doubles
+        cpus, memory_bytes = super().estimate_resources(net1, net2)
+        return cpus, memory_bytes + 3 * 8 * net1.igraph.vcount() * net2.igraph.vcount()
+
     def write_files(self, run_dir_path, net1, net2, blast_net1_net2):
         super().write_files(run_dir_path)
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing net1.tab')
-        net1_path = path.join(run_dir_path, 'net1.tab')
-        net1.write_tsv_edgelist(net1_path)
+        self._write_input(run_dir_path, 'net1.tab', net1.write_tsv_edgelist,
+                          'tsv_edgelist', net1.content_fingerprint)
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing net2.tab')
-        net2_path = path.join(run_dir_path, 'net2.tab')
-        net2.write_tsv_edgelist(net2_path)
+        self._write_input(run_dir_path, 'net2.tab', net2.write_tsv_edgelist,
+                          'tsv_edgelist', net2.content_fingerprint)
 
         if blast_net1_net2 is not None:
-            self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing blast-net1-net2.tab')
-            blast_path = path.join(run_dir_path, 'blast-net1-net2.tab')
-            blast_net1_net2.write_tricol(blast_path)
+            self._write_input(run_dir_path, 'blast-net1-net2.tab', blast_net1_net2.write_tricol,
+                              'tricol', blast_net1_net2.content_fingerprint)
         elif self.alpha < 1:
             raise ValueError('must provide a BLAST matrix whenever alpha < 1')
-
-    def import_alignment(self, net1, net2, execution_dir, file_name='net1.tab-net2.tab.alignment'):
-        align_path = path.join(execution_dir, file_name)
-        alignment = [(a,b) for a, b in iter_csv(align_path, delimiter=' ', skipinitialspace=False)
-                           if a != '' and b != '']
-
-        header = (net1.name, net2.name)
-        if net1.igraph.vcount() > net2.igraph.vcount():
-            alignment = [(b,a) for a,b in alignment]
-
-        return header, alignment
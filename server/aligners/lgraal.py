@@ -1,9 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
 from os import path
 import os
+import shutil
 import subprocess
+import tempfile
 
+from server.aligners.accounting import check_call_with_usage
 from server.aligners.aligner import Aligner
-from server.util import iter_csv
+from server.aligners.alignment_format import AlignmentFormat
+from server.metrics import child_span
+from server.util import file_sha1
 
 
 class LGraal(Aligner):
@@ -18,10 +24,17 @@ class LGraal(Aligner):
         # -L [ --timelimit ] arg (=3600) Time limit in seconds
         self.timelimit = timelimit
 
+    output_format = AlignmentFormat('alignment-net1-net2.tab', delimiter='\t', strip=True, drop_empty=True)
+
     @property
     def name(self):
         return 'lgraal'
 
+    @property
+    def timeout(self):
+        # l-graal stops by itself after timelimit seconds, leave it some margin
+        return self.timelimit + 600
+
     @property
     def cmd(self):
         return [
@@ -38,15 +51,16 @@ class LGraal(Aligner):
             '-o', 'alignment-net1-net2.tab'
         ]
 
-    def _fix_leda_for_ncount4(self, in_path, out_path):
-        with open(in_path, 'r') as in_f:
-            with open(out_path, 'w') as out_f:
-                out_f.writelines(line for line in in_f if not line.startswith('#'))
+    def estimate_resources(self, net1, net2, *args):
+        # graphlet degree vectors plus a dense n1 x n2 similarity matrix
+        cpus, memory_bytes = super().estimate_resources(net1, net2)
+        n1, n2 = net1.igraph.vcount(), net2.igraph.vcount()
+        return cpus, memory_bytes + 8 * n1 * n2 + 2 * 73 * 8 * (n1 + n2)
 
     def _write_net(self, net, net_path):
-        net.write_leda(net_path + '.tmp', names='name', weights=None)
-        self._fix_leda_for_ncount4(net_path + '.tmp', net_path)
-        os.remove(net_path + '.tmp')
+        # canonical edge order, the ncount4 signatures are cached by the hash
+        # of this file
+        net.write_ncount4_leda(net_path, names='name', sort_edges=True)
 
     def _run_ncount4(self, run_dir_path, net_path, dest_path):
         ncount4_path = path.join(run_dir_path, 'ncount4')
@@ -56,33 +70,69 @@ class LGraal(Aligner):
         cmd = [ncount4_path, net_path, dest_path]
 
         with open(dest_path + '.log', 'w+') as logfile:
-            subprocess.check_call(cmd, stdout=logfile, stderr=subprocess.STDOUT)
+            check_call_with_usage(cmd, usage=self.helper_usage, memory_limit=self.run_memory_limit,
+                                  stdout=logfile, stderr=subprocess.STDOUT)
+
+    def _compute_signatures(self, run_dir_path, net_path, dump_path):
+        # runs ncount4 in a scratch directory and keeps only its .ndump2 output
+        scratch_path = tempfile.mkdtemp(dir=path.dirname(dump_path), prefix='ncount4-')
+
+        try:
+            self._run_ncount4(run_dir_path, net_path, path.join(scratch_path, 'out', 'net'))
+            os.rename(path.join(scratch_path, 'out', 'net.ndump2'), dump_path)
+        finally:
+            shutil.rmtree(scratch_path, ignore_errors=True)
+
+    def _write_signatures(self, run_dir_path, net_path, dest_path):
+        # graphlet signatures only depend on the LEDA file (and the ncount4
+        # binary), so they are shared through the artifact store when possible
+        self.logger.info(f'run_{self.name} @ {run_dir_path}: ncount4 signatures for {path.basename(net_path)}')
+
+        with child_span(self.setup_span, 'ncount4', file=path.basename(net_path)) as span:
+            if self.artifacts is None:
+                self._run_ncount4(run_dir_path, net_path, dest_path)
+            else:
+                os.makedirs(path.dirname(dest_path))
+
+                ncount4_path = path.join(run_dir_path, 'ncount4')
+                key = self.artifacts.make_key('ncount4', file_sha1(ncount4_path), file_sha1(net_path))
+
+                span.attrs['cached'] = not self.artifacts.link(
+                    key, lambda dump_path: self._compute_signatures(run_dir_path, net_path, dump_path), dest_path + '.ndump2')
+
+            span.set(bytes=path.getsize(dest_path + '.ndump2'))
 
     def write_files(self, run_dir_path, net1, net2, blast_net1_net2):
         super().write_files(run_dir_path)
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing net1.gw')
-        net1_path = path.join(run_dir_path, 'net1.gw')
-        self._write_net(net1, net1_path)
+        net1_path = self._write_input(run_dir_path, 'net1.gw', lambda file_path: self._write_net(net1, file_path),
+                                      'ncount4_leda', net1.content_fingerprint)
+
+        net2_path = self._write_input(run_dir_path, 'net2.gw', lambda file_path: self._write_net(net2, file_path),
+                                      'ncount4_leda', net2.content_fingerprint)
+
+        self._write_input(run_dir_path, 'blast-net1-net2.tab', blast_net1_net2.write_tricol,
+                          'tricol', blast_net1_net2.content_fingerprint)
+
+        # ncount4 is single-threaded, count both networks at the same time
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(self._write_signatures, run_dir_path, net1_path, path.join(run_dir_path, 'ncount4-net1', 'net1')),
+                executor.submit(self._write_signatures, run_dir_path, net2_path, path.join(run_dir_path, 'ncount4-net2', 'net2')),
+            ]
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing net2.gw')
-        net2_path = path.join(run_dir_path, 'net2.gw')
-        self._write_net(net2, net2_path)
+            for future in futures:
+                future.result()
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing blast-net1-net2.tab')
-        blast_net1_net2_path = path.join(run_dir_path, 'blast-net1-net2.tab')
-        blast_net1_net2.write_tricol(blast_net1_net2_path)
+    def precompute_signatures(self, net, run_dir_base_path, template_dir_base_path, artifacts):
+        # fills the artifact store with the LEDA file and ncount4 signatures of net
+        self.artifacts = artifacts
+        os.makedirs(run_dir_base_path, exist_ok=True)
 
-        self.logger.info(f'run_{self.name} @ {run_dir_path}: running ncount4 for net1.gw')
-        ncount4_net1_path = path.join(run_dir_path, 'ncount4-net1', 'net1')
-        self._run_ncount4(run_dir_path, net1_path, ncount4_net1_path)
+        with tempfile.TemporaryDirectory(dir=run_dir_base_path, prefix=self.name + '-warmup-') as run_dir_path:
+            self._link_template(run_dir_path, template_dir_base_path)
 
-        self.logger.info(f'run_{self.name} @ {run_dir_path}: running ncount4 for net2.gw')
-        ncount4_net2_path = path.join(run_dir_path, 'ncount4-net2', 'net2')
-        self._run_ncount4(run_dir_path, net2_path, ncount4_net2_path)
+            net_path = self._write_input(run_dir_path, 'net.gw', lambda file_path: self._write_net(net, file_path),
+                                         'ncount4_leda', net.content_fingerprint)
 
-    def import_alignment(self, net1, net2, execution_dir, file_name='alignment-net1-net2.tab'):
-        header = (net1.name, net2.name)
-        align_path = path.join(execution_dir, file_name)
-        return header, [(a.strip(), b.strip()) for a, b in iter_csv(align_path, delimiter='\t')
-                                               if a.strip() != '' and b.strip() != '']
+            self._write_signatures(run_dir_path, net_path, path.join(run_dir_path, 'ncount4-net', 'net'))
@@ -1,13 +1,14 @@
-from os import path
-
 from server.aligners.aligner import Aligner
-from server.util import iter_csv
+from server.aligners.alignment_format import AlignmentFormat
 
 
 class Pinalog(Aligner):
     def __init__(self):
         super().__init__()
 
+    # protein pairs followed by their similarity score
+    output_format = AlignmentFormat('net1_net2.pinalog.nodes_algn.txt', delimiter='\t')
+
     @property
     def name(self):
         return 'pinalog'
@@ -19,19 +20,11 @@ class Pinalog(Aligner):
     def write_files(self, run_dir_path, net1, net2, blast_net1_net2):
         super().write_files(run_dir_path)
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing net1.tab')
-        net1_path = path.join(run_dir_path, 'net1.tab')
-        net1.write_tsv_edgelist(net1_path)
-
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing net2.tab')
-        net2_path = path.join(run_dir_path, 'net2.tab')
-        net2.write_tsv_edgelist(net2_path)
+        self._write_input(run_dir_path, 'net1.tab', net1.write_tsv_edgelist,
+                          'tsv_edgelist', net1.content_fingerprint)
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing blast-net1-net2.tab')
-        blast_path = path.join(run_dir_path, 'blast-net1-net2.tab')
-        blast_net1_net2.write_tricol(blast_path)
+        self._write_input(run_dir_path, 'net2.tab', net2.write_tsv_edgelist,
+                          'tsv_edgelist', net2.content_fingerprint)
 
-    def import_alignment(self, net1, net2, execution_dir, file_name='net1_net2.pinalog.nodes_algn.txt'):
-        header = (net1.name, net2.name)
-        align_path = path.join(execution_dir, file_name)
-        return header, [(a, b) for a, b, some_score in iter_csv(align_path, delimiter='\t')]
+        self._write_input(run_dir_path, 'blast-net1-net2.tab', blast_net1_net2.write_tricol,
+                          'tricol', blast_net1_net2.content_fingerprint)
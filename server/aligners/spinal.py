@@ -1,8 +1,5 @@
-from itertools import islice
-from os import path
-
 from server.aligners.aligner import Aligner
-from server.util import iter_csv
+from server.aligners.alignment_format import AlignmentFormat
 
 
 class Spinal(Aligner):
@@ -10,6 +7,9 @@ class Spinal(Aligner):
         super().__init__()
         self.alpha = alpha
 
+    # vertex indices, after two comment lines
+    output_format = AlignmentFormat('alignment-net1-net2.csv', delimiter=' ', skip_rows=2, by='index', skip_initial_space=True)
+
     @property
     def name(self):
         return 'spinal'
@@ -23,38 +23,20 @@ class Spinal(Aligner):
             str(self.alpha)
         ]
 
+    def estimate_resources(self, net1, net2, *args):
+        # SPINAL keeps dense n1 x n2 similarity matrices of doubles
+        cpus, memory_bytes = super().estimate_resources(net1, net2)
+        return cpus, memory_bytes + 2 * 8 * net1.igraph.vcount() * net2.igraph.vcount()
+
     def write_files(self, run_dir_path, net1, net2, blast_net1_net2):
         super().write_files(run_dir_path)
 
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing net1.gml')
-        net1_path = path.join(run_dir_path, 'net1.gml')
-        net1.write_gml(net1_path)
-
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing net2.gml')
-        net2_path = path.join(run_dir_path, 'net2.gml')
-        net2.write_gml(net2_path)
-
-        self.logger.debug(f'run_{self.name} @ {run_dir_path}: writing blast-net1-net2.csv')
-        blast_path = path.join(run_dir_path, 'blast-net1-net2.csv')
-        blast_net1_net2.write_tricol(blast_path, by='index', delimiter=' ')
-
-    def iter_alignment_ids(self, execution_dir, file_name='alignment-net1-net2.csv'):
-        alignment_path = path.join(execution_dir, file_name)
-
-        # ignore the first two lines, they seem to be comments
-        csv_rows = iter_csv(alignment_path, delimiter=' ')
-        csv_rows = islice(csv_rows, 2, None)
-
-        for p1id, p2id in csv_rows:
-            yield int(p1id), int(p2id)
-
-    def iter_alignment(self, net1, net2, execution_dir, file_name='alignment-net1-net2.csv'):
-        net1_vs = net1.igraph.vs
-        net2_vs = net2.igraph.vs
+        self._write_input(run_dir_path, 'net1.gml', net1.write_gml,
+                          'gml', net1.content_fingerprint)
 
-        for p1id, p2id in self.iter_alignment_ids(execution_dir, file_name):
-            yield net1_vs[p1id]['name'], net2_vs[p2id]['name']
+        self._write_input(run_dir_path, 'net2.gml', net2.write_gml,
+                          'gml', net2.content_fingerprint)
 
-    def import_alignment(self, net1, net2, execution_dir, file_name='alignment-net1-net2.csv'):
-        header = (net1.name, net2.name)
-        return header, list(self.iter_alignment(net1, net2, execution_dir, file_name))
+        self._write_input(run_dir_path, 'blast-net1-net2.csv',
+                          lambda file_path: blast_net1_net2.write_tricol(file_path, by='index', delimiter=' '),
+                          'tricol_index_space', blast_net1_net2.content_fingerprint)
@@ -0,0 +1,192 @@
+import hashlib
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+
+# version of the .npz layout below, stored in the files themselves
+ALIGNMENT_NPZ_VERSION = 1
+
+
+def encode_names(names):
+    # protein names as a newline-separated utf-8 blob
+    return '\n'.join(names).encode('utf-8')
+
+
+def decode_names(data):
+    return np.array(data.decode('utf-8').split('\n') if data else [], dtype=object)
+
+
+def names_key(data):
+    # content address of an encoded list of names
+    return 'names/' + hashlib.sha1(data).hexdigest()
+
+
+def _with_missing(names):
+    # appends NaN so that taking code -1 gives a missing value
+    return np.append(names, np.array([np.nan], dtype=object))
+
+
+class AlignmentColumns(object):
+    # An alignment as two dictionary-encoded columns: for each side, a list of
+    # protein names (object array) and an int32 code into it per aligned pair,
+    # -1 meaning missing. columns are the (net1, net2) column names of the
+    # alignment DataFrame.
+    #
+    # Stored alignments use the vertex names of the networks as dictionaries,
+    # so that all the alignments of a network pair share them: the .npz file
+    # only has the codes, and the names are stored once per network (see
+    # encode_names and names_key).
+
+    def __init__(self, columns, net1_names, net1_codes, net2_names, net2_codes):
+        self.columns = list(columns)
+        self.net1_names = net1_names
+        self.net1_codes = net1_codes
+        self.net2_names = net2_names
+        self.net2_codes = net2_codes
+
+    def __len__(self):
+        return len(self.net1_codes)
+
+    @classmethod
+    def from_dataframe(cls, alignment):
+        net1_codes, net1_names = pd.factorize(alignment.index.to_numpy())
+        net2_codes, net2_names = pd.factorize(alignment.iloc[:, 0].to_numpy())
+
+        return cls([alignment.index.name, alignment.columns[0]],
+                   np.asarray(net1_names, dtype=object), net1_codes.astype(np.int32),
+                   np.asarray(net2_names, dtype=object), net2_codes.astype(np.int32))
+
+    @classmethod
+    def from_networks(cls, alignment, net1, net2):
+        # codes are vertex indices; None if some protein is not in its network
+        net1_codes = net1.lookup_vertices(alignment.index.to_numpy()).astype(np.int32)
+        net2_codes = net2.lookup_vertices(alignment.iloc[:, 0].to_numpy()).astype(np.int32)
+
+        if np.any(net1_codes < 0) or np.any(net2_codes < 0):
+            return None
+
+        return cls([alignment.index.name, alignment.columns[0]],
+                   np.array(net1.igraph.vs['name'], dtype=object), net1_codes,
+                   np.array(net2.igraph.vs['name'], dtype=object), net2_codes)
+
+    def to_dataframe(self):
+        net1 = _with_missing(self.net1_names)[self.net1_codes]
+        net2 = _with_missing(self.net2_names)[self.net2_codes]
+
+        return pd.DataFrame({self.columns[1]: net2}, index=pd.Index(net1, name=self.columns[0]), copy=False)
+
+    def to_npz(self):
+        # the codes only, loadable with np.load(..., allow_pickle=False);
+        # uncompressed, GridFS uploads may be compressed on their own
+        f = BytesIO()
+        np.savez(f,
+                 version=np.array([ALIGNMENT_NPZ_VERSION], dtype=np.int32),
+                 columns=np.frombuffer(encode_names(self.columns), dtype=np.uint8),
+                 net1_codes=self.net1_codes,
+                 net2_codes=self.net2_codes)
+        return f.getvalue()
+
+    @classmethod
+    def from_npz(cls, data, net1_names, net2_names):
+        with np.load(BytesIO(data), allow_pickle=False) as npz:
+            version = int(npz['version'][0])
+            if version != ALIGNMENT_NPZ_VERSION:
+                raise ValueError(f'unsupported alignment npz version {version}')
+
+            return cls(decode_names(npz['columns'].tobytes()).tolist(),
+                       net1_names, npz['net1_codes'], net2_names, npz['net2_codes'])
+
+
+class JoinedAlignments(object):
+    # Outer join of several alignments on their net1 proteins: table is the
+    # DataFrame (net1 proteins as index, one net2 column per alignment), and
+    # codes the same net2 columns as an int32 matrix of codes into names,
+    # -1 where a protein is unaligned.
+
+    def __init__(self, table, codes, names):
+        self.table = table
+        self.codes = codes
+        self.names = names
+
+    def __len__(self):
+        return len(self.table)
+
+    @classmethod
+    def from_table(cls, table):
+        codes, names = pd.factorize(table.to_numpy().ravel())
+        return cls(table, codes.astype(np.int32).reshape(table.shape), np.asarray(names, dtype=object))
+
+
+def _common_dictionary(dictionaries):
+    # union of several lists of names, and for each one (by id) the codes of
+    # its names into the union, with a trailing -1 so that code -1 maps to -1
+    dictionaries = list(dictionaries)
+    codes, names = pd.factorize(np.concatenate(dictionaries)) if dictionaries else (np.array([]), [])
+
+    mappings = dict()
+    offset = 0
+    for dictionary in dictionaries:
+        mappings[id(dictionary)] = np.append(codes[offset:offset + len(dictionary)], -1).astype(np.int32)
+        offset += len(dictionary)
+
+    return np.asarray(names, dtype=object), mappings
+
+
+def join_alignments(alignments, labels):
+    # JoinedAlignments of alignments, with the net2 column of each one
+    # suffixed by its label; the same table as joining their DataFrames, with
+    # the rows sorted by protein. Rows are matched on codes: every distinct
+    # net1 dictionary (usually one, shared by all the alignments) is mapped
+    # once to the sorted joined proteins, and every distinct net2 dictionary
+    # to a common one. Alignments mapping a protein more than once, or with
+    # missing or non-string proteins, are joined with pandas instead.
+    columns = [f'{alignment.columns[1]}_{label}' for alignment, label in zip(alignments, labels)]
+
+    dictionaries = dict()
+    simple = True
+
+    for alignment in alignments:
+        codes = alignment.net1_codes
+
+        if np.any(codes < 0) or len(np.unique(codes)) != len(codes):
+            simple = False
+            break
+
+        names, used = dictionaries.setdefault(id(alignment.net1_names),
+                                              (alignment.net1_names, np.zeros(len(alignment.net1_names), dtype=bool)))
+        used[codes] = True
+
+    simple = simple and all(isinstance(name, str) for names, used in dictionaries.values() for name in names[used])
+
+    if not simple:
+        frames = [alignment.to_dataframe() for alignment in alignments]
+        for frame, column in zip(frames, columns):
+            frame.columns = [column]
+
+        table = frames[0].join(frames[1:], how='outer').sort_index().rename_axis(index=alignments[0].columns[0])
+        return JoinedAlignments.from_table(table)
+
+    proteins = np.unique(np.concatenate([names[used].astype(str) for names, used in dictionaries.values()]))
+
+    positions = dict()
+    for key, (names, used) in dictionaries.items():
+        positions[key] = np.full(len(names), -1, dtype=np.int64)
+        positions[key][used] = np.searchsorted(proteins, names[used].astype(str))
+
+    net2_dictionaries = {id(alignment.net2_names): alignment.net2_names for alignment in alignments}
+    names, mappings = _common_dictionary(net2_dictionaries.values())
+
+    codes = np.full((len(proteins), len(alignments)), -1, dtype=np.int32)
+
+    for i, alignment in enumerate(alignments):
+        rows = positions[id(alignment.net1_names)][alignment.net1_codes]
+        codes[rows, i] = mappings[id(alignment.net2_names)][alignment.net2_codes]
+
+    names_with_missing = _with_missing(names)
+    table = pd.DataFrame({column: names_with_missing[codes[:, i]] for i, column in enumerate(columns)},
+                         index=pd.Index(proteins.astype(object), name=alignments[0].columns[0]),
+                         columns=columns, copy=False)
+
+    return JoinedAlignments(table, codes, names)
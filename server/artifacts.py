@@ -0,0 +1,139 @@
+from collections import Counter
+from contextlib import contextmanager
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+from os import path
+import shutil
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactStore(object):
+    # Content-addressed store of files shared by all worker processes. Files
+    # are created once per key (under a per-key file lock, so concurrent
+    # workers wait for the first one instead of writing the same file), kept
+    # read-only and hardlinked wherever they are needed. The store is bounded
+    # by max_bytes, evicting the least recently used files (by mtime, which is
+    # refreshed on every use).
+
+    LOCK_STRIPES = 256
+
+    def __init__(self, base_path, max_bytes):
+        self.base_path = base_path
+        self.max_bytes = max_bytes
+        self.counters = Counter()
+
+        for subdir in ['objects', 'locks', 'tmp']:
+            os.makedirs(path.join(base_path, subdir), exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        h = hashlib.sha1()
+        for part in parts:
+            part = str(part)
+            h.update(f'{len(part)}:{part}'.encode('utf-8'))
+        return h.hexdigest()
+
+    def object_path(self, key):
+        return path.join(self.base_path, 'objects', key[:2], key)
+
+    @contextmanager
+    def _locked(self, name, blocking=True):
+        with open(path.join(self.base_path, 'locks', name), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _key_lock(self, key):
+        # lock striping keeps the number of lock files bounded
+        stripe = int(key[:2], 16) % self.LOCK_STRIPES
+        return self._locked(f'{stripe:02x}.lock')
+
+    def _create(self, key, create):
+        object_path = self.object_path(key)
+        tmp_path = path.join(self.base_path, 'tmp', f'{key}-{os.getpid()}-{uuid.uuid4().hex}')
+
+        try:
+            create(tmp_path)
+            os.chmod(tmp_path, 0o444)
+            os.makedirs(path.dirname(object_path), exist_ok=True)
+            os.replace(tmp_path, object_path)
+        finally:
+            if path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def link(self, key, create, dest_path):
+        # makes dest_path a (read-only) copy of the artifact, calling
+        # create(file_path) to write it if it is not in the store yet; returns
+        # whether it was created
+        with self._key_lock(key):
+            object_path = self.object_path(key)
+
+            created = not path.exists(object_path)
+
+            if created:
+                self.counters['misses'] += 1
+                self._create(key, create)
+            else:
+                self.counters['hits'] += 1
+                os.utime(object_path)
+
+            try:
+                os.link(object_path, dest_path)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.copyfile(object_path, dest_path)
+
+        if created:
+            self.evict()
+
+        return created
+
+    def _iter_objects(self):
+        objects_path = path.join(self.base_path, 'objects')
+
+        for prefix in os.scandir(objects_path):
+            if prefix.is_dir():
+                for entry in os.scandir(prefix.path):
+                    yield entry.name, entry.stat()
+
+    def evict(self):
+        # only one process evicts at a time, the others skip it
+        with self._locked('evict.lock', blocking=False) as acquired:
+            if not acquired:
+                return
+
+            objects = sorted(self._iter_objects(), key=lambda obj: obj[1].st_mtime)
+            total_bytes = sum(stat.st_size for _, stat in objects)
+
+            for key, stat in objects:
+                if total_bytes <= self.max_bytes:
+                    break
+
+                with self._key_lock(key):
+                    try:
+                        # skip files used since the scan
+                        if os.stat(self.object_path(key)).st_mtime != stat.st_mtime:
+                            continue
+                        os.remove(self.object_path(key))
+                    except FileNotFoundError:
+                        continue
+
+                total_bytes -= stat.st_size
+                self.counters['evictions'] += 1
+                logger.debug(f'evicted artifact {key} ({stat.st_size} bytes)')
+
+    def stats(self):
+        return dict(self.counters)
@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+
+
+CONSENSUS_METHODS = ['unanimous', 'majority']
+UNALIGNED_MODES = ['disagree', 'abstain']
+
+
+def parse_consensus_params(params):
+    # {'method': 'unanimous' | 'majority' | k, 'unaligned': 'disagree' | 'abstain'}
+    # with the defaults filled in; k is the number of alignments that must agree
+    params = dict(params or {})
+    method = params.pop('method', 'unanimous')
+    unaligned = params.pop('unaligned', 'disagree')
+
+    if params:
+        raise ValueError(f'unknown consensus parameters: {sorted(params)}')
+
+    if isinstance(method, bool) or not (method in CONSENSUS_METHODS or isinstance(method, int) and method >= 1):
+        raise ValueError(f'invalid consensus method: {method!r}')
+
+    if unaligned not in UNALIGNED_MODES:
+        raise ValueError(f'invalid handling of unaligned proteins: {unaligned!r}')
+
+    return {'method': method, 'unaligned': unaligned}
+
+
+def vote(codes):
+    # For each row of a code matrix, the most repeated code (among the
+    # non-missing ones), its support (number of columns with it) and the
+    # number of voters (non-missing columns). Ties go to the code of the
+    # leftmost column. Rows without voters get code -1 and support 0.
+    n_rows, n_columns = codes.shape
+
+    flat = codes.ravel()
+    aligned = flat >= 0
+    positions = np.flatnonzero(aligned)
+    rows = positions // n_columns
+
+    # (row, code) pairs as single keys, with their count and first column
+    n_codes = (int(flat.max()) if flat.size else -1) + 1
+    keys = rows.astype(np.int64) * n_codes + flat[aligned]
+    keys, first, support = np.unique(keys, return_index=True, return_counts=True)
+    key_rows = rows[first]
+    first_columns = positions[first] % n_columns
+
+    # the best candidate of each row comes first
+    order = np.lexsort((first_columns, -support, key_rows))
+    best = order[np.r_[True, key_rows[order][1:] != key_rows[order][:-1]]] if len(order) else order
+
+    best_codes = np.full(n_rows, -1, dtype=np.int32)
+    best_support = np.zeros(n_rows, dtype=np.int32)
+    best_codes[key_rows[best]] = flat[positions[first[best]]]
+    best_support[key_rows[best]] = support[best]
+
+    voters = np.count_nonzero(codes >= 0, axis=1).astype(np.int32)
+
+    return best_codes, best_support, voters
+
+
+def consensus_mask(support, voters, n_alignments, method='unanimous', unaligned='disagree'):
+    # rows whose best code has enough support. Unaligned proteins count as
+    # votes against it (disagree), or are left out of the vote (abstain)
+    total = np.full_like(voters, n_alignments) if unaligned == 'disagree' else voters
+
+    if method == 'unanimous':
+        required = total
+    elif method == 'majority':
+        required = total // 2 + 1
+    else:
+        required = np.full_like(voters, method)
+
+    return (support > 0) & (support >= required)
+
+
+def compute_consensus(joined, net1_column, net2_column, method='unanimous', unaligned='disagree'):
+    # the consensus alignment of some JoinedAlignments, with the support of
+    # each pair (number of alignments agreeing on it) as an extra column
+    best_codes, support, voters = vote(joined.codes)
+
+    mask = consensus_mask(support, voters, joined.codes.shape[1], method, unaligned)
+
+    consensus = pd.DataFrame({net2_column: joined.names[best_codes[mask]], 'support': support[mask]},
+                             index=pd.Index(joined.table.index.to_numpy()[mask], name=net1_column))
+
+    return consensus
+
+
+def _edge_keys(edges, n_vertices, directed):
+    # edges as single int64 keys, unordered unless directed
+    sources, targets = edges[:, 0], edges[:, 1]
+    if not directed:
+        sources, targets = np.minimum(sources, targets), np.maximum(sources, targets)
+    return sources * n_vertices + targets
+
+
+def _divide(a, b):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(b > 0, a / np.maximum(b, 1), np.nan)
+
+
+def conserved_edges(codes, names, net1_proteins, net1, net2):
+    # boolean matrix (net1 edge, alignment): whether each alignment maps the
+    # edge to an edge of net2. Only the edges between proteins of the joined
+    # table (rows of codes, named net1_proteins) are considered.
+    row_vertices = net1.lookup_vertices(net1_proteins)
+    aligned_rows = np.flatnonzero(row_vertices >= 0)
+
+    vertex_rows = np.full(net1.igraph.vcount(), -1, dtype=np.int64)
+    vertex_rows[row_vertices[aligned_rows]] = aligned_rows
+
+    edge_rows = vertex_rows[net1.edge_array()]
+    edge_rows = edge_rows[np.all(edge_rows >= 0, axis=1)]
+
+    # net2 vertex of each code, with code -1 (unaligned) mapped to -1 as well
+    code_vertices = np.append(net2.lookup_vertices(names), -1)
+
+    n2 = net2.igraph.vcount()
+    directed = net2.igraph.is_directed()
+    # hash index of the net2 edges, much faster than searchsorted on them
+    net2_keys = pd.Index(pd.unique(_edge_keys(net2.edge_array(), n2, directed)))
+
+    conserved = np.zeros((len(edge_rows), codes.shape[1]), dtype=bool)
+
+    for i in range(codes.shape[1]):
+        images = code_vertices[codes[edge_rows, i]]
+        keys = _edge_keys(images, n2, directed)
+        conserved[:, i] = (images[:, 0] >= 0) & (images[:, 1] >= 0) & (net2_keys.get_indexer(keys) >= 0)
+
+    return conserved
+
+
+def _common_counts(matrix, chunk_rows=1 << 16):
+    # matrix.T @ matrix of a boolean matrix, counting in float32 chunks small
+    # enough to be exact
+    n = matrix.shape[1]
+    counts = np.zeros((n, n), dtype=np.int64)
+
+    for start in range(0, len(matrix), chunk_rows):
+        chunk = matrix[start:start + chunk_rows].astype(np.float32)
+        counts += np.rint(chunk.T @ chunk).astype(np.int64)
+
+    return counts
+
+
+def alignment_similarity(joined, labels, net1, net2):
+    # Pairwise statistics of some JoinedAlignments, as N x N
+    # matrices indexed by labels:
+    #   common_pairs:             pairs (protein, image) in both alignments;
+    #                             the diagonal is the size of each alignment
+    #   node_correctness_overlap: common pairs over the pairs of the row
+    #                             alignment, i.e. the node correctness of the
+    #                             column alignment taking the row one as truth
+    #   pairs_jaccard:            common pairs over the pairs in either
+    #   common_conserved_edges:   net1 edges conserved by both alignments;
+    #                             the diagonal, the edges each one conserves
+    #   conserved_edges_jaccard:  common conserved edges over the edges
+    #                             conserved by either
+    codes = joined.codes
+    n = codes.shape[1]
+
+    aligned = codes >= 0
+    n_pairs = np.count_nonzero(aligned, axis=0)
+
+    common_pairs = np.empty((n, n), dtype=np.int64)
+    for i in range(n):
+        common_pairs[i] = np.count_nonzero((codes == codes[:, [i]]) & aligned, axis=0)
+
+    conserved = conserved_edges(codes, joined.names, joined.table.index.to_numpy(), net1, net2)
+    n_conserved = np.count_nonzero(conserved, axis=0)
+    common_conserved = _common_counts(conserved)
+
+    def frame(matrix):
+        return pd.DataFrame(matrix, index=labels, columns=labels)
+
+    return {
+        'common_pairs': frame(common_pairs),
+        'node_correctness_overlap': frame(_divide(common_pairs, n_pairs[:, None])),
+        'pairs_jaccard': frame(_divide(common_pairs, n_pairs[:, None] + n_pairs[None, :] - common_pairs)),
+        'common_conserved_edges': frame(common_conserved),
+        'conserved_edges_jaccard': frame(_divide(common_conserved,
+                                                 n_conserved[:, None] + n_conserved[None, :] - common_conserved)),
+    }
+
+
+def similarity_table(matrices):
+    # one row per ordered pair of alignments, one column per statistic
+    table = pd.concat({statistic: matrix.stack() for statistic, matrix in matrices.items()}, axis=1)
+    return table.rename_axis(index=['aligner_1', 'aligner_2']).reset_index()
+
+
+def _nan_to_none(values):
+    return [None if np.isnan(value) else float(value) for value in values]
+
+
+def similarity_summary(matrices):
+    # sizes of the alignments, and means and minima of the statistics over
+    # the distinct pairs of alignments, overall and per aligner
+    labels = matrices['common_pairs'].index
+    off_diagonal = ~np.eye(len(labels), dtype=bool)
+
+    summary = {
+        'aligners': labels.tolist(),
+        'pairs': np.diag(matrices['common_pairs']).tolist(),
+        'conserved_edges': np.diag(matrices['common_conserved_edges']).tolist(),
+    }
+
+    for statistic in ['node_correctness_overlap', 'pairs_jaccard', 'conserved_edges_jaccard']:
+        values = np.where(off_diagonal, matrices[statistic].to_numpy(), np.nan)
+        defined = ~np.isnan(values)
+
+        overall = values[defined]
+        summary[f'mean_{statistic}'] = float(overall.mean()) if len(overall) else None
+        summary[f'min_{statistic}'] = float(overall.min()) if len(overall) else None
+
+        counts = np.count_nonzero(defined, axis=1)
+        summary[f'aligner_mean_{statistic}'] = _nan_to_none(_divide(np.where(defined, values, 0).sum(axis=1), counts))
+
+    return summary
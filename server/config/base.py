@@ -32,3 +32,69 @@ CELERY_TASK_QUEUES = [
 
 FINISHED_ALIGNMENT_URL = env('FINISHED_ALIGNMENT_URL')
 FINISHED_COMPARISON_URL = env('FINISHED_COMPARISON_URL')
+
+# per-process cache of StringDB networks, bitscores and GO annotations (0 disables it)
+STRINGDB_CACHE_MAX_BYTES = env.int('STRINGDB_CACHE_MAX_BYTES', 512 * 1024**2)
+
+# fetch STRING edges and BLAST rows with binary COPY instead of fetchall()
+STRINGDB_BULK_FETCH = env.bool('STRINGDB_BULK_FETCH', True)
+
+# split bitscore queries into ranges of net1 proteins run concurrently (at most
+# STRINGDB_POOL_MAXSIZE of them, the connections available to run them)
+STRINGDB_BITSCORE_PARTITIONS = env.int('STRINGDB_BITSCORE_PARTITIONS', 4)
+STRINGDB_BITSCORE_PARTITION_MIN_PROTEINS = env.int('STRINGDB_BITSCORE_PARTITION_MIN_PROTEINS', 5000)
+
+# derive score-thresholded networks from one cached fetch of all scored links
+STRINGDB_DERIVE_SCORE_THRESHOLDS = env.bool('STRINGDB_DERIVE_SCORE_THRESHOLDS', True)
+
+# StringDB connections per worker process (the aligner queue runs 8 of them), for
+# regular queries and, in a pool of their own, for the binary COPY ones
+STRINGDB_POOL_MAXSIZE = env.int('STRINGDB_POOL_MAXSIZE', 2)
+
+# content-addressed store of aligner input files shared by the worker processes
+# (it must be on the same filesystem as the run directories; 0 disables it)
+ALIGNER_ARTIFACTS_PATH = env('ALIGNER_ARTIFACTS_PATH', '/opt/running-alignments/.artifacts')
+ALIGNER_ARTIFACTS_MAX_BYTES = env.int('ALIGNER_ARTIFACTS_MAX_BYTES', 16 * 1024**3)
+
+# wall-clock limit in seconds for aligners that do not define their own (none by default)
+ALIGNER_TIMEOUT = env.int('ALIGNER_TIMEOUT', None)
+
+# full aligner output is written here, only its tail is kept in the results
+ALIGNER_LOGS_PATH = env('ALIGNER_LOGS_PATH', '/opt/running-alignments/logs')
+
+# address space limits (RLIMIT_AS) of aligner processes by aligner name, e.g.
+# "lgraal=16000000000,alignet=32000000000"; aligners not listed are not limited
+ALIGNER_MEMORY_LIMITS = env.dict('ALIGNER_MEMORY_LIMITS', {}, subcast=int)
+
+# seconds between samples of the memory used by a running aligner
+ALIGNER_MEMORY_SAMPLE_INTERVAL = env.float('ALIGNER_MEMORY_SAMPLE_INTERVAL', 1.0)
+
+# admission of aligner processes against a per-host cpu and memory budget,
+# shared by all worker processes through a state file (empty path disables it;
+# a 0 budget means all cpus and 80% of the physical memory)
+ALIGNER_SCHEDULER_PATH = env('ALIGNER_SCHEDULER_PATH', '/opt/running-alignments/.scheduler')
+ALIGNER_CPU_BUDGET = env.int('ALIGNER_CPU_BUDGET', 0)
+ALIGNER_MEMORY_BUDGET = env.int('ALIGNER_MEMORY_BUDGET', 0)
+ALIGNER_PIN_CPUS = env.bool('ALIGNER_PIN_CPUS', False)
+
+# aligners of a sweep job running at the same time in one worker process
+ALIGNER_SWEEP_CONCURRENCY = env.int('ALIGNER_SWEEP_CONCURRENCY', 4)
+# notified with the result ids of every finished sweep job (optional)
+FINISHED_SWEEP_URL = env('FINISHED_SWEEP_URL', None)
+
+# Prometheus metrics of the finished jobs of all the worker processes of a host,
+# written to metrics.prom in this directory (for node_exporter's textfile
+# collector; empty path disables them) and optionally served over HTTP
+METRICS_PATH = env('METRICS_PATH', '/opt/running-alignments/.metrics')
+METRICS_HTTP_PORT = env.int('METRICS_HTTP_PORT', None)
+
+# reuse the result of a previous identical alignment job (same database, data
+# version, networks, aligner and parameters) unless the job asks to "force" it
+MEMOIZE_ALIGNMENTS = env.bool('MEMOIZE_ALIGNMENTS', True)
+
+# compression of the result files stored in GridFS ('', 'gzip' or 'zstd', which
+# needs the zstandard package), recorded in their metadata; readers of the
+# files other than this server must decompress them too
+RESULT_FILES_COMPRESSION = env('RESULT_FILES_COMPRESSION', '')
+# result files of a job uploaded at the same time
+RESULT_FILES_UPLOAD_CONCURRENCY = env.int('RESULT_FILES_UPLOAD_CONCURRENCY', 4)
@@ -0,0 +1,77 @@
+from asyncio import get_event_loop
+from collections import Counter, OrderedDict
+
+
+class AsyncLRUCache(object):
+    # Process-level cache of coroutine results with a byte budget and LRU
+    # eviction. Concurrent requests for a key that is being fetched wait for
+    # the same fetch instead of starting a new one.
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.counters = Counter()
+
+        self._entries = OrderedDict()
+        self._pending = dict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _count(self, event, stats):
+        self.counters[event] += 1
+        if stats is not None:
+            stats[event] += 1
+
+    def _store(self, key, value, nbytes):
+        if nbytes > self.max_bytes:
+            return
+
+        self._entries[key] = (value, nbytes)
+        self.total_bytes += nbytes
+
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_nbytes
+            self.counters['evictions'] += 1
+
+    async def get_or_fetch(self, key, fetch, sizeof, stats=None):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self._count('hits', stats)
+            return self._entries[key][0]
+
+        if key in self._pending:
+            self._count('shared', stats)
+            return await self._pending[key]
+
+        self._count('misses', stats)
+
+        future = get_event_loop().create_future()
+        self._pending[key] = future
+
+        try:
+            value = await fetch()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # avoid "exception was never retrieved" warnings
+            raise
+        else:
+            self._store(key, value, sizeof(value))
+            future.set_result(value)
+            return value
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._pending[key]
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.counters['hits'],
+            'shared': self.counters['shared'],
+            'misses': self.counters['misses'],
+            'evictions': self.counters['evictions'],
+        }
@@ -1,35 +1,73 @@
-from aiohttp import ClientSession
-from asyncio import gather, get_event_loop
+from asyncio import ensure_future, gather, get_event_loop, Semaphore
+from collections import Counter
 from functools import reduce
+from itertools import product
 import logging
 from io import StringIO
 from json import dumps as json_dumps
 import pandas as pd
 from os import path
+import os
 import time
 
 import aligners
+from alignment_columns import AlignmentColumns, decode_names, encode_names, join_alignments, names_key
+from artifacts import ArtifactStore
+from comparison import compute_consensus, parse_consensus_params, alignment_similarity, similarity_summary, \
+    similarity_table
 from config import config
-from mongo import retrieve_file, retrieve_alignment_result, insert_alignment, insert_comparison
+from lrucache import AsyncLRUCache
+from memo import job_fingerprint
+from server.metrics import MetricsStore, Span, stage_sizes
+from mongo import retrieve_file, retrieve_alignment_result, insert_alignment, insert_comparison, \
+    get_data_version, find_memoized_alignment, SharedFile
 from server_queue import app
+from scheduler import ResourceScheduler, physical_memory_bytes
 from scores import compute_scores, split_score_data_as_tsvs
 from sources.isobaselocal import IsobaseLocal
 from sources.stringdb import StringDB
 from sources.stringdbviruslocal import StringDBVirusLocal
-from util import all_equal, write_tsv_to_string
+from util import all_equal, iter_tsv_chunks
 from aligners import load_aligner_classes
+from worker import resources as worker_resources
 
 logger = logging.getLogger(__name__)
 
 
 ALIGNERS_DISPATCHER = load_aligner_classes('aligners.json')
 
+STRINGDB_CACHE = AsyncLRUCache(config['STRINGDB_CACHE_MAX_BYTES']) \
+    if config['STRINGDB_CACHE_MAX_BYTES'] > 0 else None
 
-def connect_to_db(db_name):
+ALIGNER_ARTIFACTS = ArtifactStore(config['ALIGNER_ARTIFACTS_PATH'], config['ALIGNER_ARTIFACTS_MAX_BYTES']) \
+    if config['ALIGNER_ARTIFACTS_MAX_BYTES'] > 0 else None
+
+ALIGNER_SCHEDULER = ResourceScheduler(
+        config['ALIGNER_SCHEDULER_PATH'],
+        cpu_budget=config['ALIGNER_CPU_BUDGET'] or len(os.sched_getaffinity(0)),
+        memory_budget=config['ALIGNER_MEMORY_BUDGET'] or int(0.8 * physical_memory_bytes()),
+        pin_cpus=config['ALIGNER_PIN_CPUS']) \
+    if config['ALIGNER_SCHEDULER_PATH'] else None
+
+METRICS = MetricsStore(config['METRICS_PATH'], http_port=config['METRICS_HTTP_PORT']) \
+    if config['METRICS_PATH'] else None
+
+
+def record_metrics(span, ok, **labels):
+    if METRICS is not None:
+        METRICS.record(span.finish(), ok=ok, **labels)
+
+
+def connect_to_db(db_name, resources, span=None):
     if db_name == 'isobase':
         return IsobaseLocal('/opt/local-db/isobase')
     elif db_name == 'stringdb':
-        return StringDB()
+        return StringDB(pool=resources.stringdb_pool, fetch_cache=STRINGDB_CACHE, bulk_fetch=config['STRINGDB_BULK_FETCH'],
+                        copy_pool=resources.stringdb_copy_pool,
+                        bitscore_partitions=config['STRINGDB_BITSCORE_PARTITIONS'],
+                        bitscore_partition_min_proteins=config['STRINGDB_BITSCORE_PARTITION_MIN_PROTEINS'],
+                        derive_score_thresholds=config['STRINGDB_DERIVE_SCORE_THRESHOLDS'],
+                        span=span)
     elif db_name == 'stringdbvirus':
         return StringDBVirusLocal('/opt/local-db/stringdb-virus')
     else:
@@ -49,6 +87,63 @@ async def db_get_network(db, net_desc):
     elif isinstance(db, StringDBVirusLocal):
         return await db.get_network(net_desc['host_id'], net_desc['virus_id'])
 
+async def timed_stage(span, stage, coro):
+    with span.child(stage) as stage_span:
+        value = await coro
+        stage_span.set(**stage_sizes(value))
+        return value
+
+async def gather_stages(db, span, stages):
+    # stages: {stage_name: coroutine}; runs them concurrently unless the
+    # connection cannot be shared (StringDB without a pool)
+    coros = [timed_stage(span, stage, coro) for stage, coro in stages.items()]
+
+    if isinstance(db, StringDB) and db.pool is None:
+        results = [await coro for coro in coros]
+    else:
+        results = await gather(*coros)
+
+    return dict(zip(stages.keys(), results))
+
+async def fetch_inputs(job_id, db, net1_desc, net2_desc, span, self_bitscores=False):
+    # networks first, then every bitscore matrix and the GO mapping concurrently
+    logger.info(f'[{job_id}] fetching networks')
+
+    with span.child('networks') as networks_span:
+        networks = await gather_stages(db, networks_span, {
+            'net1': db_get_network(db, net1_desc),
+            'net2': db_get_network(db, net2_desc),
+        })
+
+    net1 = networks['net1']
+    net2 = networks['net2']
+
+    logger.info(f'[{job_id}] fetching bitscore matrices and GO annotations')
+
+    stages = {
+        'net1_net2_bitscores': db.get_bitscore_matrix(net1, net2, sparse=True),
+        'ontology_mapping': db.get_ontology_mapping([net1, net2]),
+    }
+
+    if self_bitscores:
+        stages.update({
+            'net1_bitscores': db.get_bitscore_matrix(net1, net1, sparse=True),
+            'net2_bitscores': db.get_bitscore_matrix(net2, net2, sparse=True),
+        })
+
+    with span.child('bitscores_and_go') as inputs_span:
+        inputs = await gather_stages(db, inputs_span, stages)
+
+    inputs.update(networks)
+
+    return inputs
+
+def fetch_cache_summary(db):
+    if isinstance(db, StringDB) and db.fetch_cache is not None:
+        return {'job': dict(db.cache_stats), 'worker': db.fetch_cache.stats()}
+    else:
+        return None
+
 def networks_summary(db_name, net1_desc, net1, net2_desc, net2):
     return {
         'db': db_name,
@@ -61,71 +156,111 @@ def networks_summary(db_name, net1_desc, net1, net2_desc, net2):
     }
 
 
-def alignment_summary(net1, net2, alignment, bitscore_matrix, ontology_mapping, files):
-    scores = compute_scores(net1, net2, alignment, bitscore_matrix, ontology_mapping)
+def alignment_summary(net1, net2, alignment, bitscore_matrix, ontology_mapping, files, span=None):
+    scores = compute_scores(net1, net2, alignment, bitscore_matrix, ontology_mapping, span=span)
     files.update(split_score_data_as_tsvs(scores))
 
     return scores
 
 
-async def process_alignment(job_id, data):
-    db_name = data['db']
-    net1_desc = data['net1']
-    net2_desc = data['net2']
-    aligner_name = data['aligner'].lower()
-    aligner_params = data.get('aligner_params', dict())
+async def run_scheduled_aligner(job_id, aligner, run_args, span, priority=0):
+    reservation = None
 
-    net1 = None
-    net2 = None
+    if ALIGNER_SCHEDULER is not None:
+        cpus, memory_bytes = aligner.estimate_resources(*run_args)
+        logger.info(f'[{job_id}] waiting for {cpus} cpus and {memory_bytes} bytes')
+
+        with span.child('schedule') as schedule_span:
+            reservation = await ALIGNER_SCHEDULER.reserve(cpus, memory_bytes, priority=priority)
+            schedule_span.set(cpus=cpus, memory_bytes=memory_bytes)
 
     try:
-        async with connect_to_db(db_name.lower()) as db:
-            logger.info(f'[{job_id}] fetching networks')
-            net1 = await db_get_network(db, net1_desc)
-            net2 = await db_get_network(db, net2_desc)
+        results = await aligner.run_async(
+            *run_args,
+            run_dir_base_path='/opt/running-alignments',
+            template_dir_base_path='/opt/aligner-templates',
+            artifacts=ALIGNER_ARTIFACTS,
+            timeout=aligner.timeout if aligner.timeout is not None else config['ALIGNER_TIMEOUT'],
+            log_dir_path=config['ALIGNER_LOGS_PATH'],
+            cpu_affinity=reservation.cpu_affinity if reservation is not None else None,
+            memory_limit=config['ALIGNER_MEMORY_LIMITS'].get(aligner.name, aligner.memory_limit),
+            memory_sample_interval=config['ALIGNER_MEMORY_SAMPLE_INTERVAL'],
+            span=span)
+    finally:
+        if reservation is not None:
+            reservation.release()
+
+    if reservation is not None:
+        results['reservation'] = reservation.summary()
+
+    return results
+
+
+def aligner_run_args(aligner_name, inputs):
+    net1 = inputs['net1']
+    net2 = inputs['net2']
+
+    if aligner_name == 'alignet':
+        return (net1, net2, inputs['net1_bitscores'], inputs['net2_bitscores'], inputs['net1_net2_bitscores'])
+    else:
+        return (net1, net2, inputs['net1_net2_bitscores'])
 
-            logger.info(f'[{job_id}] fetching bitscore matrices')
-            net1_net2_scores = await db.get_bitscore_matrix(net1, net2)
 
-            if aligner_name == 'alignet':
-                net1_scores = await db.get_bitscore_matrix(net1, net1)
-                net2_scores = await db.get_bitscore_matrix(net2, net2)
-                run_args = (net1, net2, net1_scores, net2_scores, net1_net2_scores)
-            else:
-                run_args = (net1, net2, net1_net2_scores)
+async def fetch_alignment_inputs(job_id, data, resources, span, self_bitscores=False):
+    # returns (inputs, response fields); inputs is None if fetching failed
+    response_data = {'fetch_cache': None, 'fetch_timings': dict()}
+
+    try:
+        with span.child('fetch') as fetch_span:
+            async with connect_to_db(data['db'].lower(), resources, span=fetch_span) as db:
+                inputs = await fetch_inputs(job_id, db, data['net1'], data['net2'], fetch_span,
+                                            self_bitscores=self_bitscores)
 
-            logger.info(f'[{job_id}] retrieving GO annotations')
-            ontology_mapping = await db.get_ontology_mapping([net1, net2])
+                response_data['fetch_cache'] = fetch_cache_summary(db)
 
     except Exception as e:
         logger.exception(f'[{job_id}] exception was raised fetching required data')
-        results = {'ok': False, 'exception': str(e)}
+        return None, response_data, {'ok': False, 'exception': str(e)}
 
-    else:
-        try:
-            if aligner_name not in ALIGNERS_DISPATCHER:
-                raise LookupError(f'aligner not supported: {aligner_name}')
+    finally:
+        response_data['fetch_timings'] = fetch_span.durations()
 
-            aligner = ALIGNERS_DISPATCHER[aligner_name](**aligner_params)
+    return inputs, response_data, None
 
-            results = aligner.run(
-                *run_args,
-                run_dir_base_path='/opt/running-alignments',
-                template_dir_base_path='/opt/aligner-templates')
 
-            results['exception'] = None
+async def run_alignment(job_id, aligner_name, aligner_params, inputs, span, priority=0):
+    try:
+        if aligner_name not in ALIGNERS_DISPATCHER:
+            raise LookupError(f'aligner not supported: {aligner_name}')
 
-        except Exception as e:
-            logger.exception(f'[{job_id}] exception was raised running alignment')
-            results = {'ok': False, 'exception': str(e)}
+        aligner = ALIGNERS_DISPATCHER[aligner_name](**aligner_params)
+
+        with span.child('align', aligner=aligner_name) as align_span:
+            results = await run_scheduled_aligner(job_id, aligner, aligner_run_args(aligner_name, inputs), align_span,
+                                                  priority=priority)
+
+        results['exception'] = None
+
+    except Exception as e:
+        logger.exception(f'[{job_id}] exception was raised running alignment')
+        results = {'ok': False, 'exception': str(e)}
+
+    return results
+
+
+async def alignment_response(job_id, data, aligner_name, aligner_params, results, inputs, fetch_data, span):
+    net1 = inputs['net1'] if inputs is not None else None
+    net2 = inputs['net2'] if inputs is not None else None
 
     response_data = {
         'aligner': aligner_name,
         'aligner_params': aligner_params,
         'results': results,
+        'resources': results.pop('resources', None),
         'timestamp': time.time(),
     }
-    response_data.update(networks_summary(db_name, net1_desc, net1, net2_desc, net2))
+    response_data.update(fetch_data)
+    response_data.update(networks_summary(data['db'], data['net1'], net1, data['net2'], net2))
 
     result_files = dict()
 
@@ -133,25 +268,104 @@ async def process_alignment(job_id, data):
         alignment = results['alignment']
         results['alignment'] = {'file': 'alignment_tsv'}
 
-        result_files['alignment_tsv'] = write_tsv_to_string(alignment.reset_index())
+        result_files['alignment_tsv'] = iter_tsv_chunks(alignment.reset_index())
+
+        # binary copy for the comparer, see alignment_columns
+        alignment_columns = AlignmentColumns.from_networks(alignment, net1, net2)
+
+        if alignment_columns is not None:
+            result_files['alignment_npz'] = alignment_columns.to_npz()
+
+            for key, names in [('net1_names', alignment_columns.net1_names), ('net2_names', alignment_columns.net2_names)]:
+                names_data = encode_names(names)
+                result_files[key] = SharedFile(names_key(names_data), names_data)
 
         logger.info(f'[{job_id}] computing scores')
 
         try:
-            response_data['scores'] = alignment_summary(net1, net2, alignment, net1_net2_scores, ontology_mapping, result_files)
+            # off the event loop, other alignments of the same worker may be running
+            with span.child('scores') as scores_span:
+                response_data['scores'] = await get_event_loop().run_in_executor(None,
+                    alignment_summary, net1, net2, alignment, inputs['net1_net2_bitscores'], inputs['ontology_mapping'],
+                    result_files, scores_span)
         except:
             logger.exception(f'[{job_id}] exception was raised while computing scores')
 
     return response_data, result_files
 
 
-async def process_alignment_and_send(data):
+async def process_alignment(job_id, data, resources, span):
+    aligner_name = data['aligner'].lower()
+    aligner_params = data.get('aligner_params', dict())
+
+    inputs, fetch_data, results = await fetch_alignment_inputs(job_id, data, resources, span,
+                                                               self_bitscores = aligner_name == 'alignet')
+
+    if inputs is not None:
+        results = await run_alignment(job_id, aligner_name, aligner_params, inputs, span, priority=data.get('priority', 0))
+
+    return await alignment_response(job_id, data, aligner_name, aligner_params, results, inputs, fetch_data, span)
+
+
+async def alignment_fingerprint(job_id, data, aligner_name, aligner_params):
+    # fingerprint of the job and the current version of its source data, None
+    # if it should not be memoized
+    if not config['MEMOIZE_ALIGNMENTS'] or aligner_name not in ALIGNERS_DISPATCHER:
+        return None
+
+    try:
+        db_name = data['db'].lower()
+        data_version = await get_data_version(db_name)
+
+        return job_fingerprint(db_name, data['net1'], data['net2'], aligner_name, ALIGNERS_DISPATCHER[aligner_name],
+                               aligner_params, data_version)
+    except Exception:
+        logger.exception(f'[{job_id}] exception was raised computing the job fingerprint')
+        return None
+
+
+async def memoized_alignment(job_id, fingerprint, span):
+    # (response fields, GridFS file ids) of a previous successful result of
+    # the same job, or None
+    with span.child('memo_lookup') as lookup_span:
+        record = await find_memoized_alignment(fingerprint)
+        lookup_span.attrs['hit'] = record is not None
+
+    if record is None:
+        return None
+
+    logger.info(f'[{job_id}] reusing result {record["_id"]} of an identical job')
+
+    response_data = {key: value for key, value in record.items() if key not in ['_id', 'files', 'trace', 'sweep']}
+    response_data['timestamp'] = time.time()
+    response_data['memoized'] = {'result_id': str(record['_id']), 'timestamp': record.get('timestamp')}
+
+    return response_data, record['files']
+
+
+async def process_alignment_and_send(data, resources):
     job_id = data['job_id']
+    span = Span('alignment', job_id=job_id)
+
+    result_files = dict()
+    linked_files = dict()
 
     try:
         logger.info(f'[{job_id}] processing alignment {data}')
 
-        response_data, result_files = await process_alignment(job_id, data)
+        fingerprint = await alignment_fingerprint(job_id, data, data['aligner'].lower(), data.get('aligner_params', dict()))
+        memoized = None
+
+        if fingerprint is not None and not data.get('force', False):
+            memoized = await memoized_alignment(job_id, fingerprint, span)
+
+        if memoized is not None:
+            response_data, linked_files = memoized
+        else:
+            response_data, result_files = await process_alignment(job_id, data, resources, span)
+
+        if fingerprint is not None:
+            response_data['fingerprint'] = fingerprint
 
     except Exception as e:
         logger.exception(f'[{job_id}] exception was raised while processing alignment')
@@ -160,18 +374,172 @@ async def process_alignment_and_send(data):
             'results': {'ok': False, 'exception': str(e)}
         }
         result_files = dict()
+        linked_files = dict()
 
     logger.debug(f'[{job_id}] alignment finished with result: {response_data}')
-    result_id = await insert_alignment(job_id, response_data, result_files)
+    result_id = await insert_alignment(job_id, response_data, result_files, span=span, linked_files=linked_files)
     logger.info(f'[{job_id}] inserted result as {result_id}')
 
-    await send_finished_alignment(job_id, result_id)
+    record_metrics(span, response_data['results']['ok'], aligner=data.get('aligner', '').lower(),
+                   memoized='memoized' in response_data)
+
+    await send_finished_alignment(resources.http_session, job_id, result_id)
 
 
 @app.task(name='process_alignment', queue='server_aligner')
 def process_alignment_sync(data):
+    return worker_resources.run(process_alignment_and_send(data, worker_resources))
+
+
+def expand_sweep_runs(runs):
+    # runs: [{'aligner': name, 'aligner_params': {...}, 'grid': {param: [values]}}],
+    # where every grid expands to the cartesian product of its values
+    expanded = []
+
+    for run in runs:
+        aligner_name = run['aligner'].lower()
+        grid = run.get('grid', dict())
+        grid_params = sorted(grid)
+
+        for values in product(*(grid[param] for param in grid_params)):
+            aligner_params = dict(run.get('aligner_params', dict()))
+            aligner_params.update(zip(grid_params, values))
+            expanded.append((aligner_name, aligner_params))
+
+    return expanded
+
+
+async def process_sweep_run(job_id, index, data, aligner_name, aligner_params, inputs, fetch_data, fetch_error, semaphore):
+    run_job_id = f'{job_id}/{index}'
+
+    async with semaphore:
+        logger.info(f'[{run_job_id}] running {aligner_name} with {aligner_params}')
+
+        # the fetch is shared by the whole sweep, it is timed in the sweep span
+        span = Span('alignment', job_id=run_job_id)
+
+        if inputs is not None:
+            results = await run_alignment(run_job_id, aligner_name, aligner_params, inputs, span, priority=data.get('priority', 0))
+        else:
+            results = dict(fetch_error)
+
+        response_data, result_files = await alignment_response(run_job_id, data, aligner_name, aligner_params, results, inputs,
+                                                               fetch_data, span)
+
+    response_data['sweep'] = {'job_id': job_id, 'run': index}
+
+    # sweep runs are not looked up, but later identical jobs can reuse them
+    fingerprint = await alignment_fingerprint(run_job_id, data, aligner_name, aligner_params)
+    if fingerprint is not None:
+        response_data['fingerprint'] = fingerprint
+
+    result_id = await insert_alignment(run_job_id, response_data, result_files, span=span)
+    logger.info(f'[{run_job_id}] inserted result as {result_id}')
+
+    record_metrics(span, response_data['results']['ok'], aligner=aligner_name)
+
+    return result_id, response_data['results']['ok']
+
+
+async def process_alignment_sweep(job_id, data, resources, span):
+    # Runs several aligners (or parameter grids of them) on the same network
+    # pair. Inputs are fetched once and aligners run concurrently, bounded by
+    # max_concurrent and the aligner scheduler; input files are shared through
+    # the artifact store. Every run is stored as a regular alignment document.
+    runs = expand_sweep_runs(data['runs'])
+    logger.info(f'[{job_id}] processing sweep of {len(runs)} alignments')
+
+    self_bitscores = any(aligner_name == 'alignet' for aligner_name, _ in runs)
+    inputs, fetch_data, fetch_error = await fetch_alignment_inputs(job_id, data, resources, span, self_bitscores=self_bitscores)
+
+    semaphore = Semaphore(data.get('max_concurrent', config['ALIGNER_SWEEP_CONCURRENCY']))
+
+    results = await gather(*[
+        process_sweep_run(job_id, index, data, aligner_name, aligner_params, inputs, fetch_data, fetch_error, semaphore)
+        for index, (aligner_name, aligner_params) in enumerate(runs)])
+
+    result_ids = [str(result_id) for result_id, _ in results]
+    successful_ids = [str(result_id) for result_id, ok in results if ok]
+
+    comparison_job_id = None
+
+    if data.get('compare') and len(successful_ids) > 1:
+        comparison_job_id = data['compare'].get('job_id', f'{job_id}/comparison') \
+            if isinstance(data['compare'], dict) else f'{job_id}/comparison'
+
+        logger.info(f'[{job_id}] chaining comparison {comparison_job_id} of {len(successful_ids)} alignments')
+        compare_alignments_sync.delay({'job_id': comparison_job_id, 'results_object_ids': successful_ids})
+
+    return {'result_ids': result_ids, 'comparison_job_id': comparison_job_id}
+
+
+async def process_alignment_sweep_and_send(data, resources):
+    job_id = data['job_id']
+    span = Span('sweep', job_id=job_id)
+
+    try:
+        summary = await process_alignment_sweep(job_id, data, resources, span)
+    except Exception as e:
+        logger.exception(f'[{job_id}] exception was raised while processing alignment sweep')
+        summary = {'result_ids': [], 'comparison_job_id': None, 'exception': str(e)}
+
+    record_metrics(span, 'exception' not in summary)
+
+    if config['FINISHED_SWEEP_URL']:
+        await send_finished_sweep(resources.http_session, job_id, summary)
+
+
+@app.task(name='process_alignment_sweep', queue='server_aligner')
+def process_alignment_sweep_sync(data):
+    return worker_resources.run(process_alignment_sweep_and_send(data, worker_resources))
+
+
+def alignment_labels(aligners):
+    # column suffixes: the aligner name, numbered if it appears more than once
+    # (e.g. the runs of a parameter sweep)
+    counts = Counter(aligners)
+    seen = Counter()
+    labels = []
+
+    for aligner in aligners:
+        if counts[aligner] > 1:
+            seen[aligner] += 1
+            labels.append(f'{aligner}_{seen[aligner]}')
+        else:
+            labels.append(aligner)
+
+    return labels
+
+
+def parse_alignment_tsv(data):
+    alignment = pd.read_csv(StringIO(data.decode('utf-8')), sep='\t', index_col=0)
+    return AlignmentColumns.from_dataframe(alignment)
+
+
+async def retrieve_names(file_id):
+    data = await retrieve_file(file_id)
+    return await get_event_loop().run_in_executor(None, decode_names, data)
+
+
+async def retrieve_alignment_columns(record, names_cache):
+    # the binary alignment if stored, the TSV for results older than it; the
+    # protein names shared by several alignments are downloaded once, through
+    # names_cache ({file id: future})
+    files = record['files']
     loop = get_event_loop()
-    return loop.run_until_complete(process_alignment_and_send(data))
+
+    if all(key in files for key in ['alignment_npz', 'net1_names', 'net2_names']):
+        for key in ['net1_names', 'net2_names']:
+            if files[key] not in names_cache:
+                names_cache[files[key]] = ensure_future(retrieve_names(files[key]))
+
+        data, net1_names, net2_names = await gather(
+            retrieve_file(files['alignment_npz']), names_cache[files['net1_names']], names_cache[files['net2_names']])
+
+        return await loop.run_in_executor(None, AlignmentColumns.from_npz, data, net1_names, net2_names)
+
+    data = await retrieve_file(files['alignment_tsv'])
+    return await loop.run_in_executor(None, parse_alignment_tsv, data)
 
 
 async def fetch_and_validate_previous_results(job_id, result_ids):
@@ -198,29 +566,22 @@ async def fetch_and_validate_previous_results(job_id, result_ids):
     if not all_equal(net2_descs):
         raise ValueError(f'[{job_id}] mismatching output networks: ' + str(net2_descs))
 
-    aligners = [record['aligner'] for record in records]
-
-    if len(aligners) != len(set(aligners)):
-        raise ValueError(f'[{job_id}] repeated aligners: ' + str(aligners))
+    aligners = alignment_labels([record['aligner'] for record in records])
 
-    alignments = await gather(*[retrieve_file(record['files']['alignment_tsv']) for record in records])
-    alignments = [StringIO(alignment.decode('utf-8')) for alignment in alignments]
-    alignments = [pd.read_csv(alignment, sep='\t', index_col=0) for alignment in alignments]
+    names_cache = dict()
+    alignments = await gather(*[retrieve_alignment_columns(record, names_cache) for record in records])
 
-    alignment_headers = [alignment.index.names + alignment.columns.values.tolist() for alignment in alignments]
+    alignment_headers = [alignment.columns for alignment in alignments]
 
     if not all_equal(alignment_headers):
         raise ValueError(f'[{job_id}] mismatching alignment headers: ' + str(alignment_headers))
 
-    for aligner, alignment in zip(aligners, alignments):
-        alignment.rename(inplace=True, columns=lambda col: f'{col}_{aligner}')
-
-    joined = alignments[0].join(alignments[1:], how='outer').rename_axis(index=alignments[0].index.name)
+    joined = await get_event_loop().run_in_executor(None, join_alignments, alignments, aligners)
 
     return db_names[0], net1_descs[0], net2_descs[0], records, alignment_headers[0], joined
 
 
-async def compare_alignments(job_id, data):
+async def compare_alignments(job_id, data, resources, span):
     logger.info(f'[{job_id}] comparing alignments {data}')
 
     results = {'ok': True, 'exception': None}
@@ -231,42 +592,72 @@ async def compare_alignments(job_id, data):
     response_data = {'results': results, 'results_object_ids': result_ids}
 
     try:
-        db_name, net1_desc, net2_desc, records, alignment_header, joined = \
-                await fetch_and_validate_previous_results(job_id, result_ids)
+        consensus_params = parse_consensus_params(data.get('consensus'))
+
+        with span.child('fetch_results') as fetch_results_span:
+            db_name, net1_desc, net2_desc, records, alignment_header, joined = \
+                    await fetch_and_validate_previous_results(job_id, result_ids)
+            fetch_results_span.set(alignments=len(records), rows=len(joined))
 
         logger.info(f'[{job_id}] fetching input data')
 
-        async with connect_to_db(db_name) as db:
-            net1 = await db_get_network(db, net1_desc)
-            net2 = await db_get_network(db, net2_desc)
-            bitscore_matrix = await db.get_bitscore_matrix(net1, net2)
-            ontology_mapping = await db.get_ontology_mapping([net1, net2])
+        with span.child('fetch') as fetch_span:
+            async with connect_to_db(db_name, resources, span=fetch_span) as db:
+                inputs = await fetch_inputs(job_id, db, net1_desc, net2_desc, fetch_span)
+
+                net1 = inputs['net1']
+                net2 = inputs['net2']
+                bitscore_matrix = inputs['net1_net2_bitscores']
+                ontology_mapping = inputs['ontology_mapping']
+
+                response_data['fetch_cache'] = fetch_cache_summary(db)
+                response_data['fetch_timings'] = fetch_span.durations()
 
     except Exception as e:
         logger.exception(f'[{job_id}] exception was raised fetching required data')
         results.update({'ok': False, 'exception': str(e)})
 
     else:
-        consensus = joined.loc[joined.agg(all_equal, axis=1)].iloc[:,:1]
-        consensus.columns = [alignment_header[1]]
-        consensus.rename_axis(index=alignment_header[0], inplace=True)
+        with span.child('consensus', **consensus_params) as consensus_span:
+            consensus = await get_event_loop().run_in_executor(None,
+                lambda: compute_consensus(joined, *alignment_header, **consensus_params))
+            consensus_span.set(pairs=len(consensus))
 
         results.update({
             'joined': {'file': 'joined_tsv'},
-            'consensus': {'file': 'consensus_tsv'}
+            'consensus': {'file': 'consensus_tsv', **consensus_params}
         })
 
         result_files.update({
-            'joined_tsv': write_tsv_to_string(joined.reset_index()),
-            'consensus_tsv': write_tsv_to_string(consensus.reset_index())
+            'joined_tsv': iter_tsv_chunks(joined.table.reset_index()),
+            'consensus_tsv': iter_tsv_chunks(consensus.reset_index())
         })
 
         response_data.update(networks_summary(db_name, net1_desc, net1, net2_desc, net2))
 
+        logger.info(f'[{job_id}] computing alignment similarities')
+
+        try:
+            labels = alignment_labels([record['aligner'] for record in records])
+
+            with span.child('similarity') as similarity_span:
+                similarity = await get_event_loop().run_in_executor(None,
+                    alignment_similarity, joined, labels, net1, net2)
+                similarity_span.set(alignments=len(labels))
+
+            results['similarity'] = {'file': 'similarity_tsv'}
+            result_files['similarity_tsv'] = iter_tsv_chunks(similarity_table(similarity))
+            response_data['similarity'] = similarity_summary(similarity)
+        except:
+            logger.exception(f'[{job_id}] exception was raised while computing alignment similarities')
+
         logger.info(f'[{job_id}] computing scores')
 
         try:
-            response_data['consensus_scores'] = alignment_summary(net1, net2, consensus, bitscore_matrix, ontology_mapping, result_files)
+            with span.child('scores') as scores_span:
+                response_data['consensus_scores'] = alignment_summary(net1, net2, consensus[[alignment_header[1]]],
+                                                                      bitscore_matrix, ontology_mapping, result_files,
+                                                                      scores_span)
         except:
             logger.exception(f'[{job_id}] exception was raised while computing scores')
 
@@ -279,11 +670,12 @@ async def compare_alignments(job_id, data):
 
 
 
-async def compare_alignments_and_send(data):
+async def compare_alignments_and_send(data, resources):
     job_id = data['job_id']
+    span = Span('comparison', job_id=job_id)
 
     try:
-        response_data, result_files = await compare_alignments(job_id, data)
+        response_data, result_files = await compare_alignments(job_id, data, resources, span)
 
     except Exception as e:
         logger.exception(f'[{job_id}] exception was raised while comparing alignments')
@@ -294,34 +686,39 @@ async def compare_alignments_and_send(data):
         result_files = dict()
 
     logger.debug(f'[{job_id}] comparison finished with result {response_data}')
-    result_id = await insert_comparison(job_id, response_data, result_files)
+    result_id = await insert_comparison(job_id, response_data, result_files, span=span)
     logger.info(f'[{job_id}] inserted result as {result_id}')
 
-    await send_finished_comparison(job_id, result_id)
+    record_metrics(span, response_data['results']['ok'])
+
+    await send_finished_comparison(resources.http_session, job_id, result_id)
 
 
 @app.task(name='compare_alignments', queue='server_comparer')
 def compare_alignments_sync(data):
-    loop = get_event_loop()
-    return loop.run_until_complete(compare_alignments_and_send(data))
+    return worker_resources.run(compare_alignments_and_send(data, worker_resources))
 
 
 
-async def send_finished_alignment(job_id, result_id):
+async def send_finished_alignment(session, job_id, result_id):
     url = config['FINISHED_ALIGNMENT_URL']
-    return await send_finished_job(job_id, result_id, url)
+    return await send_finished_job(session, job_id, result_id, url)
 
-async def send_finished_comparison(job_id, result_id):
+async def send_finished_comparison(session, job_id, result_id):
     url = config['FINISHED_COMPARISON_URL']
-    return await send_finished_job(job_id, result_id, url)
+    return await send_finished_job(session, job_id, result_id, url)
+
+async def send_finished_sweep(session, job_id, summary):
+    data = {'job_id': job_id, **summary}
+
+    async with session.post(config['FINISHED_SWEEP_URL'], data=json_dumps(data)) as response:
+        response.raise_for_status()
 
-async def send_finished_job(job_id, result_id, url):
-    headers = {'content-type': 'application/json'}
+async def send_finished_job(session, job_id, result_id, url):
     data = {'job_id': job_id, 'result_id': str(result_id)}
 
-    async with ClientSession(headers=headers) as session:
-        async with session.post(url, data=json_dumps(data)) as response:
-            response.raise_for_status()
+    async with session.post(url, data=json_dumps(data)) as response:
+        response.raise_for_status()
 
 if __name__ == '__main__':
     process_alignment.delay(data={"db": 'Test'})
@@ -0,0 +1,65 @@
+import hashlib
+import inspect
+import json
+
+from sources.stringdb import StringDB
+
+
+# bump when a change in the server (not in the source data) makes previous
+# results stale, e.g. a fix in the aligner input files or in the scores
+RESULT_FORMAT_VERSION = 1
+
+
+def canonical_aligner_params(aligner_cls, aligner_params):
+    # parameters with the defaults of the aligner filled in, so that {} and
+    # the explicit defaults are the same job; None if they are not valid
+    try:
+        bound = inspect.signature(aligner_cls).bind(**aligner_params)
+    except TypeError:
+        return None
+
+    bound.apply_defaults()
+    return dict(bound.arguments)
+
+
+def canonical_network(db_name, net_desc):
+    # None if the network cannot be memoized
+    if db_name == 'stringdb':
+        if net_desc['species_id'] >= 0:
+            raw_thresholds = net_desc.get('score_thresholds') or {}
+            score_thresholds = StringDB.normalize_score_thresholds(raw_thresholds)
+
+            # invalid pairs are dropped by the queries but still make the
+            # network differ from the unfiltered one, do not risk mixing them
+            if len(score_thresholds) != len(raw_thresholds):
+                return None
+
+            return {'species_id': net_desc['species_id'], 'score_thresholds': dict(score_thresholds)}
+        else:
+            edges = sorted({tuple(sorted(edge)) for edge in net_desc['edges']})
+            return {'species_id': -1, 'edges': edges}
+
+    return net_desc
+
+
+def job_fingerprint(db_name, net1_desc, net2_desc, aligner_name, aligner_cls, aligner_params, data_version):
+    # hex digest identifying the result of an alignment job, None if the job
+    # cannot be memoized
+    params = canonical_aligner_params(aligner_cls, aligner_params)
+    net1 = canonical_network(db_name, net1_desc)
+    net2 = canonical_network(db_name, net2_desc)
+
+    if params is None or net1 is None or net2 is None:
+        return None
+
+    canonical = [
+        RESULT_FORMAT_VERSION,
+        db_name,
+        data_version,
+        net1,
+        net2,
+        aligner_name,
+        params,
+    ]
+
+    return hashlib.sha1(json.dumps(canonical, sort_keys=True).encode('utf-8')).hexdigest()
@@ -0,0 +1,311 @@
+from contextlib import contextmanager
+import fcntl
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import logging
+import os
+from os import path
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _number(value):
+    # numpy scalars to python numbers, for the JSON documents
+    return value.item() if hasattr(value, 'item') else value
+
+
+class Span(object):
+    # A timed stage of a job. Spans nest (span.child(name)) and carry sizes,
+    # numeric counts of what the stage processed (vertices, rows, bytes...),
+    # and attrs, free-form details that only go to the result document.
+    #
+    # Spans are plain objects passed explicitly to the code they time, which
+    # may run in executor threads; children are appended under the GIL.
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.sizes = dict()
+        self.children = []
+
+        self.start_time = time.time()
+        self.end_time = None
+
+    @property
+    def duration(self):
+        return (self.end_time if self.end_time is not None else time.time()) - self.start_time
+
+    def child(self, name, **attrs):
+        span = Span(name, **attrs)
+        self.children.append(span)
+        return span
+
+    def set(self, **sizes):
+        for size, value in sizes.items():
+            self.sizes[size] = _number(value)
+        return self
+
+    def add(self, **sizes):
+        for size, value in sizes.items():
+            self.sizes[size] = self.sizes.get(size, 0) + _number(value)
+        return self
+
+    def finish(self):
+        if self.end_time is None:
+            self.end_time = time.time()
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.finish()
+
+    async def timed(self, name, coro, **attrs):
+        with self.child(name, **attrs):
+            return await coro
+
+    def durations(self):
+        # {dotted path: duration} of all the descendants, relative to this
+        # span. Repeated paths (e.g. one query per partition) are summed
+        durations = dict()
+        for child in self.children:
+            for span_path, span in child.walk():
+                durations[span_path] = durations.get(span_path, 0.0) + span.duration
+        return durations
+
+    def walk(self, prefix=''):
+        # (dotted path, span) of this span and its descendants
+        span_path = prefix + self.name
+        yield span_path, self
+        for child in self.children:
+            yield from child.walk(span_path + '.')
+
+    def to_dict(self, origin=None):
+        origin = self.start_time if origin is None else origin
+
+        d = {
+            'name': self.name,
+            'start': round(self.start_time - origin, 6),
+            'duration': round(self.duration, 6),
+        }
+
+        if self.sizes:
+            d['sizes'] = dict(self.sizes)
+        if self.attrs:
+            d['attrs'] = dict(self.attrs)
+        if self.children:
+            d['children'] = [child.to_dict(origin) for child in self.children]
+
+        return d
+
+
+class NullSpan(object):
+    # stands for a missing span, so that instrumented code needs no checks
+
+    name = None
+    duration = 0.0
+
+    @property
+    def attrs(self):
+        # details set on a missing span are dropped
+        return dict()
+
+    def child(self, name, **attrs): return self
+    def set(self, **sizes): return self
+    def add(self, **sizes): return self
+    def finish(self): return self
+
+    def __enter__(self): return self
+    def __exit__(self, exc_type, exc, tb): pass
+
+    async def timed(self, name, coro, **attrs):
+        return await coro
+
+
+NULL_SPAN = NullSpan()
+
+
+def child_span(parent, name, **attrs):
+    return parent.child(name, **attrs) if parent is not None else NULL_SPAN
+
+
+def stage_sizes(value):
+    # sizes of a fetched input, for the span of the stage that fetched it.
+    # Checked by attribute: the fetched objects come from server.sources.*
+    # while main imports sources.*, so isinstance would not match them
+    if hasattr(value, 'igraph'):
+        return {'vertices': value.igraph.vcount(), 'edges': value.igraph.ecount()}
+    elif hasattr(value, 'nnz'):
+        return {'rows': value.nnz}
+    elif hasattr(value, 'tricol'):
+        return {'rows': len(value.tricol)}
+    elif isinstance(value, dict):
+        return {'entries': len(value)}
+    else:
+        return {}
+
+
+class MetricsStore(object):
+    # Prometheus metrics of finished jobs, aggregated over all the worker
+    # processes of a host. Every job merges its spans into a JSON state file
+    # under an exclusive flock (as the aligner scheduler does) and rewrites
+    # metrics.prom next to it, which can be read by node_exporter's textfile
+    # collector. With an http_port, the first worker process able to bind it
+    # also serves the metrics over HTTP.
+    #
+    # Metrics (stage is the dotted path of a span, e.g. alignment.fetch.networks):
+    #   util_aligner_jobs_total{job, ok, ...}                 counter
+    #   util_aligner_stage_duration_seconds{job, stage, ...}  histogram
+    #   util_aligner_stage_size_total{job, stage, size, ...}  counter
+
+    BUCKETS = [0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, 1800, 3600, 7200, float('inf')]
+
+    def __init__(self, state_dir_path, http_port=None):
+        self.state_dir_path = state_dir_path
+        self.http_port = http_port
+
+        os.makedirs(state_dir_path, exist_ok=True)
+        self._state_path = path.join(state_dir_path, 'state.json')
+        self._lock_path = path.join(state_dir_path, 'state.lock')
+        self.textfile_path = path.join(state_dir_path, 'metrics.prom')
+
+        self._http_server = None
+
+    @contextmanager
+    def _state(self, write=True):
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            try:
+                try:
+                    with open(self._state_path, 'r') as f:
+                        state = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    state = {'counters': {}, 'histograms': {}}
+
+                yield state
+
+                if write:
+                    with open(self._state_path + '.tmp', 'w') as f:
+                        json.dump(state, f)
+                    os.replace(self._state_path + '.tmp', self._state_path)
+
+                    with open(self.textfile_path + '.tmp', 'w') as f:
+                        f.write(self.render_state(state))
+                    os.replace(self.textfile_path + '.tmp', self.textfile_path)
+
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _series_key(name, labels):
+        # JSON object keys: the metric name and its labels, sorted
+        return json.dumps([name, sorted(labels.items())])
+
+    def _inc(self, state, name, labels, value):
+        key = self._series_key(name, labels)
+        state['counters'][key] = state['counters'].get(key, 0) + value
+
+    def _observe(self, state, name, labels, value):
+        key = self._series_key(name, labels)
+        histogram = state['histograms'].setdefault(key, {'buckets': [0] * len(self.BUCKETS), 'sum': 0.0, 'count': 0})
+
+        for i, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                histogram['buckets'][i] += 1
+
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+    def record(self, root, ok=True, **labels):
+        # merges a finished job (its root span) into the metrics
+        labels = {label: str(value) for label, value in labels.items()}
+        job_labels = dict(labels, job=root.name)
+
+        try:
+            with self._state() as state:
+                self._inc(state, 'util_aligner_jobs_total', dict(job_labels, ok=str(bool(ok)).lower()), 1)
+
+                for stage, span in root.walk():
+                    stage_labels = dict(job_labels, stage=stage)
+                    self._observe(state, 'util_aligner_stage_duration_seconds', stage_labels, span.duration)
+
+                    for size, value in span.sizes.items():
+                        self._inc(state, 'util_aligner_stage_size_total', dict(stage_labels, size=size), value)
+
+        except OSError:
+            logger.exception('could not record job metrics')
+
+        self.serve()
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ''
+
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+        return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(labels, escaped)) + '}'
+
+    @classmethod
+    def render_state(cls, state):
+        families = dict()
+
+        for key, value in state['counters'].items():
+            name, labels = json.loads(key)
+            families.setdefault((name, 'counter'), []).append(f'{name}{cls._format_labels(labels)} {value}')
+
+        for key, histogram in state['histograms'].items():
+            name, labels = json.loads(key)
+            lines = families.setdefault((name, 'histogram'), [])
+
+            for bound, count in zip(cls.BUCKETS, histogram['buckets']):
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{name}_bucket{cls._format_labels(labels + [["le", le]])} {count}')
+
+            lines.append(f'{name}_sum{cls._format_labels(labels)} {histogram["sum"]}')
+            lines.append(f'{name}_count{cls._format_labels(labels)} {histogram["count"]}')
+
+        text = []
+        for (name, kind), lines in sorted(families.items()):
+            text.append(f'# TYPE {name} {kind}')
+            text.extend(lines)
+
+        return '\n'.join(text) + '\n'
+
+    def render(self):
+        with self._state(write=False) as state:
+            return self.render_state(state)
+
+    def serve(self):
+        # tries to serve the metrics over HTTP from this process; another
+        # worker process may already be doing it, in which case binding fails
+        if self.http_port is None or self._http_server is not None:
+            return
+
+        store = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = store.render().encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._http_server = HTTPServer(('', self.http_port), MetricsHandler)
+        except OSError:
+            return
+
+        logger.info(f'serving metrics on port {self.http_port}')
+        threading.Thread(target=self._http_server.serve_forever, daemon=True).start()
@@ -0,0 +1,202 @@
+from asyncio import sleep
+from contextlib import contextmanager
+import fcntl
+import itertools
+import json
+import logging
+import os
+from os import path
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def physical_memory_bytes():
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+class Reservation(object):
+    def __init__(self, scheduler, token, cpus, memory_bytes, cores, wait_time):
+        self.scheduler = scheduler
+        self.token = token
+        self.cpus = cpus
+        self.memory_bytes = memory_bytes
+        self.cores = cores
+        self.wait_time = wait_time
+
+    @property
+    def cpu_affinity(self):
+        # cores to pin the aligner to, None unless pinning is enabled
+        return self.cores if self.scheduler.pin_cpus else None
+
+    def release(self):
+        self.scheduler.release(self)
+
+    def summary(self):
+        return {
+            'cpus': self.cpus,
+            'memory_bytes': self.memory_bytes,
+            'cores': self.cores,
+            'wait_time': self.wait_time,
+        }
+
+
+class ResourceScheduler(object):
+    # Admission control for aligner processes shared by all the worker
+    # processes of a host. Requests ask for a number of cores and an amount of
+    # memory, and wait until they fit in the budget. The queue is ordered by
+    # priority (higher first) and arrival; a request may overtake the head of
+    # the queue when the head does not fit yet, at most max_overtakes times, so
+    # that small jobs keep the host busy without starving large ones.
+    #
+    # The shared state is a JSON file updated under an exclusive flock.
+    # Entries of processes that no longer exist are dropped.
+
+    def __init__(self, state_dir_path, cpu_budget, memory_budget, pin_cpus=False, poll_interval=0.5, max_overtakes=16):
+        self.state_dir_path = state_dir_path
+        self.cpu_budget = cpu_budget
+        self.memory_budget = memory_budget
+        self.pin_cpus = pin_cpus
+        self.poll_interval = poll_interval
+        self.max_overtakes = max_overtakes
+
+        self.available_cores = sorted(os.sched_getaffinity(0))[:cpu_budget]
+
+        os.makedirs(state_dir_path, exist_ok=True)
+        self._state_path = path.join(state_dir_path, 'state.json')
+        self._lock_path = path.join(state_dir_path, 'state.lock')
+
+    @contextmanager
+    def _state(self):
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            try:
+                try:
+                    with open(self._state_path, 'r') as f:
+                        state = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    state = {'seq': 0, 'queue': [], 'running': []}
+
+                self._drop_dead_entries(state)
+                yield state
+
+                with open(self._state_path + '.tmp', 'w') as f:
+                    json.dump(state, f)
+                os.replace(self._state_path + '.tmp', self._state_path)
+
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _drop_dead_entries(self, state):
+        for key in ['queue', 'running']:
+            alive = [entry for entry in state[key] if self._is_alive(entry['pid'])]
+
+            if len(alive) != len(state[key]):
+                logger.warning(f'dropping {len(state[key]) - len(alive)} {key} entries of dead processes')
+                state[key] = alive
+
+    def _clamp(self, cpus, memory_bytes):
+        # requests larger than the whole budget run alone instead of never
+        return max(1, min(cpus, self.cpu_budget)), max(0, min(memory_bytes, self.memory_budget))
+
+    def _free_cores(self, state):
+        used = set(itertools.chain.from_iterable(entry['cores'] for entry in state['running']))
+        return [core for core in self.available_cores if core not in used]
+
+    def _fits(self, state, entry):
+        used_cpus = sum(e['cpus'] for e in state['running'])
+        used_memory = sum(e['memory_bytes'] for e in state['running'])
+
+        return used_cpus + entry['cpus'] <= self.cpu_budget and \
+            used_memory + entry['memory_bytes'] <= self.memory_budget
+
+    def _try_admit(self, state, token):
+        queue = sorted(state['queue'], key=lambda entry: (-entry['priority'], entry['seq']))
+
+        for position, entry in enumerate(queue):
+            if not self._fits(state, entry):
+                if queue[0]['overtaken'] >= self.max_overtakes:
+                    return None
+                continue
+
+            if entry['token'] != token:
+                # an earlier request fits, it will be admitted by its own process
+                return None
+
+            if position > 0:
+                queue[0]['overtaken'] += 1
+
+            state['queue'] = [e for e in state['queue'] if e['token'] != token]
+
+            entry['cores'] = self._free_cores(state)[:entry['cpus']]
+            state['running'].append(entry)
+            return entry
+
+        return None
+
+    async def reserve(self, cpus, memory_bytes, priority=0):
+        cpus, memory_bytes = self._clamp(cpus, memory_bytes)
+        token = uuid.uuid4().hex
+        start_time = time.time()
+
+        with self._state() as state:
+            state['seq'] += 1
+            state['queue'].append({
+                'token': token,
+                'pid': os.getpid(),
+                'seq': state['seq'],
+                'priority': priority,
+                'cpus': cpus,
+                'memory_bytes': memory_bytes,
+                'overtaken': 0,
+                'cores': [],
+            })
+
+        try:
+            while True:
+                with self._state() as state:
+                    entry = self._try_admit(state, token)
+
+                if entry is not None:
+                    break
+
+                await sleep(self.poll_interval)
+
+        except BaseException:
+            with self._state() as state:
+                state['queue'] = [e for e in state['queue'] if e['token'] != token]
+            raise
+
+        wait_time = time.time() - start_time
+        logger.info(f'admitted {cpus} cpus / {memory_bytes} bytes after {wait_time:.1f}s (cores {entry["cores"]})')
+
+        return Reservation(self, token, cpus, memory_bytes, entry['cores'], wait_time)
+
+    def release(self, reservation):
+        logger.info(f'releasing {reservation.cpus} cpus / {reservation.memory_bytes} bytes')
+
+        with self._state() as state:
+            state['running'] = [e for e in state['running'] if e['token'] != reservation.token]
+
+    def stats(self):
+        with self._state() as state:
+            return {
+                'queued': len(state['queue']),
+                'running': len(state['running']),
+                'cpus_used': sum(e['cpus'] for e in state['running']),
+                'memory_used': sum(e['memory_bytes'] for e in state['running']),
+                'cpu_budget': self.cpu_budget,
+                'memory_budget': self.memory_budget,
+            }
@@ -1,13 +1,17 @@
 
-from server.util import write_tsv_to_string
+from server.metrics import child_span
+from server.util import iter_tsv_chunks
 from server.scores.topology import compute_ec_scores
 from server.scores.functional import compute_fc_scores
 
 
 
-def compute_scores(net1, net2, alignment, bitscore_matrix, ontology_mapping):
-    ec_data = compute_ec_scores(net1, net2, alignment)
-    fc_data = compute_fc_scores(net1, net2, alignment, bitscore_matrix, ontology_mapping)
+def compute_scores(net1, net2, alignment, bitscore_matrix, ontology_mapping, span=None):
+    with child_span(span, 'ec_scores'):
+        ec_data = compute_ec_scores(net1, net2, alignment)
+
+    with child_span(span, 'fc_scores'):
+        fc_data = compute_fc_scores(net1, net2, alignment, bitscore_matrix, ontology_mapping)
 
     return {
         'ec_data': ec_data,
@@ -16,6 +20,7 @@ def compute_scores(net1, net2, alignment, bitscore_matrix, ontology_mapping):
 
 
 def split_score_data_as_tsvs(scores):
+    # the tsvs are written lazily, while they are uploaded
     tsvs = dict()
 
     def navigate(d, path):
@@ -33,7 +38,7 @@ def split_score_data_as_tsvs(scores):
         if parent_dict is not None and path[-1] in parent_dict:
             tsv_key = '/'.join(path) + '_tsv'
 
-            tsvs[tsv_key] = write_tsv_to_string(parent_dict[path[-1]])
+            tsvs[tsv_key] = iter_tsv_chunks(parent_dict[path[-1]])
             parent_dict[path[-1]] = {'file': tsv_key}
 
     key_to_file('ec_data', 'invalid_images')
@@ -1,5 +1,6 @@
 from collections import Counter
 from math import isnan
+import numpy as np
 import pandas as pd
 
 from go_tools import init_default_hrss
@@ -46,15 +47,13 @@ def compute_fc(alignment, ontology_mapping, dissim):
 
 
 def compute_bitscore_fc(alignment, bitscore_matrix):
-    bitscore_df = bitscore_matrix.to_dataframe()
+    sparse_matrix = bitscore_matrix.to_sparse()
 
-    alignment_df = alignment.reset_index()
-    alignment_df.columns = bitscore_df.index.names
+    relevant_bitscores = sparse_matrix.gather_alignment(alignment)
+    relevant_bitscores = relevant_bitscores[relevant_bitscores > 0]
 
-    relevant_bitscores = bitscore_df.join(alignment_df.set_index(bitscore_df.index.names), how='inner')
-
-    return float(relevant_bitscores.bitscore.sum() / bitscore_df.bitscore.max()) \
-        if not relevant_bitscores.empty else -1
+    return float(relevant_bitscores.sum(dtype=np.float64) / sparse_matrix.max()) \
+        if len(relevant_bitscores) > 0 else -1
 
 
 jaccard_dissim = JaccardSim().compare
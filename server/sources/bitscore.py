@@ -1,7 +1,11 @@
+import hashlib
+
 import numpy as np
 import pandas as pd
+import scipy.sparse
 
-from server.util import iter_csv, write_csv
+from server.sources.export import write_delimited
+from server.util import iter_csv, update_hash, write_csv
 
 
 class BitscoreMatrix(object):
@@ -17,22 +21,56 @@ class BitscoreMatrix(object):
                 index = index_columns) \
             .astype({'bitscore': float})
 
+    @property
+    def content_fingerprint(self):
+        # None when the contents cannot be hashed cheaply
+        return None
+
+    def to_columns(self, by='name'):
+        raise NotImplementedError()
+
     def write_tricol(self, file_path, by='name', **kwargs):
         if 'delimiter' not in kwargs:
             kwargs['delimiter'] = '\t'
 
-        write_csv(file_path, self.iter_tricol(by=by), **kwargs)
+        if by == 'object' or set(kwargs) != {'delimiter'}:
+            write_csv(file_path, self.iter_tricol(by=by), **kwargs)
+        else:
+            write_delimited(file_path, self.to_columns(by=by), delimiter=kwargs['delimiter'])
 
 
 class TricolBitscoreMatrix(BitscoreMatrix):
     def __init__(self, tricol, net1=None, net2=None, by='name'):
-        self.tricol = np.array(tricol)
+        self.tricol = np.asarray(tricol)
         self.net1 = net1
         self.net2 = net2
         self.by = by
+        self._content_fingerprint = None
+
+    @property
+    def content_fingerprint(self):
+        if self._content_fingerprint is None and not self.tricol.dtype.hasobject:
+            h = hashlib.sha1()
+            for net in [self.net1, self.net2]:
+                update_hash(h, net.vertices_fingerprint if net is not None else None)
+            update_hash(h, self.by, self.tricol)
+
+            self._content_fingerprint = h.hexdigest()
+
+        return self._content_fingerprint
 
     def swapping_net1_net2(self):
-        return TricolBitscoreMatrix(self.tricol[:,[1,0,2]], net1=self.net2, net2=self.net1, by=self.by)
+        if self.tricol.dtype.names is not None:
+            p1_by, p2_by, scores = self._columns()
+            tricol = structured_tricol((p2_by, p1_by, scores), names=self.tricol.dtype.names[:3])
+        else:
+            tricol = self.tricol[:,[1,0,2]]
+
+        return TricolBitscoreMatrix(tricol, net1=self.net2, net2=self.net1, by=self.by)
+
+    def to_sparse(self):
+        p1_ids, p2_ids, scores = self._vertex_indices()
+        return SparseBitscoreMatrix.from_indices(p1_ids, p2_ids, scores, net1=self.net1, net2=self.net2)
 
     def to_dataframe(self, by='name'):
         index_columns = [f'{by}1', f'{by}2']
@@ -49,36 +87,238 @@ class TricolBitscoreMatrix(BitscoreMatrix):
         else:
             return np.array(list(self.iter_tricol(by=by)))
 
-    def iter_tricol(self, by='name'):
-        self_by = self.by
+    def _columns(self):
+        tricol = self.tricol
 
-        if by == self_by:
-            yield from self.tricol
+        if tricol.dtype.names is not None:
+            return tuple(tricol[column] for column in tricol.dtype.names[:3])
+        elif tricol.size == 0:
+            return np.array([]), np.array([]), np.array([])
+        else:
+            return tricol[:,0], tricol[:,1], tricol[:,2]
+
+    def _vertex_indices(self):
+        if self.net1 is None or self.net2 is None:
+            raise ValueError(f"must specify net1 and net2 in order to use different 'by' values (current: {self.by})")
+
+        p1_by, p2_by, scores = self._columns()
+
+        if self.by == 'index':
+            return p1_by.astype(int), p2_by.astype(int), scores
+
+        p1_ids = self.net1.lookup_vertices(p1_by, by=self.by)
+        p2_ids = self.net2.lookup_vertices(p2_by, by=self.by)
+
+        # drop rows referring to proteins not present in the networks
+        found = (p1_ids >= 0) & (p2_ids >= 0)
+
+        return p1_ids[found], p2_ids[found], scores[found]
+
+    def to_columns(self, by='name'):
+        if by == self.by:
+            return self._columns()
+
+        p1_ids, p2_ids, scores = self._vertex_indices()
 
+        if by == 'index':
+            return p1_ids, p2_ids, scores
         elif by == 'object':
-            if self.net1 is None or self.net2 is None:
-                raise ValueError(f"must specify net1 and net2 in order to use different 'by' values (current: {self.by}, given: {by})")
+            net1_vs = self.net1.igraph.vs
+            net2_vs = self.net2.igraph.vs
+            return [net1_vs[i] for i in p1_ids.tolist()], [net2_vs[i] for i in p2_ids.tolist()], scores
+        else:
+            p1_by = np.array(self.net1.igraph.vs[by], dtype=object)[p1_ids]
+            p2_by = np.array(self.net2.igraph.vs[by], dtype=object)[p2_ids]
+            return p1_by, p2_by, scores
 
+    def iter_tricol(self, by='name'):
+        if by == self.by:
+            yield from self.tricol
+            return
+
+        p1_ids, p2_ids, scores = self._vertex_indices()
+
+        if by == 'object':
             net1_vs = self.net1.igraph.vs
             net2_vs = self.net2.igraph.vs
 
-            if self_by == 'index':
-                for p1_id, p2_id, score in self.tricol:
-                    yield net1_vs[p1_id], net2_vs[p2_id], score
-            else:
-                for p1_by, p2_by, score in self.tricol:
-                    p1s = net1_vs.select(**{self_by:p1_by})
-                    p2s = net2_vs.select(**{self_by:p2_by})
-                    if len(p1s) > 0 and len(p2s) > 0:
-                        yield p1s[0], p2s[0], score
+            for p1_id, p2_id, score in zip(p1_ids.tolist(), p2_ids.tolist(), scores):
+                yield net1_vs[p1_id], net2_vs[p2_id], score
 
         elif by == 'index':
-            for p1, p2, score in self.iter_tricol(by='object'):
-                yield p1.index, p2.index, score
+            yield from zip(p1_ids.tolist(), p2_ids.tolist(), scores)
+
+        else:
+            p1_by = np.array(self.net1.igraph.vs[by], dtype=object)[p1_ids]
+            p2_by = np.array(self.net2.igraph.vs[by], dtype=object)[p2_ids]
+
+            yield from zip(p1_by, p2_by, scores)
+
+
+class SparseBitscoreMatrix(BitscoreMatrix):
+    # bitscores stored as a (net1.vcount() x net2.vcount()) sparse matrix
+    # indexed by vertex indices; absent pairs have a bitscore of 0
+
+    def __init__(self, matrix, net1, net2):
+        self.matrix = matrix
+        self.net1 = net1
+        self.net2 = net2
+        self._csr = None
+        self._content_fingerprint = None
+
+    @classmethod
+    def from_indices(cls, p1_ids, p2_ids, scores, net1, net2):
+        p1_ids = np.asarray(p1_ids, dtype=np.int32)
+        p2_ids = np.asarray(p2_ids, dtype=np.int32)
+        scores = np.asarray(scores, dtype=np.float32)
+
+        # keep the best score of repeated pairs
+        order = np.lexsort((-scores, p2_ids, p1_ids))
+        p1_ids, p2_ids, scores = p1_ids[order], p2_ids[order], scores[order]
+
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (p1_ids[1:] != p1_ids[:-1]) | (p2_ids[1:] != p2_ids[:-1])
+
+        shape = (net1.igraph.vcount(), net2.igraph.vcount())
+        matrix = scipy.sparse.csr_matrix((scores[first], (p1_ids[first], p2_ids[first])), shape=shape, dtype=np.float32)
+
+        return cls(matrix, net1, net2)
 
+    @property
+    def csr(self):
+        if self._csr is None:
+            self._csr = self.matrix.tocsr()
+            self._csr.sort_indices()
+        return self._csr
+
+    @property
+    def content_fingerprint(self):
+        if self._content_fingerprint is None:
+            csr = self.csr
+            h = hashlib.sha1()
+            update_hash(h, self.net1.vertices_fingerprint, self.net2.vertices_fingerprint,
+                        csr.indptr, csr.indices, csr.data)
+
+            self._content_fingerprint = h.hexdigest()
+
+        return self._content_fingerprint
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def nnz(self):
+        return self.matrix.nnz
+
+    def max(self):
+        return float(self.matrix.max()) if self.nnz > 0 else 0.0
+
+    def swapping_net1_net2(self):
+        # the transpose of a CSR matrix is a CSC view over the same arrays
+        return SparseBitscoreMatrix(self.matrix.transpose(), net1=self.net2, net2=self.net1)
+
+    def to_sparse(self):
+        return self
+
+    def get(self, p1_id, p2_id):
+        return float(self.csr[p1_id, p2_id])
+
+    def gather(self, p1_ids, p2_ids):
+        p1_ids = np.asarray(p1_ids, dtype=np.int32)
+        p2_ids = np.asarray(p2_ids, dtype=np.int32)
+
+        if len(p1_ids) == 0:
+            return np.array([], dtype=np.float32)
+
+        return np.asarray(self.csr[p1_ids, p2_ids], dtype=np.float32).ravel()
+
+    def gather_alignment(self, alignment, by='name'):
+        # bitscores of the aligned pairs of an alignment DataFrame (net1 in the
+        # index, net2 in the first column), NaN where a protein is unknown
+        p1_ids = self.net1.lookup_vertices(alignment.index.to_numpy(), by=by)
+        p2_ids = self.net2.lookup_vertices(alignment.iloc[:, 0].to_numpy(), by=by)
+
+        found = (p1_ids >= 0) & (p2_ids >= 0)
+
+        scores = np.full(len(alignment), np.nan, dtype=np.float32)
+        scores[found] = self.gather(p1_ids[found], p2_ids[found])
+
+        return scores
+
+    def top_k(self, k):
+        # keep the k best scores of every net1 protein
+        csr = self.csr
+        row_lengths = np.diff(csr.indptr)
+        rows = np.repeat(np.arange(csr.shape[0], dtype=np.int32), row_lengths)
+
+        order = np.lexsort((-csr.data, rows))
+        ranks = np.arange(csr.nnz) - csr.indptr[rows[order]]
+        keep = order[ranks < k]
+
+        return SparseBitscoreMatrix.from_indices(rows[keep], csr.indices[keep], csr.data[keep], net1=self.net1, net2=self.net2)
+
+    def to_columns(self, by='name'):
+        coo = self.csr.tocoo()
+        p1_ids, p2_ids, scores = coo.row, coo.col, coo.data
+
+        if by == 'index':
+            return p1_ids, p2_ids, scores
+        elif by == 'object':
+            net1_vs = self.net1.igraph.vs
+            net2_vs = self.net2.igraph.vs
+            return [net1_vs[i] for i in p1_ids.tolist()], [net2_vs[i] for i in p2_ids.tolist()], scores
         else:
-            for p1, p2, score in self.iter_tricol(by='object'):
-                yield p1[by], p2[by], score
+            p1_by = np.array(self.net1.igraph.vs[by], dtype=object)[p1_ids]
+            p2_by = np.array(self.net2.igraph.vs[by], dtype=object)[p2_ids]
+            return p1_by, p2_by, scores
+
+    def iter_tricol(self, by='name'):
+        p1_by, p2_by, scores = self.to_columns(by=by)
+        yield from zip(p1_by, p2_by, scores)
+
+    def to_dataframe(self, by='name'):
+        index_columns = [f'{by}1', f'{by}2']
+        p1_by, p2_by, scores = self.to_columns(by=by)
+
+        return pd.DataFrame({index_columns[0]: p1_by, index_columns[1]: p2_by, 'bitscore': scores.astype(float)}) \
+            .set_index(index_columns)
+
+
+class InternedBitscores(object):
+    # tricol bitscores stored as int32 codes into two protein name tables plus
+    # float32 scores
+
+    def __init__(self, names1, names2, p1_codes, p2_codes, scores):
+        self.names1 = names1
+        self.names2 = names2
+        self.p1_codes = p1_codes
+        self.p2_codes = p2_codes
+        self.scores = scores
+
+    def to_bitscore_matrix(self, net1, net2):
+        # translate name codes to vertex indices once per name table, then map
+        # every row through array indexing
+        code_to_vertex1 = net1.lookup_vertices(self.names1.tolist())
+        code_to_vertex2 = net2.lookup_vertices(self.names2.tolist())
+
+        p1_ids = code_to_vertex1[self.p1_codes]
+        p2_ids = code_to_vertex2[self.p2_codes]
+
+        found = (p1_ids >= 0) & (p2_ids >= 0)
+
+        tricol = structured_tricol((p1_ids[found].astype(np.int32), p2_ids[found].astype(np.int32), self.scores[found]))
+
+        return TricolBitscoreMatrix(tricol, net1=net1, net2=net2, by='index')
+
+
+def structured_tricol(columns, names=('p1', 'p2', 'bitscore')):
+    tricol = np.empty(len(columns[0]), dtype=[(name, column.dtype) for name, column in zip(names, columns)])
+
+    for name, column in zip(names, columns):
+        tricol[name] = column
+
+    return tricol
 
 
 def read_tricol_bitscores(file_path, net1=None, net2=None, by='name', row_filter=None, **kwargs):
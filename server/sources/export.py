@@ -0,0 +1,76 @@
+import csv
+
+import numpy as np
+import pandas as pd
+
+
+CHUNK_ROWS = 1 << 16
+BUFFER_SIZE = 1 << 20
+
+
+def format_column(column, delimiter='\t', quotechar='"'):
+    # Formats a column the way csv.writer formats the values obtained by
+    # iterating it: str() for everything but floats, repr() for floats, and
+    # minimal quoting. Every distinct value is formatted once.
+    column = np.asarray(column)
+
+    if column.dtype.kind in 'iubfc':
+        uniques, inverse = np.unique(column, return_inverse=True)
+        formatted = [repr(x) if isinstance(x, float) else str(x) for x in uniques]
+        return np.array(formatted, dtype=object)[inverse.reshape(-1)]
+
+    # names repeat a lot (one per edge endpoint), quote each distinct one once
+    codes, uniques = pd.factorize(column.reshape(-1).astype(object))
+
+    special = {delimiter, quotechar, '\r', '\n'}
+    formatted = []
+    for value in uniques:
+        value = str(value)
+        if not special.isdisjoint(value):
+            value = quotechar + value.replace(quotechar, quotechar * 2) + quotechar
+        formatted.append(value)
+
+    # missing values (None) are written as empty fields, as csv does
+    formatted.append('')
+    return np.array(formatted, dtype=object)[codes]
+
+
+def write_delimited(file_path, columns, delimiter='\t', header=None, lineterminator='\r\n'):
+    # byte-for-byte equivalent to csv.writer(f, delimiter=delimiter).writerows(zip(*columns))
+    formatted = [format_column(column, delimiter) for column in columns]
+    n_rows = len(formatted[0]) if formatted else 0
+
+    with open(file_path, 'w', newline='', buffering=BUFFER_SIZE) as f:
+        if header is not None:
+            csv.writer(f, delimiter=delimiter, lineterminator=lineterminator).writerow(header)
+
+        for start in range(0, n_rows, CHUNK_ROWS):
+            rows = zip(*(column[start:start+CHUNK_ROWS].tolist() for column in formatted))
+            f.write(lineterminator.join(map(delimiter.join, rows)))
+            f.write(lineterminator)
+
+
+def write_leda(file_path, names, edges, directed=False):
+    # LEDA graph as written by igraph's write_leda with string vertex labels
+    # and no edge weights, without comment lines (ncount4 cannot parse them)
+    names = np.asarray(names, dtype=object)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+
+    if any('\n' in name for name in names):
+        raise ValueError('vertex names cannot contain newline characters in LEDA format')
+
+    with open(file_path, 'w', newline='', buffering=BUFFER_SIZE) as f:
+        f.write('LEDA.GRAPH\nstring\nvoid\n')
+        f.write('-1\n' if directed else '-2\n')
+
+        f.write(f'{len(names)}\n')
+        for start in range(0, len(names), CHUNK_ROWS):
+            f.write(''.join(f'|{{{name}}}|\n' for name in names[start:start+CHUNK_ROWS].tolist()))
+
+        sources = format_column(edges[:, 0] + 1)
+        targets = format_column(edges[:, 1] + 1)
+
+        f.write(f'{len(edges)}\n')
+        for start in range(0, len(edges), CHUNK_ROWS):
+            chunk = zip(sources[start:start+CHUNK_ROWS].tolist(), targets[start:start+CHUNK_ROWS].tolist())
+            f.write(''.join(f'{s} {t} 0 |{{}}|\n' for s, t in chunk))
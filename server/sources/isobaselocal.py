@@ -2,13 +2,14 @@ from asyncio import coroutine
 from os import path
 import json
 
-from server.sources.network import read_net_tsv_edgelist
-from server.sources.bitscore import read_tricol_bitscores
+from server.sources.localcache import LocalDatasetCache
+from server.sources.network import EdgeListNetwork
 
 
 class IsobaseLocal(object):
-    def __init__(self, base_path):
+    def __init__(self, base_path, cache_path=None):
         self.base_path = base_path
+        self.cache = LocalDatasetCache(base_path, cache_path)
 
     def _check_valid_species(self, species_name):
         if not species_name.isalnum():
@@ -30,10 +31,10 @@ class IsobaseLocal(object):
         if not path.isfile(species_path):
             raise LookupError(f'network file for {species_name} was not found')
 
-        return read_net_tsv_edgelist(species_name, species_path)
+        return EdgeListNetwork(species_name, self.cache.load_edgelist(species_path))
 
     @coroutine
-    def get_bitscore_matrix(self, net1, net2):
+    def get_bitscore_matrix(self, net1, net2, sparse=False):
         if net1.name == net2.name:
             matrix_path = path.join(self.base_path, f'{net1.name}-blast.tab')
 
@@ -45,7 +46,8 @@ class IsobaseLocal(object):
             if not path.isfile(matrix_path):
                 raise LookupError(f'score matrix file for {net1.name}-{net2.name} was not found')
 
-        return read_tricol_bitscores(matrix_path, net1=net1, net2=net2)
+        matrix = self.cache.load_bitscores(matrix_path).to_bitscore_matrix(net1, net2)
+        return matrix.to_sparse() if sparse else matrix
 
     @coroutine
     def get_ontology_mapping(self, networks=None):
@@ -0,0 +1,130 @@
+import csv
+import logging
+import os
+from os import path
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from server.sources.bitscore import InternedBitscores
+from server.sources.network import InternedEdgeList
+
+
+logger = logging.getLogger(__name__)
+
+# bump whenever the on-disk layout changes so that old caches are rebuilt
+CACHE_FORMAT_VERSION = 1
+
+
+def _read_tsv_columns(file_path, n_columns, header=False):
+    try:
+        df = pd.read_csv(file_path, sep='\t', header=None, skiprows=1 if header else 0,
+                         usecols=range(n_columns), dtype=str, keep_default_na=False,
+                         quoting=csv.QUOTE_MINIMAL)
+    except pd.errors.EmptyDataError:
+        return [np.array([], dtype=object) for _ in range(n_columns)]
+
+    return [df[column].to_numpy() for column in df.columns]
+
+
+def _name_table(names):
+    return np.array(names, dtype=str) if len(names) > 0 else np.array([], dtype='U1')
+
+
+def _build_edgelist(file_path, out_dir, header=False):
+    a, b = _read_tsv_columns(file_path, 2, header=header)
+
+    interleaved = np.empty(2 * len(a), dtype=object)
+    interleaved[0::2] = a
+    interleaved[1::2] = b
+
+    codes, names = pd.factorize(interleaved)
+
+    np.save(path.join(out_dir, 'names.npy'), _name_table(names))
+    np.save(path.join(out_dir, 'edges.npy'), codes.astype(np.int32).reshape(-1, 2))
+
+
+def _build_bitscores(file_path, out_dir, header=False):
+    p1, p2, scores = _read_tsv_columns(file_path, 3, header=header)
+
+    p1_codes, names1 = pd.factorize(p1)
+    p2_codes, names2 = pd.factorize(p2)
+
+    np.save(path.join(out_dir, 'names1.npy'), _name_table(names1))
+    np.save(path.join(out_dir, 'names2.npy'), _name_table(names2))
+    np.save(path.join(out_dir, 'p1.npy'), p1_codes.astype(np.int32))
+    np.save(path.join(out_dir, 'p2.npy'), p2_codes.astype(np.int32))
+    np.save(path.join(out_dir, 'bitscore.npy'), scores.astype(np.float32))
+
+
+class LocalDatasetCache(object):
+    # Binary copies of the TSV files of a local dataset. Every source file gets
+    # a directory under cache_path named after its mtime and size, so a
+    # modified source is detected and rebuilt automatically. Entries are built
+    # in a temporary directory and renamed into place, so concurrent workers
+    # never see a partial entry; arrays are memory-mapped on load so that all
+    # workers share the same pages.
+
+    def __init__(self, base_path, cache_path=None):
+        self.base_path = base_path
+        self.cache_path = cache_path or path.join(base_path, '.cache')
+
+    def _entry_dir(self, file_path):
+        return path.join(self.cache_path, path.relpath(file_path, self.base_path))
+
+    def _stamp(self, file_path):
+        st = os.stat(file_path)
+        return f'v{CACHE_FORMAT_VERSION}-{st.st_mtime_ns}-{st.st_size}'
+
+    def _remove_stale(self, entry_dir, stamp):
+        for name in os.listdir(entry_dir):
+            if name != stamp and not name.startswith('.tmp-'):
+                shutil.rmtree(path.join(entry_dir, name), ignore_errors=True)
+
+    def _get_or_build(self, file_path, build, **kwargs):
+        entry_dir = self._entry_dir(file_path)
+        stamp = self._stamp(file_path)
+        stamp_dir = path.join(entry_dir, stamp)
+
+        if path.isdir(stamp_dir):
+            return stamp_dir
+
+        logger.info(f'building binary cache for {file_path}')
+        os.makedirs(entry_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=entry_dir, prefix='.tmp-')
+
+        try:
+            build(file_path, tmp_dir, **kwargs)
+            os.rename(tmp_dir, stamp_dir)
+        except OSError:
+            # another worker finished the same entry first
+            if not path.isdir(stamp_dir):
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self._remove_stale(entry_dir, stamp)
+
+        return stamp_dir
+
+    def _load(self, entry_dir, file_name):
+        return np.load(path.join(entry_dir, file_name), mmap_mode='r')
+
+    def load_edgelist(self, file_path, header=False):
+        entry_dir = self._get_or_build(file_path, _build_edgelist, header=header)
+
+        return InternedEdgeList(
+            self._load(entry_dir, 'names.npy'),
+            self._load(entry_dir, 'edges.npy'))
+
+    def load_bitscores(self, file_path, header=False):
+        entry_dir = self._get_or_build(file_path, _build_bitscores, header=header)
+
+        return InternedBitscores(
+            self._load(entry_dir, 'names1.npy'),
+            self._load(entry_dir, 'names2.npy'),
+            self._load(entry_dir, 'p1.npy'),
+            self._load(entry_dir, 'p2.npy'),
+            self._load(entry_dir, 'bitscore.npy'))
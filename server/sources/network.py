@@ -1,13 +1,20 @@
+import hashlib
+
 import igraph
+import numpy as np
 import pandas as pd
 
-from server.util import open_csv_write, iter_csv_fd, iter_csv
+from server.sources.export import write_delimited, write_leda
+from server.util import open_csv_write, iter_csv_fd, iter_csv, update_hash
 
 
 class Network(object):
     def __init__(self, name):
         self.name = name
         self._igraph = None
+        self._vertex_indices = {}
+        self._vertices_fingerprint = None
+        self._content_fingerprint = None
 
     def get_details(self):
         return {
@@ -30,12 +37,67 @@ class Network(object):
     def to_igraph(self):
         raise NotImplementedError()
 
+    def vertex_index(self, by='name'):
+        # hash index from vertex attribute values to vertex indices (first
+        # vertex wins on repeated values), built once per attribute
+        index = self._vertex_indices.get(by)
+
+        if index is None:
+            values = pd.Index(self.igraph.vs[by])
+            first = ~values.duplicated()
+            index = pd.Series(np.flatnonzero(first), index=values[first])
+            self._vertex_indices[by] = index
+
+        return index
+
+    @property
+    def vertices_fingerprint(self):
+        # hash of the vertex attributes, in vertex order
+        if self._vertices_fingerprint is None:
+            vs = self.igraph.vs
+            h = hashlib.sha1()
+            update_hash(h, vs.graph.vcount())
+
+            for attribute in sorted(vs.attributes()):
+                update_hash(h, attribute, '\0'.join(map(str, vs[attribute])))
+
+            self._vertices_fingerprint = h.hexdigest()
+
+        return self._vertices_fingerprint
+
+    @property
+    def content_fingerprint(self):
+        # hash of everything the exporters write: vertex attributes and edges
+        if self._content_fingerprint is None:
+            h = hashlib.sha1()
+            update_hash(h, self.vertices_fingerprint, self.igraph.is_directed(), self.edge_array())
+            self._content_fingerprint = h.hexdigest()
+
+        return self._content_fingerprint
+
+    def edge_array(self):
+        # (source, target) vertex indices as an int64 array of shape (n_edges, 2)
+        return np.array(self.igraph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+
+    def lookup_vertices(self, values, by='name'):
+        # vertex indices for the given attribute values, -1 where not found
+        index = self.vertex_index(by)
+        positions = index.index.get_indexer(values)
+
+        return np.where(positions >= 0, index.to_numpy()[positions], -1)
+
     def iter_edges(self):
         vs = self.igraph.vs
 
         for e in self.igraph.es:
             yield vs[e.source]['name'], vs[e.target]['name']
 
+    def edge_name_columns(self):
+        # (sources, targets) arrays of vertex names, in iter_edges order
+        names = np.array(self.igraph.vs['name'], dtype=object)
+        edges = np.array(self.igraph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+        return names[edges[:, 0]], names[edges[:, 1]]
+
     def iter_vertices(self, by='name'):
         if by == 'object':
             yield from self.igraph.vs
@@ -47,6 +109,12 @@ class Network(object):
 
     def write_tsv_edgelist(self, file_path, edgelist=None, delimiter='\t', header=None):
         if edgelist is None:
+            columns = self.edge_name_columns()
+
+            if columns is not None:
+                write_delimited(file_path, columns, delimiter=delimiter, header=header)
+                return
+
             edgelist = self.iter_edges()
 
         with open_csv_write(file_path, delimiter=delimiter) as writer:
@@ -56,14 +124,52 @@ class Network(object):
                 writer.writerow(edge)
 
     def write_gml(self, file_path):
-        for v in self.igraph.vs:
-            v['id'] = v.index
-
-        self.igraph.write_gml(file_path)
+        # ids passed explicitly rather than set as a vertex attribute: networks
+        # are shared between jobs through the fetch cache, and concurrent runs
+        # write them from executor threads
+        self.igraph.write_gml(file_path, ids=list(range(self.igraph.vcount())))
 
     def write_leda(self, file_path, names, weights=None):
         self.igraph.write_leda(file_path, names=names, weights=weights)
 
+    def write_ncount4_leda(self, file_path, names='name', sort_edges=False):
+        # same as write_leda without weights, minus the comment lines ncount4
+        # does not accept. With sort_edges, edges are written sorted (as
+        # (min, max) pairs unless directed), so that the file only depends on
+        # the vertices and the topology, not on the order edges were fetched in
+        g = self.igraph
+        edges = self.edge_array()
+
+        if sort_edges:
+            if not g.is_directed():
+                edges = np.sort(edges, axis=1)
+            edges = edges[np.lexsort((edges[:, 1], edges[:, 0]))]
+
+        write_leda(file_path, g.vs[names], edges, directed=g.is_directed())
+
+
+class InternedEdgeList(object):
+    # edge list stored as int32 codes into a table of vertex names, in order of
+    # first appearance (the same vertex order igraph.Graph.TupleList produces)
+
+    def __init__(self, names, edges):
+        self.names = names
+        self.edges = edges
+
+    def __len__(self):
+        return len(self.edges)
+
+    def __iter__(self):
+        names = self.names.tolist()
+
+        for a, b in self.edges.tolist():
+            yield names[a], names[b]
+
+    def to_igraph(self):
+        graph = igraph.Graph(n=len(self.names), edges=self.edges.tolist(), directed=False)
+        graph.vs['name'] = self.names.tolist()
+        return graph
+
 
 class EdgeListNetwork(Network):
     def __init__(self, name, edgelist):
@@ -71,13 +177,26 @@ class EdgeListNetwork(Network):
         self.edgelist = edgelist
 
     def to_igraph(self):
-        g = igraph.Graph.TupleList(self.iter_edges())
+        if isinstance(self.edgelist, InternedEdgeList):
+            g = self.edgelist.to_igraph()
+        else:
+            g = igraph.Graph.TupleList(self.iter_edges())
         g.simplify()
         return g
 
     def iter_edges(self):
         return self.edgelist if not self.already_has_igraph() else super().iter_edges()
 
+    def edge_name_columns(self):
+        if self.already_has_igraph():
+            return super().edge_name_columns()
+        elif isinstance(self.edgelist, InternedEdgeList):
+            edges = self.edgelist.edges
+            return self.edgelist.names[edges[:, 0]], self.edgelist.names[edges[:, 1]]
+        else:
+            # arbitrary rows, written as they are
+            return None
+
 
 def read_tsv_edgelist(*, path=None, string=None, header=False):
     if string is not None:
@@ -110,10 +229,17 @@ def read_net_gml(name, net_path):
 
 
 class VirusHostNetwork(object):
+    HOST = 0
+    VIRUS = 1
+    OTHER = -1
+
     def __init__(self, host_name, virus_name):
         self._host_name = host_name
         self._virus_name = virus_name
 
+        self._vertex_sides = None
+        self._edge_sides = None
+
         self._host_net = None
         self._virus_net = None
         self._vh_bipartite_net = None
@@ -129,17 +255,59 @@ class VirusHostNetwork(object):
         src, tgt = e.tuple
         return self.is_virus_vertex(vs[src]) != self.is_virus_vertex(vs[tgt])
 
+    def compute_vertex_sides(self):
+        # per-vertex HOST/VIRUS/OTHER labels; subclasses should vectorize this
+        return np.array([
+                VirusHostNetwork.HOST if self.is_host_vertex(v) else
+                VirusHostNetwork.VIRUS if self.is_virus_vertex(v) else
+                VirusHostNetwork.OTHER
+                for v in self.igraph.vs],
+            dtype=np.int8)
+
+    @property
+    def vertex_sides(self):
+        if self._vertex_sides is None:
+            self._vertex_sides = self.compute_vertex_sides()
+        return self._vertex_sides
+
+    @property
+    def edge_sides(self):
+        # (n_edges, 2) array with the side of both endpoints of every edge
+        if self._edge_sides is None:
+            edges = np.array(self.igraph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+            self._edge_sides = self.vertex_sides[edges]
+        return self._edge_sides
+
+    def _side_vertices(self, side):
+        return np.flatnonzero(self.vertex_sides == side).tolist()
+
+    def _side_edges_mask(self, side):
+        return (self.edge_sides[:, 0] == side) & (self.edge_sides[:, 1] == side)
+
+    def _vh_interaction_edges_mask(self):
+        is_virus = self.edge_sides == VirusHostNetwork.VIRUS
+        return is_virus[:, 0] != is_virus[:, 1]
+
+    def count_partitions(self):
+        return {
+            'n_vert_host': int(np.count_nonzero(self.vertex_sides == VirusHostNetwork.HOST)),
+            'n_edges_host': int(np.count_nonzero(self._side_edges_mask(VirusHostNetwork.HOST))),
+            'n_vert_virus': int(np.count_nonzero(self.vertex_sides == VirusHostNetwork.VIRUS)),
+            'n_edges_virus': int(np.count_nonzero(self._side_edges_mask(VirusHostNetwork.VIRUS))),
+        }
 
     @property
     def host_net(self):
         if self._host_net is None:
-            self._host_net = IgraphNetwork(self._host_name, self.igraph.vs.select(self.is_host_vertex).subgraph())
+            self._host_net = IgraphNetwork(self._host_name,
+                self.igraph.induced_subgraph(self._side_vertices(VirusHostNetwork.HOST)))
         return self._host_net
 
     @property
     def virus_net(self):
         if self._virus_net is None:
-            self._virus_net = IgraphNetwork(self._virus_name, self.igraph.vs.select(self.is_virus_vertex).subgraph())
+            self._virus_net = IgraphNetwork(self._virus_name,
+                self.igraph.induced_subgraph(self._side_vertices(VirusHostNetwork.VIRUS)))
         return self._virus_net
 
     @property
@@ -147,6 +315,6 @@ class VirusHostNetwork(object):
         if self._vh_bipartite_net is None:
             self._vh_bipartite_net = IgraphNetwork(
                     f'{self._host_name}-{self._virus_name}',
-                    self.igraph.es.select(self.is_vh_interaction_edge).subgraph())
+                    self.igraph.subgraph_edges(np.flatnonzero(self._vh_interaction_edges_mask()).tolist()))
 
         return self._vh_bipartite_net
@@ -0,0 +1,177 @@
+from asyncio import get_event_loop, Semaphore
+
+import numpy as np
+import psycopg2
+
+
+PGCOPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+PGCOPY_TRAILER = b'\xff\xff'
+
+
+class BinaryCopyReader(object):
+    # File-like sink for cursor.copy_expert that decodes a
+    # COPY ... TO STDOUT (FORMAT binary) stream of fixed-width, non-null
+    # columns into a preallocated structured array. psycopg2 writes one row at
+    # a time, so rows are buffered and decoded in batches of batch_size bytes.
+
+    def __init__(self, dtype, expected_rows=0, batch_size=1 << 20):
+        self.dtype = np.dtype(dtype)
+        self.batch_size = batch_size
+
+        wire_fields = [('n_fields', '>i2')]
+        for i, name in enumerate(self.dtype.names):
+            field_dtype = self.dtype.fields[name][0]
+            wire_fields += [(f'len{i}', '>i4'), (f'val{i}', field_dtype.newbyteorder('>'))]
+
+        self.wire_dtype = np.dtype(wire_fields)
+
+        self.array = np.empty(max(expected_rows, 1024), dtype=self.dtype)
+        self.n_rows = 0
+
+        self._pending = bytearray()
+        self._header_read = False
+
+    def _read_header(self):
+        if len(self._pending) < len(PGCOPY_SIGNATURE) + 8:
+            return False
+
+        if not self._pending.startswith(PGCOPY_SIGNATURE):
+            raise ValueError('invalid COPY binary signature')
+
+        offset = len(PGCOPY_SIGNATURE) + 4
+        ext_len = int.from_bytes(self._pending[offset:offset+4], 'big')
+        header_len = offset + 4 + ext_len
+
+        if len(self._pending) < header_len:
+            return False
+
+        del self._pending[:header_len]
+        self._header_read = True
+        return True
+
+    def _append(self, records):
+        n_fields = len(self.dtype.names)
+
+        if np.any(records['n_fields'] != n_fields):
+            raise ValueError(f'unexpected number of columns in COPY stream (expected {n_fields})')
+
+        for i, name in enumerate(self.dtype.names):
+            if np.any(records[f'len{i}'] != self.dtype.fields[name][0].itemsize):
+                raise ValueError(f'NULL or mistyped values in column {name}')
+
+        end = self.n_rows + len(records)
+
+        if end > len(self.array):
+            self.array.resize(max(end, len(self.array) * 3 // 2), refcheck=False)
+
+        for i, name in enumerate(self.dtype.names):
+            self.array[name][self.n_rows:end] = records[f'val{i}']
+
+        self.n_rows = end
+
+    def write(self, data):
+        self._pending += data
+
+        if len(self._pending) >= self.batch_size:
+            self._decode()
+
+        return len(data)
+
+    def _decode(self):
+        if not self._header_read and not self._read_header():
+            return
+
+        n_records = len(self._pending) // self.wire_dtype.itemsize
+
+        if n_records > 0:
+            n_bytes = n_records * self.wire_dtype.itemsize
+            self._append(np.frombuffer(bytes(self._pending[:n_bytes]), dtype=self.wire_dtype))
+            del self._pending[:n_bytes]
+
+    def finish(self):
+        self._decode()
+
+        if not self._header_read or bytes(self._pending) != PGCOPY_TRAILER:
+            raise ValueError('truncated COPY binary stream')
+
+        self.array.resize(self.n_rows, refcheck=False)
+        return self.array
+
+
+def estimate_rows(cursor, query):
+    # planner estimate of the number of rows of a query, without running it
+    cursor.execute(f'explain (format json) {query}')
+    plan = cursor.fetchone()[0]
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def copy_query_to_numpy(conn, sql, params, dtype):
+    # The reader is preallocated for the planner estimate of the number of
+    # rows, so that peak memory is about the size of the final array when the
+    # estimate is good (np.empty only commits the pages actually written if it
+    # is too high). When it is too low the array grows by half its size
+    # each time, peaking at up to ~2.5 times the final size.
+    with conn:
+        with conn.cursor() as cursor:
+            query = cursor.mogrify(sql, params).decode('utf-8').strip().rstrip(';')
+
+            reader = BinaryCopyReader(dtype, expected_rows=estimate_rows(cursor, query))
+            cursor.copy_expert(f'copy ({query}) to stdout (format binary)', reader)
+
+    return reader.finish()
+
+
+def copy_to_numpy(dsn, sql, params, dtype):
+    # blocking: meant to be run in an executor, psycopg2 does not support COPY
+    # on asynchronous connections. Opens a connection for this query only,
+    # long-running processes should use a CopyConnectionPool instead
+    conn = psycopg2.connect(**dsn)
+
+    try:
+        return copy_query_to_numpy(conn, sql, params, dtype)
+    finally:
+        conn.close()
+
+
+class CopyConnectionPool(object):
+    # Blocking psycopg2 connections for COPY queries, shared by a whole
+    # process (aiopg connections are asynchronous and cannot COPY). At most
+    # maxsize queries run at once, each on a connection of its own in an
+    # executor thread; the rest wait on the event loop. Connections are
+    # opened on demand and kept for reuse, and dropped if a query fails.
+
+    def __init__(self, dsn, maxsize=2):
+        self.dsn = dsn
+        self.maxsize = maxsize
+
+        self._semaphore = Semaphore(maxsize)
+        self._idle = []
+        self.closed = False
+
+    def _copy(self, conn, sql, params, dtype):
+        if conn is None:
+            conn = psycopg2.connect(**self.dsn)
+
+        try:
+            return conn, copy_query_to_numpy(conn, sql, params, dtype)
+        except BaseException:
+            conn.close()
+            raise
+
+    async def copy_to_numpy(self, sql, params, dtype):
+        async with self._semaphore:
+            conn = self._idle.pop() if self._idle else None
+            conn, values = await get_event_loop().run_in_executor(None, self._copy, conn, sql, params, dtype)
+
+            if self.closed:
+                conn.close()
+            else:
+                self._idle.append(conn)
+
+            return values
+
+    def close(self):
+        self.closed = True
+
+        while self._idle:
+            self._idle.pop().close()
@@ -1,9 +1,16 @@
+from asyncio import gather, get_event_loop
+from collections import Counter
+import copy
+import hashlib
+
 import aiopg
 import igraph
 import numpy as np
 
+from server.metrics import child_span
 from server.sources.network import Network
-from server.sources.bitscore import TricolBitscoreMatrix
+from server.sources.bitscore import TricolBitscoreMatrix, SparseBitscoreMatrix
+from server.sources.pgcopy import copy_to_numpy, CopyConnectionPool
 
 
 class StringDBNetwork(Network):
@@ -12,6 +19,7 @@ class StringDBNetwork(Network):
         self.species_id = species_id
         self.external_ids = external_ids
         self.edges = edges
+        self._fingerprint = None
 
         if species_id >= 0:
             self._species = [species_id]
@@ -22,17 +30,21 @@ class StringDBNetwork(Network):
         # NOTE: igraph has some bugs regarding non-str names
         # (https://github.com/igraph/python-igraph/issues/73#issuecomment-203077381)
 
-        ext_ids = self.external_ids
+        edges = np.asarray(self.edges, dtype=np.int32).reshape(-1, 2)
+
+        # relabel string_id's to dense vertex indices (sorted by string_id)
+        string_ids, dense_edges = np.unique(edges.ravel(), return_inverse=True)
+        dense_edges = dense_edges.reshape(-1, 2)
 
-        graph = igraph.Graph.TupleList(self.edges)
+        ext_ids = self.external_ids
+        string_ids = string_ids.tolist()
+        names = [ext_ids[string_id] for string_id in string_ids]
 
-        for v in graph.vs:
-            string_id = int(v['name']) # better have unique names
-            ext_id = ext_ids[string_id]
+        graph = igraph.Graph(n=len(string_ids), edges=dense_edges.tolist(), directed=False)
 
-            v['name'] = ext_id
-            v['string_id'] = string_id
-            v['external_id'] = ext_id
+        graph.vs['name'] = names
+        graph.vs['string_id'] = string_ids
+        graph.vs['external_id'] = names
 
         if not graph.is_simple():
             graph.simplify()
@@ -49,6 +61,44 @@ class StringDBNetwork(Network):
     def string_ids(self):
         return {int(v) for v in self.iter_vertices(by='string_id')}
 
+    @property
+    def fingerprint(self):
+        # identifies the protein set, which determines the vertex indices
+        if self._fingerprint is None:
+            string_ids = np.unique(np.asarray(self.edges, dtype=np.int32))
+            self._fingerprint = hashlib.sha1(string_ids.tobytes()).hexdigest()
+
+        return self._fingerprint
+
+
+class StringDBScoredLinks(object):
+    # every link of a species with its evidence scores, one int16 column per
+    # evidence channel (StringDB.EVIDENCE_SCORE_TYPES id - 1, MISSING_SCORE if
+    # the link does not have it)
+
+    MISSING_SCORE = np.iinfo(np.int16).min
+
+    def __init__(self, species_id, edges, scores):
+        self.species_id = species_id
+        self.edges = edges
+        self.scores = scores
+
+    @property
+    def nbytes(self):
+        return self.edges.nbytes + self.scores.nbytes
+
+    def select(self, score_thresholds):
+        # links passing any of the (score_type, threshold) pairs
+        mask = np.zeros(len(self.edges), dtype=bool)
+
+        for score_type, threshold in score_thresholds:
+            score_id = StringDB.EVIDENCE_SCORE_TYPES[score_type]
+            # as in SQL, a link passes only if it has the channel at all
+            threshold = max(threshold, StringDBScoredLinks.MISSING_SCORE + 1)
+            mask |= self.scores[:, score_id - 1] >= threshold
+
+        return self.edges[mask]
+
 
 class StringDBBitscoreMatrix(TricolBitscoreMatrix):
     def __init__(self, tricol, net1, net2, by='string_id'):
@@ -65,6 +115,37 @@ class StringDBBitscoreMatrix(TricolBitscoreMatrix):
         else:
             yield from super().iter_tricol(by=by)
 
+    def to_columns(self, by='name'):
+        if by == 'name':
+            p1, p2, scores = super().to_columns(by='string_id')
+            return _map_values(p1, self.net1.external_ids), _map_values(p2, self.net2.external_ids), scores
+        else:
+            return super().to_columns(by=by)
+
+
+def _map_values(keys, mapping):
+    # mapping[k] for every k in keys, with one dict lookup per distinct key
+    uniques, inverse = np.unique(keys, return_inverse=True)
+    return np.array([mapping[k] for k in uniques.tolist()], dtype=object)[inverse.reshape(-1)]
+
+
+def _network_nbytes(net):
+    # edge array plus a rough estimate for names, ids and the igraph graph
+    return 2 * np.asarray(net.edges).nbytes + 200 * len(net.external_ids)
+
+def _bitscores_nbytes(matrix):
+    if isinstance(matrix, SparseBitscoreMatrix):
+        m = matrix.matrix
+        return m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+    else:
+        return matrix.tricol.nbytes
+
+def _external_ids_nbytes(external_ids):
+    return 120 * len(external_ids)
+
+def _ontology_nbytes(mapping):
+    return sum(100 + 80 * len(gos) for gos in mapping.values())
+
 
 class StringDB(object):
     EVIDENCE_SCORE_TYPES = {
@@ -87,19 +168,54 @@ class StringDB(object):
     }
 
     @staticmethod
-    async def init_pool(host='stringdb', port=5432, user='stringdb', password='stringdb', dbname='stringdb'):
-        return await aiopg.create_pool(host=host, port=port, user=user, password=password, dbname=dbname, timeout=None)
+    async def init_pool(host='stringdb', port=5432, user='stringdb', password='stringdb', dbname='stringdb', minsize=1, maxsize=10):
+        return await aiopg.create_pool(host=host, port=port, user=user, password=password, dbname=dbname, timeout=None,
+                                       minsize=minsize, maxsize=maxsize)
 
-    def __init__(self, host='stringdb', port=5432, user='stringdb', password='stringdb', dbname='stringdb', pool=None):
+    @staticmethod
+    def init_copy_pool(host='stringdb', port=5432, user='stringdb', password='stringdb', dbname='stringdb', maxsize=2):
+        dsn = {'host': host, 'port': port, 'user': user, 'password': password, 'dbname': dbname}
+        return CopyConnectionPool(dsn, maxsize=maxsize)
+
+    EDGES_DTYPE = [('node_id_a', 'i4'), ('node_id_b', 'i4')]
+    EVIDENCE_SCORES_DTYPE = [('node_id_a', 'i4'), ('node_id_b', 'i4'), ('score_id', 'i2'), ('score', 'i2')]
+    BITSCORES_DTYPE = [('protein_id_a', 'i4'), ('protein_id_b', 'i4'), ('bitscore', 'f4')]
+
+    def __init__(self, host='stringdb', port=5432, user='stringdb', password='stringdb', dbname='stringdb', pool=None, fetch_cache=None, bulk_fetch=False,
+                 copy_pool=None, bitscore_partitions=1, bitscore_partition_min_proteins=0, derive_score_thresholds=False, span=None):
         self.pool = pool
         self.conn = None
 
-        if pool is None:
-            self.host = host
-            self.port = port
-            self.user = user
-            self.password = password
-            self.dbname = dbname
+        # optional lrucache.AsyncLRUCache shared by the whole process
+        self.fetch_cache = fetch_cache
+        self.cache_stats = Counter()
+
+        # fetch large results with binary COPY instead of fetchall(), over
+        # copy_pool (a pgcopy.CopyConnectionPool) if given
+        self.bulk_fetch = bulk_fetch
+        self.copy_pool = copy_pool
+
+        # split bitscore queries into this many net1 protein id ranges, run
+        # concurrently, when net1 has at least the given number of proteins
+        self.bitscore_partitions = bitscore_partitions
+        self.bitscore_partition_min_proteins = bitscore_partition_min_proteins
+
+        # apply score_thresholds client-side to the (cached) scored links of
+        # the species instead of scanning them in SQL for every threshold set
+        self.derive_score_thresholds = derive_score_thresholds
+
+        # optional metrics.Span under which the bulk queries are timed
+        self.span = span
+
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.dbname = dbname
+
+    @property
+    def dsn(self):
+        return {'host': self.host, 'port': self.port, 'user': self.user, 'password': self.password, 'dbname': self.dbname}
 
     async def connect(self):
         if self.pool is None:
@@ -117,6 +233,51 @@ class StringDB(object):
     async def __aexit__(self, exc_type, exc, tb):
         await self.disconnect()
 
+    async def _cached(self, key, fetch, sizeof):
+        if self.fetch_cache is None:
+            return await fetch()
+        else:
+            return await self.fetch_cache.get_or_fetch(key, fetch, sizeof, stats=self.cache_stats)
+
+    @staticmethod
+    def normalize_score_thresholds(score_thresholds):
+        return tuple(sorted(
+            (score_type, threshold)
+            for score_type, threshold in (score_thresholds or {}).items()
+            if score_type in StringDB.EVIDENCE_SCORE_TYPES and isinstance(threshold, int)))
+
+    @staticmethod
+    def score_thresholds_key(score_thresholds):
+        # the valid pairs, and whether any thresholds were given at all: even
+        # if all are invalid, the network is filtered (and empty), unlike the
+        # network without thresholds
+        return bool(score_thresholds), StringDB.normalize_score_thresholds(score_thresholds)
+
+    async def _fetch_array(self, sql, params, dtype, name='query'):
+        with child_span(self.span, name) as span:
+            if self.bulk_fetch and self.copy_pool is not None:
+                values = await self.copy_pool.copy_to_numpy(sql, params, dtype)
+            elif self.bulk_fetch:
+                values = await get_event_loop().run_in_executor(None, copy_to_numpy, self.dsn, sql, params, dtype)
+            else:
+                async with self._get_cursor() as cursor:
+                    await cursor.execute(sql, params)
+                    rows = await cursor.fetchall()
+
+                values = np.array(rows, dtype=dtype)
+
+            span.set(rows=len(values), bytes=values.nbytes)
+
+        return values
+
+    def _query_concurrency(self):
+        # how many _fetch_array queries can run at once: the size of the pool
+        # they run over, 1 on a single connection
+        if self.bulk_fetch:
+            return self.copy_pool.maxsize if self.copy_pool is not None else 1
+        else:
+            return self.pool.maxsize if self.pool is not None else 1
+
     def _get_cursor(self):
         if self.pool is not None:
             return self.pool.cursor()
@@ -206,56 +367,122 @@ class StringDB(object):
         return dict(rows)
 
     async def get_network(self, species_id, score_thresholds={}, external_ids=None):
+        if external_ids is not None:
+            return await self._fetch_network(species_id, score_thresholds, external_ids)
+
+        key = ('network', species_id, StringDB.score_thresholds_key(score_thresholds))
+
+        if score_thresholds and self.derive_score_thresholds:
+            fetch = lambda: self._derive_network(species_id, score_thresholds)
+        else:
+            fetch = lambda: self._fetch_network(species_id, score_thresholds)
+
+        return await self._cached(key, fetch, _network_nbytes)
+
+    async def get_scored_links(self, species_id):
+        return await self._cached(('scored_links', species_id),
+            lambda: self._fetch_scored_links(species_id),
+            lambda links: links.nbytes)
+
+    async def _fetch_scored_links(self, species_id):
+        sql = """
+            select
+              node_id_a :: integer,
+              node_id_b :: integer,
+              evidence_scores[i][1] :: smallint,
+              evidence_scores[i][2] :: smallint
+            from
+              network.node_node_links,
+              generate_subscripts(evidence_scores, 1) i
+            where
+              node_type_b = %(species_id)s;
+            """
+
+        rows = await self._fetch_array(sql, {'species_id': species_id}, StringDB.EVIDENCE_SCORES_DTYPE, 'scored_links_query')
+
+        # channels that no score type refers to cannot be selected
+        n_channels = len(StringDB.EVIDENCE_SCORE_TYPES)
+        rows = rows[(rows['score_id'] >= 1) & (rows['score_id'] <= n_channels)]
+
+        # pivot (link, score_id, score) rows into a link x channel matrix
+        link_keys = (rows['node_id_a'].astype(np.int64) << 32) | rows['node_id_b'].astype(np.int64)
+        link_keys, link_ix = np.unique(link_keys, return_inverse=True)
+
+        edges = np.empty((len(link_keys), 2), dtype=np.int32)
+        edges[:, 0] = link_keys >> 32
+        edges[:, 1] = link_keys & 0xffffffff
+
+        scores = np.full((len(link_keys), n_channels), StringDBScoredLinks.MISSING_SCORE, dtype=np.int16)
+        np.maximum.at(scores, (link_ix, rows['score_id'] - 1), rows['score'])
+
+        return StringDBScoredLinks(species_id, edges, scores)
+
+    async def _get_cached_external_ids(self, species_id):
+        return await self._cached(('external_ids', species_id),
+            lambda: self.get_protein_external_ids(species_id),
+            _external_ids_nbytes)
+
+    async def _derive_network(self, species_id, score_thresholds):
+        for score_type, threshold in score_thresholds.items():
+            if score_type not in StringDB.EVIDENCE_SCORE_TYPES or not isinstance(threshold, int):
+                print(f'StringDB.get_network: invalid score_type/threshold pair: {score_type} >= {threshold}')
+
+        external_ids = await self._get_cached_external_ids(species_id)
+        links = await self.get_scored_links(species_id)
+
+        edges = links.select(StringDB.normalize_score_thresholds(score_thresholds))
+
+        return StringDBNetwork(species_id, external_ids, edges)
+
+    async def _fetch_network(self, species_id, score_thresholds={}, external_ids=None):
         if external_ids is None:
             external_ids = await self.get_protein_external_ids(species_id)
 
-        async with self._get_cursor() as cursor:
-            if score_thresholds:
-                sql = """
-                    with indexed as
-                      (select
-                         node_id_a,
-                         node_id_b,
-                         evidence_scores,
-                         generate_subscripts(evidence_scores, 1) i
-                       from
-                         network.node_node_links
-                       where
-                         node_type_b = %(species_id)s)
-                    select distinct
-                      node_id_a,
-                      node_id_b
-                    from
-                      indexed
-                    where
-                      false
-                    """
-
-                for score_type, threshold in score_thresholds.items():
-                    if score_type in StringDB.EVIDENCE_SCORE_TYPES and isinstance(threshold, int):
-                        score_id = StringDB.EVIDENCE_SCORE_TYPES[score_type]
-                        sql += f'\nor (evidence_scores[i][1] = {score_id} and evidence_scores[i][2] >= {threshold})'
-                    else:
-                        print(f'StringDB.get_network: invalid score_type/threshold pair: {score_type} >= {threshold}')
-
-                sql += ';'
+        if score_thresholds:
+            sql = """
+                with indexed as
+                  (select
+                     node_id_a,
+                     node_id_b,
+                     evidence_scores,
+                     generate_subscripts(evidence_scores, 1) i
+                   from
+                     network.node_node_links
+                   where
+                     node_type_b = %(species_id)s)
+                select distinct
+                  node_id_a :: integer,
+                  node_id_b :: integer
+                from
+                  indexed
+                where
+                  false
+                """
 
-            else:
-                sql = """
-                    select
-                      node_id_a, node_id_b
-                    from
-                      network.node_node_links
-                    where
-                      node_type_b = %(species_id)s;
-                    """;
+            for score_type, threshold in score_thresholds.items():
+                if score_type in StringDB.EVIDENCE_SCORE_TYPES and isinstance(threshold, int):
+                    score_id = StringDB.EVIDENCE_SCORE_TYPES[score_type]
+                    sql += f'\nor (evidence_scores[i][1] = {score_id} and evidence_scores[i][2] >= {threshold})'
+                else:
+                    print(f'StringDB.get_network: invalid score_type/threshold pair: {score_type} >= {threshold}')
 
+            sql += ';'
 
-            await cursor.execute(sql, {'species_id': species_id})
+        else:
+            sql = """
+                select
+                  node_id_a :: integer, node_id_b :: integer
+                from
+                  network.node_node_links
+                where
+                  node_type_b = %(species_id)s;
+                """;
 
-            edges = await cursor.fetchall()
 
-        return StringDBNetwork(species_id, external_ids, np.array(edges))
+        edges = await self._fetch_array(sql, {'species_id': species_id}, StringDB.EDGES_DTYPE, 'edges_query')
+
+        # packed int32 pairs, viewed as a (n_edges, 2) array
+        return StringDBNetwork(species_id, external_ids, edges.view(np.int32).reshape(-1, 2))
 
     async def build_custom_network(self, edges):
         string_ids = {p for e in edges for p in e}
@@ -266,36 +493,64 @@ class StringDB(object):
         else:
             raise ValueError(f"Invalid string_id's: {set(missing)}")
 
-    async def get_bitscore_matrix(self, net1, net2):
-        async with self._get_cursor() as cursor:
-            await cursor.execute("""
-                with
-                    net1_prot_ids as (select unnest(%(net1_protein_ids)s :: integer[]) net1_prot_id),
-                    net2_prot_ids as (select unnest(%(net2_protein_ids)s :: integer[]) net2_prot_id)
-                select
-                  protein_id_a, protein_id_b, bitscore
-                from
-                  homology.blast_data blast
-                where
-                  species_id_a in %(net1_species_ids)s
-                  and
-                  species_id_b in %(net2_species_ids)s
-                  and
-                  protein_id_a in (select net1_prot_id from net1_prot_ids)
-                  and
-                  protein_id_b in (select net2_prot_id from net2_prot_ids);
-                """,
-                {'net1_species_ids': tuple(await net1.get_species(self)),
-                 'net2_species_ids': tuple(await net2.get_species(self)),
-                 'net1_protein_ids': list(net1.string_ids),
-                 'net2_protein_ids': list(net2.string_ids)})
+    async def get_bitscore_matrix(self, net1, net2, sparse=False):
+        key = ('bitscores', net1.fingerprint, net2.fingerprint, sparse)
+
+        matrix = await self._cached(key,
+            lambda: self._fetch_bitscore_matrix(net1, net2, sparse),
+            _bitscores_nbytes)
+
+        if matrix.net1 is not net1 or matrix.net2 is not net2:
+            # same protein sets, hence same vertex indices
+            matrix = copy.copy(matrix)
+            matrix.net1 = net1
+            matrix.net2 = net2
+
+        return matrix
+
+    async def _fetch_bitscore_matrix(self, net1, net2, sparse=False):
+        sql = """
+            with
+                net1_prot_ids as (select unnest(%(net1_protein_ids)s :: integer[]) net1_prot_id),
+                net2_prot_ids as (select unnest(%(net2_protein_ids)s :: integer[]) net2_prot_id)
+            select
+              protein_id_a :: integer, protein_id_b :: integer, bitscore :: real
+            from
+              homology.blast_data blast
+            where
+              species_id_a in %(net1_species_ids)s
+              and
+              species_id_b in %(net2_species_ids)s
+              and
+              protein_id_a in (select net1_prot_id from net1_prot_ids)
+              and
+              protein_id_b in (select net2_prot_id from net2_prot_ids);
+            """
+
+        params = {'net1_species_ids': tuple(await net1.get_species(self)),
+                  'net2_species_ids': tuple(await net2.get_species(self)),
+                  'net2_protein_ids': list(net2.string_ids)}
+
+        net1_protein_ids = np.sort(np.fromiter(net1.string_ids, dtype=np.int64))
+
+        # no more partitions than queries the pool can run at once, which also
+        # bounds the connections they use
+        n_partitions = min(self.bitscore_partitions, self._query_concurrency())
+
+        if n_partitions > 1 and len(net1_protein_ids) >= self.bitscore_partition_min_proteins:
+            partitions = [p for p in np.array_split(net1_protein_ids, n_partitions) if len(p) > 0]
+        else:
+            partitions = [net1_protein_ids]
 
-            values = await cursor.fetchall()
+        partial_values = await gather(*[
+            self._fetch_array(sql, dict(params, net1_protein_ids=partition.tolist()), StringDB.BITSCORES_DTYPE, 'bitscores_query')
+            for partition in partitions])
 
-        array_dtype = [('protein_id_a', 'i4'), ('protein_id_b', 'i4'), ('bitscore', 'f4')]
+        values = np.concatenate(partial_values) if len(partial_values) > 1 else partial_values[0]
 
-        if values:
-            return StringDBBitscoreMatrix(np.array(values, dtype=array_dtype), net1=net1, net2=net2, by='string_id')
+        if len(values) > 0:
+            matrix = StringDBBitscoreMatrix(values, net1=net1, net2=net2, by='string_id')
+            return matrix.to_sparse() if sparse else matrix
         else:
             raise LookupError('bitscore matrix not available for the selected network pair')
 
@@ -303,6 +558,13 @@ class StringDB(object):
         species_ids = [species for net in networks
                                for species in await net.get_species(self)]
 
+        key = ('ontology', tuple(sorted(set(species_ids))))
+
+        return await self._cached(key,
+            lambda: self._fetch_ontology_mapping(species_ids),
+            _ontology_nbytes)
+
+    async def _fetch_ontology_mapping(self, species_ids):
         async with self._get_cursor() as cursor:
             await cursor.execute("""
                 select
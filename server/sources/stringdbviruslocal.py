@@ -4,8 +4,8 @@ from os import path
 import pandas as pd
 import json
 
-from server.sources.network import read_tsv_edgelist, EdgeListNetwork, VirusHostNetwork
-from server.sources.bitscore import read_tricol_bitscores, TricolBitscoreMatrix
+from server.sources.localcache import LocalDatasetCache
+from server.sources.network import EdgeListNetwork, VirusHostNetwork
 
 
 class StringDBVirusNetwork(EdgeListNetwork, VirusHostNetwork):
@@ -22,27 +22,33 @@ class StringDBVirusNetwork(EdgeListNetwork, VirusHostNetwork):
     def is_virus_vertex(self, v):
         return v['name'].startswith(f'{self.virus_id}.')
 
+    def compute_vertex_sides(self):
+        names = np.array(self.igraph.vs['name'], dtype=str)
+
+        sides = np.full(len(names), VirusHostNetwork.OTHER, dtype=np.int8)
+        sides[np.char.startswith(names, f'{self.host_id}.')] = VirusHostNetwork.HOST
+        sides[np.char.startswith(names, f'{self.virus_id}.')] = VirusHostNetwork.VIRUS
+
+        return sides
+
     def get_details(self):
         details = {}
         details.update(super().get_details())
 
-        details.update({
-            'n_vert_host': self.host_net.igraph.vcount(),
-            'n_edges_host': self.host_net.igraph.ecount(),
-            'n_vert_virus': self.virus_net.igraph.vcount(),
-            'n_edges_virus': self.virus_net.igraph.ecount(),
+        counts = self.count_partitions()
+        details.update(counts)
 
-            'n_interactions': self.igraph.ecount()
-                - self.host_net.igraph.ecount()
-                - self.virus_net.igraph.ecount(),
-        })
+        details['n_interactions'] = self.igraph.ecount() \
+            - counts['n_edges_host'] \
+            - counts['n_edges_virus']
 
         return details
 
 
 class StringDBVirusLocal(object):
-    def __init__(self, base_path):
+    def __init__(self, base_path, cache_path=None):
         self.base_path = base_path
+        self.cache = LocalDatasetCache(base_path, cache_path)
 
     @coroutine
     def __aenter__(self):
@@ -60,11 +66,11 @@ class StringDBVirusLocal(object):
         if not path.isfile(species_path):
             raise LookupError(f'network file for {network_name} was not found')
 
-        edgelist = read_tsv_edgelist(path=species_path, header=True)
-        return StringDBVirusNetwork(host_id, virus_id, edgelist) if edgelist is not None else None
+        edgelist = self.cache.load_edgelist(species_path, header=True)
+        return StringDBVirusNetwork(host_id, virus_id, edgelist)
 
     @coroutine
-    def get_bitscore_matrix(self, net1, net2):
+    def get_bitscore_matrix(self, net1, net2, sparse=False):
         # bitscores are supposed to be symmetric
         net2 = net2 or net1
 
@@ -72,9 +78,11 @@ class StringDBVirusLocal(object):
         matrix_path2 = path.join(self.base_path, 'blast', f'{net1.host_id}-{net2.host_id}', f'{net2.virus_id}-{net1.virus_id}.bitscore.tsv')
 
         try:
-            return read_tricol_bitscores(matrix_path1, net1=net1, net2=net2, header=True)
+            matrix = self.cache.load_bitscores(matrix_path1, header=True).to_bitscore_matrix(net1, net2)
         except:
-            return read_tricol_bitscores(matrix_path2, net1=net2, net2=net1, header=True).swapping_net1_net2()
+            matrix = self.cache.load_bitscores(matrix_path2, header=True).to_bitscore_matrix(net2, net1).swapping_net1_net2()
+
+        return matrix.to_sparse() if sparse else matrix
 
     @coroutine
     def get_ontology_mapping(self, networks=None):
@@ -1,6 +1,8 @@
 from contextlib import contextmanager
 import csv
+import hashlib
 from io import StringIO
+import numpy as np
 import pandas as pd
 
 
@@ -15,6 +17,26 @@ def all_equal(xs):
     except StopIteration:
         return True
 
+def update_hash(h, *values):
+    # feeds arrays (by their raw bytes) and other values (by their str) to a
+    # hashlib object, each one prefixed by its type so that they cannot collide
+    for value in values:
+        if isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            h.update(f'ndarray:{value.dtype.str}:{value.shape}:'.encode('utf-8'))
+            h.update(value.reshape(-1).view(np.uint8))
+        else:
+            h.update(f'{type(value).__name__}:{len(str(value))}:{value}'.encode('utf-8'))
+
+def file_sha1(file_path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
 def iter_csv_fd(f, header=False, **kwargs):
     if 'skipinitialspace' not in kwargs and kwargs.get('delimiter',' ') == ' ':
         kwargs['skipinitialspace'] = True
@@ -58,3 +80,13 @@ def write_tsv_to_string(table, header=[]):
         writer.writerows(table)
 
         return f.getvalue()
+
+def iter_tsv_chunks(table, header=[], chunk_rows=1 << 16):
+    # write_tsv_to_string in pieces of chunk_rows rows, so that large tables are
+    # never held as a single string
+    if not isinstance(table, (pd.DataFrame, pd.Series)) or len(table) <= chunk_rows:
+        yield write_tsv_to_string(table, header)
+        return
+
+    for start in range(0, len(table), chunk_rows):
+        yield table.iloc[start:start + chunk_rows].to_csv(sep='\t', index=False, header=(header or True) if start == 0 else False)
@@ -0,0 +1,100 @@
+from asyncio import new_event_loop, set_event_loop
+import logging
+
+from aiohttp import ClientSession, TCPConnector
+from celery.signals import worker_process_init, worker_process_shutdown
+
+from config import config
+import mongo
+from sources.stringdb import StringDB
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerResources(object):
+    # Resources owned by a worker process for its whole lifetime: one event
+    # loop, bounded StringDB connection pools (aiopg, and blocking psycopg2
+    # connections for COPY), the Mongo client and a keep-alive HTTP session.
+    # They are created when the process starts (or lazily on first use, e.g.
+    # with the solo pool) and released on shutdown.
+
+    def __init__(self, stringdb_pool_maxsize=2):
+        self.stringdb_pool_maxsize = stringdb_pool_maxsize
+
+        self.loop = None
+        self.stringdb_pool = None
+        self.stringdb_copy_pool = None
+        self.http_session = None
+
+    @property
+    def started(self):
+        return self.loop is not None
+
+    async def _open(self):
+        try:
+            await mongo.ensure_indexes()
+        except Exception:
+            logger.exception('could not create the mongo indexes')
+
+        self.stringdb_pool = await StringDB.init_pool(minsize=0, maxsize=self.stringdb_pool_maxsize)
+        self.stringdb_copy_pool = StringDB.init_copy_pool(maxsize=self.stringdb_pool_maxsize)
+
+        self.http_session = ClientSession(
+            connector=TCPConnector(limit=4, keepalive_timeout=60),
+            headers={'content-type': 'application/json'})
+
+    async def _close(self):
+        if self.http_session is not None:
+            await self.http_session.close()
+            self.http_session = None
+
+        if self.stringdb_pool is not None:
+            self.stringdb_pool.close()
+            await self.stringdb_pool.wait_closed()
+            self.stringdb_pool = None
+
+        if self.stringdb_copy_pool is not None:
+            self.stringdb_copy_pool.close()
+            self.stringdb_copy_pool = None
+
+    def start(self):
+        if self.started:
+            return
+
+        logger.info('setting up worker process resources')
+
+        self.loop = new_event_loop()
+        set_event_loop(self.loop)
+
+        mongo.connect(io_loop=self.loop, compression=config['RESULT_FILES_COMPRESSION'],
+                      concurrency=config['RESULT_FILES_UPLOAD_CONCURRENCY'])
+        self.loop.run_until_complete(self._open())
+
+    def stop(self):
+        if not self.started:
+            return
+
+        logger.info('releasing worker process resources')
+
+        try:
+            self.loop.run_until_complete(self._close())
+            mongo.disconnect()
+        finally:
+            self.loop.close()
+            self.loop = None
+
+    def run(self, coro):
+        self.start()
+        return self.loop.run_until_complete(coro)
+
+
+resources = WorkerResources(stringdb_pool_maxsize=config['STRINGDB_POOL_MAXSIZE'])
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    resources.start()
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    resources.stop()
@@ -0,0 +1,35 @@
+import signal
+import subprocess
+
+import pytest
+
+from server.aligners.accounting import accounted_cmd, read_usage
+
+
+def run_accounted(tmp_path, cmd):
+    usage_path = str(tmp_path / 'usage.json')
+    returncode = subprocess.call(accounted_cmd(cmd, usage_path))
+    return returncode, read_usage(usage_path)
+
+
+def test_fast_exit(tmp_path):
+    # the child may exit before the wrapper waits for it
+    for _ in range(20):
+        returncode, usage = run_accounted(tmp_path, ['true'])
+        assert returncode == 0
+        assert usage['exit_code'] == 0
+
+
+def test_exit_code(tmp_path):
+    returncode, usage = run_accounted(tmp_path, ['sh', '-c', 'exit 3'])
+    assert returncode == 3
+    assert usage['exit_code'] == 3
+
+
+@pytest.mark.parametrize('sig', [signal.SIGKILL, signal.SIGTERM])
+def test_signalled_child(tmp_path, sig):
+    # the wrapper dies from the same signal, as the OOM killer leaves it
+    returncode, usage = run_accounted(tmp_path, ['sh', '-c', f'kill -{int(sig)} $$'])
+    assert returncode == -sig
+    assert usage['exit_code'] == -sig
+    assert usage['wall_time'] >= 0
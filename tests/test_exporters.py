@@ -0,0 +1,157 @@
+import csv
+import os
+
+import igraph
+import numpy as np
+import pytest
+
+from server.sources import export
+from server.sources.bitscore import TricolBitscoreMatrix, structured_tricol
+from server.sources.network import EdgeListNetwork, IgraphNetwork, InternedEdgeList
+
+
+# the exporters as they were before the bulk writers, which must be matched
+# byte for byte
+
+def legacy_write_rows(file_path, rows, delimiter='\t', header=None):
+    with open(file_path, 'w+') as f:
+        writer = csv.writer(f, delimiter=delimiter)
+        if header is not None:
+            writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+
+def legacy_iter_edges(net):
+    vs = net.igraph.vs
+    for e in net.igraph.es:
+        yield vs[e.source]['name'], vs[e.target]['name']
+
+def legacy_write_gml(net, file_path):
+    for v in net.igraph.vs:
+        v['id'] = v.index
+    net.igraph.write_gml(file_path)
+    del net.igraph.vs['id']
+
+def legacy_write_ncount4_leda(net, file_path):
+    net.igraph.write_leda(file_path + '.tmp', names='name', weights=None)
+    with open(file_path + '.tmp', 'r') as in_f:
+        with open(file_path, 'w') as out_f:
+            out_f.writelines(line for line in in_f if not line.startswith('#'))
+    os.remove(file_path + '.tmp')
+
+
+N_VERTICES = 300
+N_EDGES = 1500
+N_BITSCORES = 3000
+
+
+def random_names(rng, n, prefix):
+    names = np.array([f'{prefix}.{i:08d}' for i in range(n)], dtype=object)
+    # a few names csv has to quote
+    names[rng.choice(n, size=5, replace=False)] = [f'{prefix} "quoted" {i}\tx' for i in range(5)]
+    return names
+
+def random_network(rng, name):
+    edges = rng.randint(0, N_VERTICES, size=(N_EDGES, 2))
+    graph = igraph.Graph(n=N_VERTICES, edges=edges.tolist())
+    graph.simplify()
+    graph.vs['name'] = random_names(rng, N_VERTICES, name).tolist()
+    graph.vs['string_id'] = rng.permutation(N_VERTICES).tolist()
+    return IgraphNetwork(name, graph, simplify=False)
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.RandomState(0)
+
+    net1 = random_network(rng, 'net1')
+    net2 = random_network(rng, 'net2')
+
+    names = np.array(net1.igraph.vs['name'], dtype=object)
+    interned = EdgeListNetwork('interned', InternedEdgeList(names,
+        rng.randint(0, N_VERTICES, size=(N_EDGES, 2)).astype(np.int32)))
+
+    bitscores = TricolBitscoreMatrix(
+        structured_tricol((rng.randint(0, N_VERTICES, N_BITSCORES).astype(np.int32),
+                           rng.randint(0, N_VERTICES, N_BITSCORES).astype(np.int32),
+                           (rng.random_sample(N_BITSCORES) * 1000).astype(np.float32))),
+        net1=net1, net2=net2, by='string_id')
+
+    return {'net1': net1, 'net2': net2, 'interned': interned, 'bitscores': bitscores, 'sparse': bitscores.to_sparse()}
+
+
+def read_bytes(file_path, skip_prefix=None):
+    with open(file_path, 'rb') as f:
+        return b''.join(line for line in f if skip_prefix is None or not line.startswith(skip_prefix))
+
+
+def assert_same_output(tmp_path, legacy, bulk, skip_prefix=None):
+    legacy_path = str(tmp_path / 'legacy')
+    bulk_path = str(tmp_path / 'bulk')
+
+    legacy(legacy_path)
+    bulk(bulk_path)
+
+    assert read_bytes(bulk_path, skip_prefix) == read_bytes(legacy_path, skip_prefix)
+
+
+HEADER = ['INTERACTOR_A', 'INTERACTOR_B']
+
+@pytest.mark.parametrize('header', [None, HEADER])
+def test_tsv_edgelist(tmp_path, data, header):
+    net = data['net1']
+    assert_same_output(tmp_path,
+        lambda p: legacy_write_rows(p, legacy_iter_edges(net), header=header),
+        lambda p: net.write_tsv_edgelist(p, header=header))
+
+
+def test_interned_tsv_edgelist(tmp_path, data):
+    net = data['interned']
+    assert_same_output(tmp_path,
+        lambda p: legacy_write_rows(p, iter(net.edgelist)),
+        lambda p: net.write_tsv_edgelist(p))
+
+
+@pytest.mark.parametrize('by', ['string_id', 'name', 'index'])
+def test_tricol(tmp_path, data, by):
+    matrix = data['bitscores']
+    assert_same_output(tmp_path,
+        lambda p: legacy_write_rows(p, matrix.iter_tricol(by=by)),
+        lambda p: matrix.write_tricol(p, by=by))
+
+
+@pytest.mark.parametrize('by,delimiter', [('name', '\t'), ('index', ' ')])
+def test_sparse_tricol(tmp_path, data, by, delimiter):
+    matrix = data['sparse']
+    assert_same_output(tmp_path,
+        lambda p: legacy_write_rows(p, matrix.iter_tricol(by=by), delimiter=delimiter),
+        lambda p: matrix.write_tricol(p, by=by, delimiter=delimiter))
+
+
+def test_gml(tmp_path, data):
+    net = data['net1']
+    # igraph writes the creation date in the Creator line
+    assert_same_output(tmp_path,
+        lambda p: legacy_write_gml(net, p),
+        lambda p: net.write_gml(p),
+        skip_prefix=b'Creator')
+    assert 'id' not in net.igraph.vs.attributes()
+
+
+def test_ncount4_leda(tmp_path, data):
+    net = data['net2']
+    assert_same_output(tmp_path,
+        lambda p: legacy_write_ncount4_leda(net, p),
+        lambda p: net.write_ncount4_leda(p))
+
+
+@pytest.mark.parametrize('directed', [False, True])
+def test_leda(tmp_path, data, directed):
+    graph = data['net1'].igraph.copy()
+    if directed:
+        graph.to_directed(mutual=False)
+    # the legacy output without its comment lines, as in ncount4 LEDA
+    assert_same_output(tmp_path,
+        lambda p: graph.write_leda(p, names='name', weights=None),
+        lambda p: export.write_leda(p, graph.vs['name'], graph.get_edgelist(), directed=directed),
+        skip_prefix=b'#')
@@ -0,0 +1,43 @@
+import igraph
+import numpy as np
+
+from server.metrics import Span, stage_sizes
+from server.sources.bitscore import TricolBitscoreMatrix, structured_tricol
+from server.sources.network import IgraphNetwork
+
+
+def random_network(rng, name, n_vertices=50, n_edges=120):
+    graph = igraph.Graph(n=n_vertices, edges=rng.randint(0, n_vertices, size=(n_edges, 2)).tolist())
+    graph.simplify()
+    graph.vs['name'] = [f'{name}.{i}' for i in range(n_vertices)]
+    graph.vs['string_id'] = list(range(n_vertices))
+    return IgraphNetwork(name, graph, simplify=False)
+
+
+def test_network_stage_sizes():
+    net = random_network(np.random.RandomState(0), 'net1')
+
+    span = Span('fetch')
+    with span.child('net1') as stage_span:
+        stage_span.set(**stage_sizes(net))
+
+    stage = span.to_dict()['children'][0]
+    assert stage['sizes'] == {'vertices': net.igraph.vcount(), 'edges': net.igraph.ecount()}
+    assert stage['sizes']['edges'] > 0
+
+
+def test_bitscore_stage_sizes():
+    rng = np.random.RandomState(0)
+    net1 = random_network(rng, 'net1')
+    net2 = random_network(rng, 'net2')
+
+    matrix = TricolBitscoreMatrix(
+        structured_tricol((rng.randint(0, 50, 100).astype(np.int32),
+                           rng.randint(0, 50, 100).astype(np.int32),
+                           rng.random_sample(100).astype(np.float32))),
+        net1=net1, net2=net2, by='string_id')
+
+    assert stage_sizes(matrix) == {'rows': 100}
+    assert stage_sizes(matrix.to_sparse()) == {'rows': matrix.to_sparse().nnz}
+    assert stage_sizes({'a': 1, 'b': 2}) == {'entries': 2}
+    assert stage_sizes(None) == {}